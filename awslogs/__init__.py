@@ -1,2 +1,12 @@
-from ._version import __version__  # noqa
-from .core import AWSLogs  # noqa
+def __getattr__(name):
+    # Imported on first use, so that completion pays neither for boto3 nor
+    # for importlib.metadata
+    if name == "AWSLogs":
+        from .core import AWSLogs
+
+        return AWSLogs
+    if name == "__version__":
+        from ._version import __version__
+
+        return __version__
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
@@ -0,0 +1,337 @@
+"""Local columnar archives of a log group, with a trigram index.
+
+An archive is a directory holding one file per column, every one of them
+sorted by timestamp:
+
+``timestamps``, ``ingestion``
+    ``int64`` arrays.
+``stream_ids``
+    ``int32`` index of the stream of every event in ``meta.json``.
+``messages``, ``offsets``
+    The UTF-8 encoded messages back to back, and the ``int64`` offset at
+    which every one of them starts (plus the end of the last one).
+``trigrams``, ``postings_offsets``, ``postings``
+    A sorted ``int32`` array of every 3-byte sequence found in messages,
+    the ``int64`` offset of its posting list and the ``int32`` posting
+    lists themselves: sorted indexes of the events containing it.
+
+Files are memory-mapped on read, so opening an archive is instant and
+only the pages a search touches are read from disk.
+"""
+
+import heapq
+import itertools
+import json
+import mmap
+import os
+import re
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+
+try:
+    from re import _constants as sre_constants
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+from . import exceptions
+from .events import LogEvent
+
+VERSION = 1
+
+_COLUMNS = {
+    "timestamps": "q",
+    "ingestion": "q",
+    "stream_ids": "i",
+    "messages": "B",
+    "offsets": "q",
+    "trigrams": "i",
+    "postings_offsets": "q",
+    "postings": "i",
+}
+
+
+def required_literals(regex):
+    """Returns the UTF-8 encoded strings every match of ``regex`` must
+    contain, or an empty list if they can't be worked out."""
+    if regex.flags & re.IGNORECASE:
+        return []
+    literals, run = [], []
+    for op, value in sre_parse.parse(regex.pattern, regex.flags):
+        if op is sre_constants.LITERAL:
+            run.append(chr(value))
+            continue
+        if run:
+            literals.append("".join(run))
+            run = []
+    if run:
+        literals.append("".join(run))
+    return [literal.encode("utf-8") for literal in literals]
+
+
+def _trigrams(data):
+    return {data[i : i + 3] for i in range(len(data) - 2)}
+
+
+class ArchiveWriter(object):
+    """Collects events of ``group`` and writes them as an archive in
+    ``path`` on ``close()``.
+
+    Messages are spooled to a file in ``path`` as they're added and the
+    trigram index is built ``chunk_size`` events at a time, every chunk's
+    posting lists written to a run file and merged into ``postings`` at
+    the end. What's held in memory is then the three numeric columns and
+    the offset of every message in the spool, about 28 bytes per event
+    (plus a list of indexes when events were added out of order), and the
+    postings of one chunk.
+    """
+
+    def __init__(self, path, group, start=None, end=None, chunk_size=65536):
+        self.path = path
+        self.group = group
+        self.start = start
+        self.end = end
+        self.chunk_size = chunk_size
+        self.timestamps = array("q")
+        self.ingestion = array("q")
+        self.stream_ids = array("i")
+        self.spool_offsets = array("q", [0])
+        self.streams = {}
+        os.makedirs(path, exist_ok=True)
+        self.spool = tempfile.TemporaryFile(dir=path)
+
+    def add(self, event):
+        stream_id = self.streams.get(event.stream)
+        if stream_id is None:
+            stream_id = self.streams[event.stream] = len(self.streams)
+        self.timestamps.append(event.timestamp)
+        self.ingestion.append(event.ingestion_time or 0)
+        self.stream_ids.append(stream_id)
+        message = event.message.encode("utf-8")
+        self.spool.write(message)
+        self.spool_offsets.append(self.spool_offsets[-1] + len(message))
+
+    def add_many(self, events):
+        for event in events:
+            self.add(event)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.path, name), "wb") as f:
+            if isinstance(data, array):
+                data.tofile(f)
+            else:
+                f.write(data)
+
+    def _spill(self, postings):
+        """Writes the posting lists of a chunk to a run file, returns
+        its sorted trigrams, their posting counts and the file."""
+        run = tempfile.TemporaryFile(dir=self.path)
+        trigrams = sorted(postings)
+        for trigram in trigrams:
+            postings[trigram].tofile(run)
+        run.seek(0)
+        counts = array("q", [len(postings[trigram]) for trigram in trigrams])
+        return [int.from_bytes(t, "big") for t in trigrams], counts, run
+
+    def _merge(self, runs):
+        """Writes the run files of every chunk as one set of posting
+        lists. Chunks hold consecutive events, so a trigram's posting
+        list is its lists of every chunk one after the other."""
+        cursors = [0] * len(runs)
+        merged = heapq.merge(
+            *[
+                zip(trigrams, itertools.repeat(r))
+                for r, (trigrams, _, _) in enumerate(runs)
+            ]
+        )
+        trigrams = array("i")
+        postings_offsets = array("q", [0])
+        with open(os.path.join(self.path, "postings"), "wb") as f:
+            for trigram, found in itertools.groupby(merged, key=lambda t: t[0]):
+                total = 0
+                for _, r in found:
+                    _, counts, run = runs[r]
+                    count = counts[cursors[r]]
+                    cursors[r] += 1
+                    f.write(run.read(count * 4))
+                    total += count
+                trigrams.append(trigram)
+                postings_offsets.append(postings_offsets[-1] + total)
+        for _, _, run in runs:
+            run.close()
+        self._write("trigrams", trigrams)
+        self._write("postings_offsets", postings_offsets)
+
+    def close(self):
+        timestamps = self.timestamps
+        order = range(len(timestamps))
+        if any(a > b for a, b in zip(timestamps, timestamps[1:])):
+            order = sorted(order, key=timestamps.__getitem__)
+
+        self._write("timestamps", array("q", [timestamps[i] for i in order]))
+        self._write("ingestion", array("q", [self.ingestion[i] for i in order]))
+        self._write("stream_ids", array("i", [self.stream_ids[i] for i in order]))
+
+        spool, spool_offsets = self.spool, self.spool_offsets
+        offsets = array("q", [0])
+        postings = {}
+        runs = []
+        with open(os.path.join(self.path, "messages"), "wb") as f:
+            for n, i in enumerate(order):
+                spool.seek(spool_offsets[i])
+                message = spool.read(spool_offsets[i + 1] - spool_offsets[i])
+                f.write(message)
+                offsets.append(offsets[-1] + len(message))
+                for trigram in _trigrams(message):
+                    posting = postings.get(trigram)
+                    if posting is None:
+                        posting = postings[trigram] = array("i")
+                    posting.append(n)
+                if (n + 1) % self.chunk_size == 0:
+                    runs.append(self._spill(postings))
+                    postings = {}
+        if postings:
+            runs.append(self._spill(postings))
+        spool.close()
+        self._write("offsets", offsets)
+        self._merge(runs)
+
+        streams = sorted(self.streams, key=self.streams.__getitem__)
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(
+                {
+                    "version": VERSION,
+                    "byteorder": sys.byteorder,
+                    "group": self.group,
+                    "start": self.start,
+                    "end": self.end,
+                    "count": len(timestamps),
+                    "streams": streams,
+                },
+                f,
+            )
+        return len(timestamps)
+
+
+class Archive(object):
+    """Read access to the archive in ``path``."""
+
+    def __init__(self, path):
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            raise exceptions.NotAnArchiveError(path)
+        if meta.get("version") != VERSION or meta.get("byteorder") != sys.byteorder:
+            raise exceptions.NotAnArchiveError(path)
+
+        self.path = path
+        self.group = meta["group"]
+        self.start = meta["start"]
+        self.end = meta["end"]
+        self.streams = meta["streams"]
+        self._maps = []
+        self._views = []
+        for name, format in _COLUMNS.items():
+            setattr(self, name, self._map(name, format))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _map(self, name, format):
+        with open(os.path.join(self.path, name), "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return memoryview(b"").cast(format)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(data)
+        view = memoryview(data).cast(format)
+        self._views.append(view)
+        return view
+
+    def close(self):
+        for name in _COLUMNS:
+            setattr(self, name, None)
+        for view in self._views:
+            view.release()
+        for data in self._maps:
+            data.close()
+        self._views, self._maps = [], []
+
+    def message(self, index):
+        return str(
+            self.messages[self.offsets[index] : self.offsets[index + 1]], "utf-8"
+        )
+
+    def event(self, index):
+        return LogEvent(
+            None,
+            self.timestamps[index],
+            self.ingestion[index],
+            self.group,
+            self.streams[self.stream_ids[index]],
+            self.message(index),
+        )
+
+    def _posting(self, trigram):
+        key = int.from_bytes(trigram, "big")
+        n = bisect_left(self.trigrams, key)
+        if n == len(self.trigrams) or self.trigrams[n] != key:
+            return None
+        return self.postings[self.postings_offsets[n] : self.postings_offsets[n + 1]]
+
+    def _candidates(self, literals, lo, hi):
+        """Returns the indexes in ``[lo, hi)`` of the events containing
+        every trigram of ``literals``."""
+        trigrams = set()
+        for literal in literals:
+            trigrams.update(_trigrams(literal))
+        if not trigrams:
+            return range(lo, hi)
+
+        postings = []
+        for trigram in trigrams:
+            posting = self._posting(trigram)
+            if posting is None:
+                return ()
+            postings.append(
+                posting[bisect_left(posting, lo) : bisect_left(posting, hi)]
+            )
+        postings.sort(key=len)
+
+        candidates = postings[0]
+        for posting in postings[1:]:
+            size = len(posting)
+            matching = []
+            for index in candidates:
+                n = bisect_left(posting, index)
+                if n < size and posting[n] == index:
+                    matching.append(index)
+            if not matching:
+                return ()
+            candidates = matching
+        return candidates
+
+    def search(self, pattern=None, start=None, end=None, streams=None):
+        """Yield, in timestamp order, the indexes of the events between
+        ``start`` and ``end`` matching the regular expression ``pattern``
+        and, if given, belonging to one of the ``streams`` ids."""
+        lo = 0 if start is None else bisect_left(self.timestamps, start)
+        hi = len(self) if end is None else bisect_right(self.timestamps, end)
+        regex = re.compile(pattern) if pattern else None
+        if regex is None:
+            candidates = range(lo, hi)
+        else:
+            candidates = self._candidates(required_literals(regex), lo, hi)
+        if streams is not None:
+            streams = set(streams)
+
+        stream_ids = self.stream_ids
+        for index in candidates:
+            if streams is not None and stream_ids[index] not in streams:
+                continue
+            if regex is not None and not regex.search(self.message(index)):
+                continue
+            yield index
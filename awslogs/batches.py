@@ -0,0 +1,157 @@
+"""Columnar batches of events for analysis.
+
+``AWSLogs.iter_batches()`` yields ``EventBatch`` objects holding events as
+columns rather than one object per event: timestamps and ingestion times
+in ``int64`` arrays, group and stream names dictionary-encoded as
+``int32`` codes into lists of names shared by every batch of an iteration,
+and messages in a list. An event then costs 32 bytes plus its message,
+against several hundred for the dict botocore returns, and the numeric
+columns convert to NumPy or Arrow without copying when those are
+installed.
+"""
+
+from array import array
+
+
+class _Dictionary(object):
+    """Gives every distinct name a code, in order of first appearance."""
+
+    def __init__(self):
+        self.codes = {}
+        self.names = []
+
+    def encode(self, names):
+        codes, known = self.codes, self.names
+        encoded = array("i")
+        append = encoded.append
+        for name in names:
+            code = codes.get(name)
+            if code is None:
+                code = codes[name] = len(known)
+                known.append(name)
+            append(code)
+        return encoded
+
+
+def _import(module, extra):
+    try:
+        return __import__(module)
+    except ImportError as exc:
+        raise ImportError(
+            "{0} isn't installed, install it or awslogs[{1}]".format(module, extra)
+        ) from exc
+
+
+class EventBatch(object):
+    """Events as columns.
+
+    ``timestamps`` and ``ingestion_times`` are ``array('q')`` of
+    milliseconds, ``group_codes`` and ``stream_codes`` ``array('i')`` of
+    indexes into ``groups`` and ``streams``, and ``messages`` a list.
+    Codes mean the same name in every batch of an iteration; ``groups``
+    and ``streams`` hold the names seen up to this batch.
+    """
+
+    __slots__ = (
+        "timestamps",
+        "ingestion_times",
+        "group_codes",
+        "groups",
+        "stream_codes",
+        "streams",
+        "messages",
+    )
+
+    def __init__(
+        self,
+        timestamps,
+        ingestion_times,
+        group_codes,
+        groups,
+        stream_codes,
+        streams,
+        messages,
+    ):
+        self.timestamps = timestamps
+        self.ingestion_times = ingestion_times
+        self.group_codes = group_codes
+        self.groups = groups
+        self.stream_codes = stream_codes
+        self.streams = streams
+        self.messages = messages
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __repr__(self):
+        return "<EventBatch of {0} events>".format(len(self))
+
+    def to_numpy(self):
+        """Returns a dict of NumPy arrays: ``timestamp``,
+        ``ingestion_time``, ``group`` and ``stream`` (the codes) share
+        memory with this batch, ``message`` is an object array."""
+        numpy = _import("numpy", "numpy")
+        return {
+            "timestamp": numpy.frombuffer(self.timestamps, dtype=numpy.int64),
+            "ingestion_time": numpy.frombuffer(self.ingestion_times, dtype=numpy.int64),
+            "group": numpy.frombuffer(self.group_codes, dtype=numpy.int32),
+            "stream": numpy.frombuffer(self.stream_codes, dtype=numpy.int32),
+            "message": numpy.array(self.messages, dtype=object),
+        }
+
+    def to_arrow(self):
+        """Returns a ``pyarrow.RecordBatch`` with millisecond
+        ``timestamp`` and ``ingestion_time`` columns and dictionary
+        ``group`` and ``stream`` columns backed by this batch's arrays,
+        and a ``message`` string column."""
+        pa = _import("pyarrow", "arrow")
+        n = len(self)
+
+        def column(data, kind):
+            return pa.Array.from_buffers(kind, n, [None, pa.py_buffer(data)])
+
+        def names(codes, dictionary):
+            return pa.DictionaryArray.from_arrays(
+                column(codes, pa.int32()), pa.array(dictionary, pa.string())
+            )
+
+        return pa.RecordBatch.from_arrays(
+            [
+                column(self.timestamps, pa.timestamp("ms", tz="UTC")),
+                column(self.ingestion_times, pa.timestamp("ms", tz="UTC")),
+                names(self.group_codes, self.groups),
+                names(self.stream_codes, self.streams),
+                pa.array(self.messages, pa.string()),
+            ],
+            names=["timestamp", "ingestion_time", "group", "stream", "message"],
+        )
+
+
+def batches(pages, batch_size=65536, flush_pages=False):
+    """Yields ``EventBatch`` of up to ``batch_size`` events out of
+    ``pages``, lists of ``LogEvent``. With ``flush_pages`` events are
+    never held back waiting for the next page, as when watching."""
+    groups, streams = _Dictionary(), _Dictionary()
+    pending = []
+
+    def batch(events):
+        return EventBatch(
+            array("q", [e.timestamp for e in events]),
+            array("q", [e.ingestion_time or 0 for e in events]),
+            groups.encode([e.group for e in events]),
+            list(groups.names),
+            streams.encode([e.stream for e in events]),
+            list(streams.names),
+            [e.message for e in events],
+        )
+
+    for page in pages:
+        pending.extend(page)
+        while len(pending) >= batch_size:
+            yield batch(pending[:batch_size])
+            del pending[:batch_size]
+        if flush_pages and pending:
+            yield batch(pending)
+            pending = []
+    if pending:
+        yield batch(pending)
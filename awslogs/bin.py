@@ -8,14 +8,27 @@ from termcolor import colored
 
 from . import exceptions
 from .core import AWSLogs
+from .overflow import POLICIES
 from ._version import __version__
 
 
-def main(argv=None):
+def positive_int(text):
+    """argparse type of counts which have to be at least 1."""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid int value: '{0}'".format(text))
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, not {0}".format(value))
+    return value
 
-    argv = (argv or sys.argv)[1:]
 
-    parser = argparse.ArgumentParser(usage=("%(prog)s [ get | groups | streams ]"))
+def build_parser():
+    """Returns the parser of the ``awslogs`` command line."""
+
+    parser = argparse.ArgumentParser(
+        usage=("%(prog)s [ get | groups | streams | histogram | archive | trace ]")
+    )
     parser.add_argument(
         "--version", action="version", version="%(prog)s " + __version__
     )
@@ -50,7 +63,10 @@ def main(argv=None):
             dest="aws_profile",
             type=str,
             default=os.environ.get("AWS_PROFILE", None),
-            help="aws profile",
+            help=(
+                "aws profile, or a comma-separated list of them to query "
+                "every profile concurrently"
+            ),
         )
 
         parser.add_argument(
@@ -58,7 +74,10 @@ def main(argv=None):
             dest="aws_region",
             type=str,
             default=os.environ.get("AWS_REGION", None),
-            help="aws region",
+            help=(
+                "aws region, or a comma-separated list of them to query "
+                "every region concurrently"
+            ),
         )
 
         parser.add_argument(
@@ -69,14 +88,16 @@ def main(argv=None):
             help="aws endpoint url to services such localstack, fakes3, others",
         )
 
-    def add_date_range_arguments(parser, default_start="5m"):
+    def add_date_range_arguments(
+        parser, default_start="5m", start_help="Start time (default %(default)s)"
+    ):
         parser.add_argument(
             "-s",
             "--start",
             type=str,
             dest="start",
             default=default_start,
-            help="Start time (default %(default)s)",
+            help=start_help,
         )
 
         parser.add_argument("-e", "--end", type=str, dest="end", help="End time")
@@ -124,6 +145,17 @@ def main(argv=None):
         help="Interval in seconds at which to query for new log lines",
     )
 
+    get_parser.add_argument(
+        "--watch-overlap",
+        dest="watch_overlap",
+        metavar="DURATION",
+        help=(
+            "With --watch, re-read this much (e.g. 30s) before the newest "
+            "event every time instead of following a pagination token, to "
+            "pick up events ingested late"
+        ),
+    )
+
     get_parser.add_argument(
         "-G",
         "--no-group",
@@ -154,7 +186,33 @@ def main(argv=None):
         help="Add ingestion time to the output",
     )
 
-    add_date_range_arguments(get_parser)
+    add_date_range_arguments(
+        get_parser,
+        default_start=None,
+        start_help=(
+            "Start time (default 5m, or unbounded with --tail, or the start "
+            "of the archive with --archive)"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--tail",
+        dest="tail",
+        type=positive_int,
+        metavar="N",
+        help=(
+            "Print only the last N events before --end (or now), probing "
+            "backwards instead of reading the whole window"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--limit",
+        dest="limit",
+        type=positive_int,
+        metavar="N",
+        help="Stop after printing N events",
+    )
 
     get_parser.add_argument(
         "--color",
@@ -178,6 +236,332 @@ def main(argv=None):
         help="JMESPath query to use in filtering the response data",
     )
 
+    get_parser.add_argument(
+        "--engine",
+        choices=["auto", "filter", "streams"],
+        default="auto",
+        help=(
+            "How to read events: 'filter' uses filter_log_events, 'streams' "
+            "reads each stream with get_log_events and merges them by "
+            "timestamp. 'auto' (default) picks 'streams' when the stream "
+            "expression matches a handful of streams"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--sample",
+        dest="sample",
+        type=positive_int,
+        metavar="PROBES",
+        help=(
+            "Print a sample of the window made of PROBES requests spread "
+            "across it instead of every event"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--sample-size",
+        dest="sample_size",
+        type=positive_int,
+        default=100,
+        metavar="N",
+        help="Events read by each --sample probe (default %(default)s)",
+    )
+
+    get_parser.add_argument(
+        "--sample-spacing",
+        dest="sample_spacing",
+        choices=["even", "random"],
+        default="even",
+        help=(
+            "Start --sample probes at the beginning of evenly sized slices "
+            "of the window or at a random point within them "
+            "(default %(default)s)"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--archive",
+        dest="archive_path",
+        metavar="DIR",
+        help=(
+            "Read events from an archive written by 'awslogs archive' "
+            "instead of CloudWatch"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--search",
+        dest="search",
+        metavar="REGEX",
+        help=(
+            "Only print --archive events matching this regular expression, "
+            "looking them up in the archive index"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--split-by-stream",
+        dest="split_by_stream",
+        metavar="DIR",
+        help=(
+            "Instead of printing events, write the events of every stream "
+            "to its own file inside DIR"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--compress",
+        action="store_true",
+        dest="compress",
+        help="Gzip the files written by --split-by-stream",
+    )
+
+    get_parser.add_argument(
+        "--sink",
+        dest="sink",
+        metavar="sqlite:PATH",
+        help=(
+            "Instead of printing events, insert them into the events table "
+            "of the SQLite database PATH, only reading events newer than "
+            "the ones it already holds"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--summarize",
+        action="store_true",
+        dest="summarize",
+        help=(
+            "Instead of printing every event, group them into message "
+            "templates and print the most frequent ones"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--top",
+        dest="top",
+        type=int,
+        default=20,
+        metavar="N",
+        help="Templates printed by --summarize (default %(default)s)",
+    )
+
+    get_parser.add_argument(
+        "--rediscover",
+        dest="rediscover",
+        type=int,
+        default=30,
+        metavar="SECONDS",
+        help=(
+            "With --watch and a stream expression, look for new streams "
+            "matching it every SECONDS, 0 disables it (default %(default)s)"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--stats",
+        action="store_true",
+        dest="stats",
+        help="Print how many requests of each kind were made on exit",
+    )
+
+    get_parser.add_argument(
+        "--metrics-port",
+        dest="metrics_port",
+        type=int,
+        metavar="PORT",
+        help=(
+            "Serve OpenMetrics counters and gauges (events read, lag, "
+            "request durations, throttles...) over HTTP on PORT"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--unordered",
+        action="store_true",
+        dest="unordered",
+        help=(
+            "With several profiles or regions, print events as they arrive "
+            "instead of in timestamp order"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--sort-memory",
+        dest="sort_memory",
+        type=int,
+        default=256,
+        metavar="MB",
+        help=(
+            "Memory used to put events of several profiles or regions in "
+            "order before spilling them to temporary files "
+            "(default %(default)s)"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--grep",
+        action="append",
+        dest="grep",
+        metavar="REGEX",
+        help=(
+            "Only print events whose message matches REGEX (repeatable, "
+            "events matching any of them are printed)"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--exclude",
+        action="append",
+        dest="exclude",
+        metavar="REGEX",
+        help="Don't print events whose message matches REGEX (repeatable)",
+    )
+
+    get_parser.add_argument(
+        "--stage",
+        action="append",
+        dest="stages",
+        metavar="NAME",
+        help=(
+            "Run every page of events through the stage NAME registered under "
+            "the 'awslogs.stages' entry point group before printing it "
+            "(repeatable, runs in the order given)"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--overflow",
+        dest="overflow",
+        choices=POLICIES,
+        help=(
+            "With --watch, read events on a background thread into a buffer "
+            "so a slow terminal or pipe never stalls polling, and when the "
+            "buffer is full: wait for room (block), drop the oldest events "
+            "(drop-oldest), keep an evenly spread sample of them (sample) or "
+            "spill them to a temporary file (spill)"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--overflow-buffer",
+        dest="overflow_buffer",
+        type=int,
+        default=50000,
+        metavar="EVENTS",
+        help="Events buffered by --overflow (default %(default)s)",
+    )
+
+    get_parser.add_argument(
+        "--read-ahead",
+        dest="read_ahead",
+        type=int,
+        default=1,
+        metavar="PAGES",
+        help=(
+            "Number of pages to fetch in the background while the current "
+            "one is printed, 0 disables it (default %(default)s)"
+        ),
+    )
+
+    get_parser.add_argument(
+        "--profile-out",
+        dest="profile_out",
+        metavar="FILE",
+        help=(
+            "Write per-stage timing spans to FILE in collapsed stack "
+            "format (readable by flamegraph.pl, inferno or speedscope)"
+        ),
+    )
+
+    # histogram
+    histogram_parser = subparsers.add_parser(
+        "histogram", description="Count events over time"
+    )
+    histogram_parser.set_defaults(func="histogram", read_ahead=1)
+    add_common_arguments(histogram_parser)
+    add_date_range_arguments(histogram_parser, default_start="1h")
+
+    histogram_parser.add_argument(
+        "log_group_name", type=str, default="ALL", nargs="?", help="log group name"
+    )
+
+    histogram_parser.add_argument(
+        "log_stream_name", type=str, default="ALL", nargs="?", help="log stream name"
+    )
+
+    histogram_parser.add_argument(
+        "-f",
+        "--filter-pattern",
+        dest="filter_pattern",
+        help="A valid CloudWatch Logs filter pattern to count only matching events",
+    )
+
+    histogram_parser.add_argument(
+        "-b",
+        "--bucket",
+        dest="bucket",
+        default="1m",
+        help="Width of each bucket, e.g. 30s, 5m or 1h (default %(default)s)",
+    )
+
+    histogram_parser.add_argument(
+        "--by-stream",
+        action="store_true",
+        dest="by_stream",
+        help="Count every stream separately",
+    )
+
+    histogram_parser.add_argument(
+        "-q",
+        "--query",
+        action="store",
+        dest="query",
+        help="Count separately every value this JMESPath query extracts",
+    )
+
+    histogram_parser.add_argument(
+        "--format",
+        choices=["bars", "csv"],
+        default="bars",
+        dest="output_format",
+        help="Output format (default %(default)s)",
+    )
+
+    histogram_parser.add_argument(
+        "--color",
+        choices=["never", "always", "auto"],
+        metavar="WHEN",
+        default="auto",
+        help="When to color output: 'auto' (default), 'never' or 'always'",
+    )
+
+    # archive
+    archive_parser = subparsers.add_parser(
+        "archive", description="Download events into a local archive"
+    )
+    archive_parser.set_defaults(func="archive", read_ahead=1)
+    add_common_arguments(archive_parser)
+    add_date_range_arguments(archive_parser, default_start="1h")
+
+    archive_parser.add_argument("log_group_name", type=str, help="log group name")
+
+    archive_parser.add_argument(
+        "output_dir", type=str, help="directory to write the archive to"
+    )
+
+    archive_parser.add_argument(
+        "log_stream_name", type=str, default="ALL", nargs="?", help="log stream name"
+    )
+
+    archive_parser.add_argument(
+        "-f",
+        "--filter-pattern",
+        dest="filter_pattern",
+        help="A valid CloudWatch Logs filter pattern to archive only matching events",
+    )
+
     # groups
     groups_parser = subparsers.add_parser("groups", description="List groups")
     groups_parser.set_defaults(func="list_groups")
@@ -197,11 +581,125 @@ def main(argv=None):
     add_common_arguments(streams_parser)
     add_date_range_arguments(streams_parser, default_start="1h")
 
-    streams_parser.add_argument("log_group_name", type=str, help="log group name")
+    streams_parser.add_argument(
+        "log_group_names",
+        type=str,
+        nargs="*",
+        metavar="log_group_name",
+        help="log group names",
+    )
+
+    streams_parser.add_argument(
+        "-p",
+        "--log-group-prefix",
+        action="store",
+        dest="log_group_prefix",
+        help="Also list streams of every group starting with the prefix",
+    )
+
+    streams_parser.add_argument(
+        "--metadata",
+        action="store_true",
+        dest="metadata",
+        help="Print first and last event times and stored bytes of streams",
+    )
+
+    streams_parser.add_argument(
+        "--latest-first",
+        action="store_true",
+        dest="latest_first",
+        help=(
+            "List the most recently active streams first, stopping once past "
+            "--start instead of going through every stream of the groups"
+        ),
+    )
+
+    streams_parser.add_argument(
+        "--workers",
+        type=int,
+        default=AWSLogs.STREAMS_MAX_WORKERS,
+        dest="workers",
+        help="Number of groups listed at once (default %(default)s)",
+    )
+
+    trace_parser = subparsers.add_parser(
+        "trace", description="Find one request id across several groups"
+    )
+    trace_parser.set_defaults(func="trace")
+    add_common_arguments(trace_parser)
+    add_date_range_arguments(trace_parser, default_start="1d")
+
+    trace_parser.add_argument(
+        "trace_id", type=str, metavar="ID", help="request id to look for"
+    )
+
+    trace_parser.add_argument(
+        "log_group_names",
+        type=str,
+        nargs="*",
+        metavar="log_group_name",
+        help="log group names",
+    )
+
+    trace_parser.add_argument(
+        "-p",
+        "--log-group-prefix",
+        action="store",
+        dest="log_group_prefix",
+        help="Also search every group starting with the prefix",
+    )
+
+    trace_parser.add_argument(
+        "--around",
+        dest="trace_around",
+        metavar="DURATION",
+        default=AWSLogs.TRACE_AROUND,
+        help=(
+            "Once the id is found, only look this far from it for the "
+            "other events (default %(default)s)"
+        ),
+    )
+
+    trace_parser.add_argument(
+        "--workers",
+        type=int,
+        default=AWSLogs.STREAMS_MAX_WORKERS,
+        dest="workers",
+        help="Number of groups searched at once (default %(default)s)",
+    )
+
+    trace_parser.add_argument(
+        "--color",
+        choices=["never", "always", "auto"],
+        metavar="WHEN",
+        default="auto",
+        help="When to color output: 'auto' (default), 'never' or 'always'",
+    )
+
+    return parser
+
+
+def main(argv=None):
+
+    argv = (argv or sys.argv)[1:]
+    parser = build_parser()
 
     # Parse input
     options, _ = parser.parse_known_args(argv)
 
+    if getattr(options, "func", None) == "list_logs":
+        # --sink carries on from its last run unless told where to start
+        options.resume = options.start is None
+        # Archives are read whole by default, they hold a window already
+        if options.start is None and not options.tail and not options.archive_path:
+            options.start = "5m"
+    elif getattr(options, "func", None) == "list_streams":
+        if not options.log_group_names and not options.log_group_prefix:
+            parser.error("streams: a log group name or --log-group-prefix is required")
+    elif getattr(options, "func", None) == "trace":
+        if not options.log_group_names and not options.log_group_prefix:
+            parser.error("trace: a log group name or --log-group-prefix is required")
+
     try:
         logs = AWSLogs(**vars(options))
         if not hasattr(options, "func"):
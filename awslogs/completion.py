@@ -0,0 +1,403 @@
+"""Shell completion of ``awslogs`` answered from a local catalog.
+
+Completing group and stream names can't wait for CloudWatch, nor even for
+boto3 to be imported, so this module imports neither ``awslogs.core`` nor
+boto3. Names are looked up in a catalog per profile and region kept in the
+cache directory: a file of sorted lines bisected through a memory map, the
+way ``look(1)`` searches dictionaries, so a lookup reads a handful of pages
+however many names there are. When the names asked for are missing or
+older than ``CATALOG_TTL``, a detached ``python -m awslogs.completion
+refresh`` process updates the catalog in the background and the next
+completion picks the new names up.
+
+Catalog lines are ``g<TAB>group``, ``s<TAB>group<TAB>stream`` and
+``t<TAB>group<TAB>seconds``, the time the streams of ``group`` (or groups,
+when it is empty) were last listed.
+
+Enable completion with one of::
+
+    eval "$(awslogs-complete bash)"    # in ~/.bashrc
+    eval "$(awslogs-complete zsh)"     # in ~/.zshrc
+    awslogs-complete fish | source     # in ~/.config/fish/config.fish
+"""
+
+import mmap
+import os
+import re
+import sys
+import time
+
+COMMANDS = ["get", "groups", "streams", "histogram", "archive", "trace"]
+
+# What each positional argument of a command is, the last one repeating
+# for ``streams`` and ``trace``
+POSITIONALS = {
+    "get": ("group", "stream"),
+    "histogram": ("group", "stream"),
+    "archive": ("group", None, "stream"),
+    "streams": ("group",),
+    "trace": (None, "group"),
+}
+REPEATING = frozenset(["streams", "trace"])
+
+# Options which don't take a value, every other one does
+FLAGS = frozenset(
+    [
+        "--by-stream",
+        "--compress",
+        "--help",
+        "--ingestion-time",
+        "--latest-first",
+        "--metadata",
+        "--no-group",
+        "--no-stream",
+        "--stats",
+        "--summarize",
+        "--timestamp",
+        "--unordered",
+        "--watch",
+        "-G",
+        "-S",
+        "-h",
+        "-w",
+    ]
+)
+
+# Seconds after which names are listed again
+CATALOG_TTL = 15 * 60
+# Seconds after which a refresh which never finished is tried again
+REFRESH_TIMEOUT = 2 * 60
+# Streams kept per group, the most recently active ones
+MAX_STREAMS = 1000
+MAX_CANDIDATES = 200
+
+SCRIPTS = {
+    "bash": """\
+_awslogs_complete() {
+    local IFS=$'\\n'
+    COMPREPLY=($(awslogs-complete complete "$COMP_CWORD" "${COMP_WORDS[@]}" \\
+        2>/dev/null))
+}
+complete -o default -F _awslogs_complete awslogs
+""",
+    "zsh": """\
+#compdef awslogs
+_awslogs() {
+    local -a candidates
+    candidates=("${(@f)$(awslogs-complete complete $((CURRENT - 1)) \\
+        "${words[@]}" 2>/dev/null)}")
+    compadd -a candidates
+}
+compdef _awslogs awslogs
+""",
+    "fish": """\
+function __awslogs_complete
+    set -l words (commandline -opc) (commandline -ct)
+    awslogs-complete complete (math (count $words) - 1) $words 2>/dev/null
+end
+complete -c awslogs -f -a '(__awslogs_complete)'
+""",
+}
+
+
+def cache_dir():
+    """Returns the directory catalogs are kept in."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.environ.get("AWSLOGS_CACHE_DIR") or os.path.join(base, "awslogs")
+
+
+def catalog_path(profile=None, region=None):
+    """Returns the path of the catalog of ``profile`` in ``region``."""
+    profile = profile or os.environ.get("AWS_PROFILE") or "default"
+    region = (
+        region
+        or os.environ.get("AWS_REGION")
+        or os.environ.get("AWS_DEFAULT_REGION")
+        or "default"
+    )
+    name = re.sub(r"[^\w.-]", "_", "{0}@{1}".format(profile, region))
+    return os.path.join(cache_dir(), name + ".catalog")
+
+
+def _lines(data, prefix):
+    """Yields the lines of ``data``, sorted bytes, starting with
+    ``prefix``."""
+    lo, hi = 0, len(data)
+    # lo and hi are line starts, lines before lo are less than prefix and
+    # lines from hi on aren't
+    while lo < hi:
+        start = data.rfind(b"\n", 0, (lo + hi) // 2) + 1
+        end = data.find(b"\n", start)
+        if end < 0:
+            end = len(data)
+        if data[start:end] < prefix:
+            lo = end + 1
+        else:
+            hi = start
+    while lo < len(data):
+        end = data.find(b"\n", lo)
+        if end < 0:
+            end = len(data)
+        line = data[lo:end]
+        if not line.startswith(prefix):
+            return
+        yield line
+        lo = end + 1
+
+
+class Catalog(object):
+    """The group and stream names known for a profile and region, stored
+    in ``path``."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def _lookup(self, prefix, limit=MAX_CANDIDATES):
+        prefix = prefix.encode("utf-8")
+        try:
+            with open(self.path, "rb") as f:
+                if not os.fstat(f.fileno()).st_size:
+                    return []
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    found = []
+                    for line in _lines(data, prefix):
+                        found.append(line[len(prefix) :].decode("utf-8"))
+                        if len(found) == limit:
+                            break
+                    return found
+        except FileNotFoundError:
+            return []
+
+    def groups(self, prefix=""):
+        return [prefix + rest for rest in self._lookup("g\t" + prefix)]
+
+    def streams(self, group, prefix=""):
+        key = "s\t{0}\t".format(group)
+        return [prefix + rest for rest in self._lookup(key + prefix)]
+
+    def listed_at(self, group=""):
+        """Returns when the streams of ``group``, or groups, were last
+        listed, or None."""
+        found = self._lookup("t\t{0}\t".format(group), limit=1)
+        return float(found[0]) if found else None
+
+    def replace(self, kind, group, names, now=None):
+        """Replaces the names of ``kind`` ('g' for groups, 's' for the
+        streams of ``group``) by ``names`` and records when."""
+        now = time.time() if now is None else now
+        if kind == "g":
+            prefix = "g\t"
+        else:
+            prefix = "s\t{0}\t".format(group)
+        listed = "t\t{0}\t".format("" if kind == "g" else group)
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = [
+                    line
+                    for line in f.read().splitlines()
+                    if not line.startswith((prefix, listed))
+                ]
+        except FileNotFoundError:
+            lines = []
+        lines.extend(
+            prefix + name for name in names if "\t" not in name and "\n" not in name
+        )
+        lines.append(listed + "{0:.0f}".format(now))
+        # Sorted as bytes, like lookups compare them
+        lines.sort(key=lambda line: line.encode("utf-8"))
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp = "{0}.{1}.tmp".format(self.path, os.getpid())
+        with open(temp, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
+            f.write("\n")
+        os.replace(temp, self.path)
+
+    def is_stale(self, group=""):
+        listed_at = self.listed_at(group)
+        return listed_at is None or time.time() - listed_at > CATALOG_TTL
+
+
+def refresh(profile=None, region=None, group=None):
+    """Lists groups, or the most recently active streams of ``group``, of
+    ``profile`` in ``region`` into their catalog."""
+    from .core import boto3_client
+
+    client = boto3_client(profile, None, None, None, region, None)
+    catalog = Catalog(catalog_path(profile, region))
+    try:
+        if group is None:
+            names = []
+            paginator = client.get_paginator("describe_log_groups")
+            for page in paginator.paginate():
+                names.extend(g["logGroupName"] for g in page.get("logGroups", []))
+            catalog.replace("g", None, names)
+        else:
+            names = []
+            paginator = client.get_paginator("describe_log_streams")
+            pages = paginator.paginate(
+                logGroupName=group, orderBy="LastEventTime", descending=True
+            )
+            for page in pages:
+                names.extend(s["logStreamName"] for s in page.get("logStreams", []))
+                if len(names) >= MAX_STREAMS:
+                    break
+            catalog.replace("s", group, names[:MAX_STREAMS])
+    finally:
+        try:
+            os.remove(catalog.path + ".lock")
+        except FileNotFoundError:
+            pass
+
+
+def _refresh_in_background(catalog, profile, region, group=None):
+    """Starts a detached process refreshing ``catalog`` unless one is
+    already running."""
+    lock = catalog.path + ".lock"
+    try:
+        if time.time() - os.stat(lock).st_mtime < REFRESH_TIMEOUT:
+            return
+    except FileNotFoundError:
+        pass
+    try:
+        os.makedirs(os.path.dirname(lock), exist_ok=True)
+        with open(lock, "w"):
+            pass
+    except OSError:
+        return
+
+    import subprocess
+
+    command = [sys.executable, "-m", "awslogs.completion", "refresh"]
+    for option, value in (("--profile", profile), ("--region", region)):
+        if value:
+            command.extend([option, value])
+    if group is not None:
+        command.extend(["--group", group])
+    subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=True,
+        start_new_session=True,
+    )
+
+
+def profiles():
+    """Returns the profiles configured for the AWS CLI."""
+    found = set()
+    paths = [
+        (
+            os.environ.get("AWS_CONFIG_FILE") or "~/.aws/config",
+            r"^\[(?:profile )?(.+)\]",
+        ),
+        (
+            os.environ.get("AWS_SHARED_CREDENTIALS_FILE") or "~/.aws/credentials",
+            r"^\[(.+)\]",
+        ),
+    ]
+    for path, section in paths:
+        try:
+            with open(os.path.expanduser(path), encoding="utf-8") as f:
+                for line in f:
+                    match = re.match(section, line.strip())
+                    if match:
+                        found.add(match.group(1).strip())
+        except OSError:
+            pass
+    return sorted(found)
+
+
+def _option_value(words, option):
+    """Returns the first item of the value given to ``option`` in
+    ``words``, or None."""
+    for n, word in enumerate(words):
+        if word == option and n + 1 < len(words):
+            return words[n + 1].split(",")[0]
+        if word.startswith(option + "="):
+            return word[len(option) + 1 :].split(",")[0]
+    return None
+
+
+def complete(words, cword, background=True):
+    """Returns the candidates for ``words[cword]``, ``words`` being the
+    command line being completed."""
+    current = words[cword] if cword < len(words) else ""
+    if cword <= 1:
+        return [command for command in COMMANDS if command.startswith(current)]
+    if words[cword - 1] == "--profile":
+        return [profile for profile in profiles() if profile.startswith(current)]
+    if current.startswith("-"):
+        return []
+
+    positionals = []
+    n = 2
+    while n < cword:
+        word = words[n]
+        if word.startswith("-") and word != "-":
+            if word not in FLAGS and "=" not in word:
+                # Skip its value
+                n += 1
+        else:
+            positionals.append(word)
+        n += 1
+
+    kinds = POSITIONALS.get(words[1], ())
+    if words[1] in REPEATING and len(positionals) >= len(kinds):
+        kind = kinds[-1]
+    elif len(positionals) < len(kinds):
+        kind = kinds[len(positionals)]
+    else:
+        kind = None
+    if kind is None:
+        return []
+
+    profile = _option_value(words, "--profile")
+    region = _option_value(words, "--aws-region")
+    catalog = Catalog(catalog_path(profile, region))
+    if kind == "group":
+        group = ""
+        candidates = catalog.groups(current)
+    else:
+        group = positionals[0]
+        candidates = catalog.streams(group, current)
+        if "ALL".startswith(current):
+            candidates.insert(0, "ALL")
+    if background and catalog.is_stale(group):
+        _refresh_in_background(catalog, profile, region, group or None)
+    return candidates
+
+
+def main(argv=None):
+    argv = (argv or sys.argv)[1:]
+    if len(argv) == 1 and argv[0] in SCRIPTS:
+        sys.stdout.write(SCRIPTS[argv[0]])
+        return 0
+    if len(argv) >= 2 and argv[0] == "complete" and argv[1].isdigit():
+        for candidate in complete(argv[2:], int(argv[1])):
+            sys.stdout.write(candidate + "\n")
+        return 0
+    if argv and argv[0] == "refresh":
+        import argparse
+
+        parser = argparse.ArgumentParser(prog="awslogs-complete refresh")
+        parser.add_argument("--profile")
+        parser.add_argument("--region")
+        parser.add_argument("--group")
+        options = parser.parse_args(argv[1:])
+        refresh(options.profile, options.region, options.group)
+        return 0
+    sys.stderr.write(
+        "usage: awslogs-complete {{{0}}}\n"
+        "Prints the script enabling completion in that shell.\n".format(
+            ",".join(sorted(SCRIPTS))
+        )
+    )
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,17 @@
 import re
 import sys
 import os
-import time
 import errno
+import copy
+import heapq
+import random
+import threading
+import time
 from datetime import datetime, timedelta
-from collections import deque
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from operator import attrgetter
 
 import boto3
 import botocore
@@ -17,11 +24,30 @@ from dateutil.parser import parse
 from dateutil.tz import tzutc
 
 from . import exceptions
-
-
-def milis2iso(milis):
-    res = datetime.utcfromtimestamp(milis / 1000.0).isoformat()
-    return (res + ".000")[:23] + "Z"
+from .archive import Archive, ArchiveWriter
+from .batches import batches
+from .discovery import StreamDiscovery
+from .events import LineFormatter, LogEvent, milis2iso  # noqa
+from .histogram import Histogram
+from .credentials import CredentialRefresher, client_credentials, retry_expired
+from .metrics import MetricsServer, count_throttles
+from .ordering import ExternalSorter
+from .overflow import OverflowBuffer, status_stream
+from .prefetch import Interleaver, Prefetcher
+from .pipeline import (
+    FormatStage,
+    GrepStage,
+    LimitStage,
+    Pipeline,
+    QueryStage,
+    WriteStage,
+    load_stage,
+)
+from .profiling import NULL_PROFILER, Profiler
+from .sinks import StreamFiles, open_sink
+from .stats import Stats
+from .templates import TemplateMiner
+from .trace import TraceWindow, trace_pattern
 
 
 def boto3_client(
@@ -52,6 +78,16 @@ def boto3_client(
     )
 
 
+class Target(namedtuple("Target", ("profile", "region"))):
+    """A profile/region pair ``AWSLogs`` runs against."""
+
+    __slots__ = ()
+
+    @property
+    def label(self):
+        return "{0}/{1}".format(self.profile or "default", self.region or "default")
+
+
 class AWSLogs(object):
 
     ACTIVE = 1
@@ -62,6 +98,21 @@ class AWSLogs(object):
     MAX_EVENTS_PER_CALL = 10000
     ALL_WILDCARD = "ALL"
 
+    FILTER_ENGINE = "filter"
+    STREAMS_ENGINE = "streams"
+    AUTO_ENGINE = "auto"
+    # Up to how many streams ``auto`` reads them one by one
+    STREAMS_ENGINE_MAX_STREAMS = 10
+    # Width in milliseconds of the first window ``tail`` probes
+    TAIL_INITIAL_WINDOW = 60 * 1000
+    SAMPLE_MAX_WORKERS = 16
+    # How many groups ``streams`` lists, or ``trace`` searches, at once
+    STREAMS_MAX_WORKERS = 8
+    # How far from the first event ``trace`` finds it looks for the others
+    TRACE_AROUND = "10m"
+    # How far --watch-overlap widens to cover slow ingestion
+    WATCH_OVERLAP_MAX_FACTOR = 4
+
     def __init__(self, **kwargs):
         self.aws_region = kwargs.get("aws_region")
         self.aws_access_key_id = kwargs.get("aws_access_key_id")
@@ -73,7 +124,7 @@ class AWSLogs(object):
         self.log_stream_name = kwargs.get("log_stream_name")
         self.filter_pattern = kwargs.get("filter_pattern")
         self.watch = kwargs.get("watch")
-        self.watch_interval = kwargs.get("watch_interval")
+        self.watch_interval = kwargs.get("watch_interval", 1)
         self.color_preference = kwargs.get("color")
         self.output_stream_enabled = kwargs.get("output_stream_enabled")
         self.output_group_enabled = kwargs.get("output_group_enabled")
@@ -81,18 +132,164 @@ class AWSLogs(object):
         self.output_ingestion_time_enabled = kwargs.get("output_ingestion_time_enabled")
         self.start = self.parse_datetime(kwargs.get("start"))
         self.end = self.parse_datetime(kwargs.get("end"))
+        self.resume = kwargs.get("resume", kwargs.get("start") is None)
         self.query = kwargs.get("query")
         if self.query is not None:
             self.query_expression = jmespath.compile(self.query)
         self.log_group_prefix = kwargs.get("log_group_prefix")
-        self.client = boto3_client(
-            self.aws_profile,
+        self.log_group_names = list(kwargs.get("log_group_names") or ())
+        if self.log_group_name is None and len(self.log_group_names) == 1:
+            self.log_group_name = self.log_group_names[0]
+        self.metadata = kwargs.get("metadata")
+        self.latest_first = kwargs.get("latest_first")
+        self.workers = kwargs.get("workers", self.STREAMS_MAX_WORKERS)
+        self.trace_id = kwargs.get("trace_id")
+        self.trace_around = self.parse_duration(
+            kwargs.get("trace_around") or self.TRACE_AROUND
+        )
+        self.profile_out = kwargs.get("profile_out")
+        if self.profile_out:
+            self.profiler = Profiler(self.profile_out)
+        else:
+            self.profiler = NULL_PROFILER
+        self.read_ahead = kwargs.get("read_ahead", 0)
+        self.engine = kwargs.get("engine") or self.AUTO_ENGINE
+        self.limit = kwargs.get("limit")
+        self.tail = kwargs.get("tail")
+        self.sample = kwargs.get("sample")
+        self.sample_size = kwargs.get("sample_size") or 100
+        self.sample_spacing = kwargs.get("sample_spacing") or "even"
+        self.sample_seed = kwargs.get("sample_seed")
+        self.sample_rate = None
+        self.bucket = self.parse_duration(kwargs.get("bucket") or "1m")
+        self.by_stream = kwargs.get("by_stream")
+        self.output_format = kwargs.get("output_format")
+        self.summarize = kwargs.get("summarize")
+        self.top = kwargs.get("top") or 20
+        self.archive_path = kwargs.get("archive_path")
+        self.search = kwargs.get("search")
+        self.output_dir = kwargs.get("output_dir")
+        self.split_by_stream = kwargs.get("split_by_stream")
+        self.compress = kwargs.get("compress")
+        self.unordered = kwargs.get("unordered")
+        self.rediscover = kwargs.get("rediscover", 30)
+        self.watch_overlap = kwargs.get("watch_overlap")
+        if self.watch_overlap:
+            self.watch_overlap = self.parse_duration(self.watch_overlap)
+            if self.engine == self.STREAMS_ENGINE:
+                # get_log_events follows tokens, it can't re-read a window
+                raise exceptions.IncompatibleOptionsError(
+                    "--engine streams", "--watch-overlap"
+                )
+        self.discovery = None
+        self.show_stats = kwargs.get("stats")
+        self.metrics_port = kwargs.get("metrics_port")
+        self.stages = list(kwargs.get("stages") or ())
+        self.overflow = kwargs.get("overflow")
+        self.overflow_buffer = kwargs.get("overflow_buffer", 50000)
+        if self.overflow and not self.watch:
+            raise exceptions.MissingOptionError("--overflow", "--watch")
+        self.grep = None
+        if kwargs.get("grep") or kwargs.get("exclude"):
+            self.grep = GrepStage(kwargs.get("grep"), kwargs.get("exclude"))
+        if self.tail and (self.grep is not None or self.stages):
+            # Probing backwards counts the events read, not the ones left
+            option = "--grep" if kwargs.get("grep") else "--exclude"
+            raise exceptions.IncompatibleOptionsError(
+                "--tail", option if self.grep is not None else "--stage"
+            )
+        self.metrics = None
+        self.stats = Stats(track_events=self.metrics_port is not None)
+        self.sort_memory = (kwargs.get("sort_memory") or 256) * 1024 * 1024
+        self.sink = kwargs.get("sink")
+        if self.sink and self.split_by_stream:
+            raise exceptions.IncompatibleOptionsError("--sink", "--split-by-stream")
+        if self.sink and self.summarize:
+            raise exceptions.IncompatibleOptionsError("--sink", "--summarize")
+        if self.compress and not self.split_by_stream:
+            raise exceptions.MissingOptionError("--compress", "--split-by-stream")
+        if self.search and not self.archive_path:
+            raise exceptions.MissingOptionError("--search", "--archive")
+        self._closed = threading.Event()
+        self.targets = [Target(*t) for t in kwargs.get("targets") or ()]
+        if not self.targets:
+            self.targets = [
+                Target(profile or None, region or None)
+                for profile in (self.aws_profile or "").split(",")
+                for region in (self.aws_region or "").split(",")
+            ]
+        self.target = None
+        self.target_errors = []
+        if len(self.targets) > 1:
+            # Every target gets its own client in _fan_out()
+            self.client = None
+        elif self.archive_path:
+            # Archives are read offline, without credentials or a region
+            self.client = None
+        else:
+            # A single target given as targets=[...] rather than options
+            self.aws_profile, self.aws_region = self.targets[0]
+            self.client = boto3_client(
+                self.aws_profile,
+                self.aws_access_key_id,
+                self.aws_secret_access_key,
+                self.aws_session_token,
+                self.aws_region,
+                self.aws_endpoint_url,
+            )
+            self._watch_client(self.client)
+
+    @property
+    def fan_out(self):
+        """Whether this instance runs against several profiles/regions."""
+        return len(self.targets) > 1
+
+    def _for_target(self, target):
+        """Returns a copy of this instance bound to ``target`` only."""
+        child = copy.copy(self)
+        child.aws_profile, child.aws_region = target
+        child.targets = [target]
+        child.target = target.label
+        child.client = boto3_client(
+            child.aws_profile,
             self.aws_access_key_id,
             self.aws_secret_access_key,
             self.aws_session_token,
-            self.aws_region,
+            child.aws_region,
             self.aws_endpoint_url,
         )
+        child._watch_client(child.client)
+        return child
+
+    def _watch_client(self, client):
+        """Counts the throttled requests of ``client`` and keeps its
+        credentials valid however long ``--watch`` runs."""
+        count_throttles(client, self.stats)
+        retry_expired(client, self.stats)
+        if self.watch:
+            CredentialRefresher(client_credentials(client), self._closed, self.stats)
+
+    def _fan_out(self, method):
+        """Returns one iterator per target running ``method(child)`` against
+        a client of its own. Errors are recorded in ``target_errors`` and
+        end that target's iterator only."""
+
+        def run(target):
+            try:
+                yield from method(self._for_target(target))
+            except Exception as exc:
+                self.target_errors.append((target, exc))
+
+        return [run(target) for target in self.targets]
+
+    def _report_target_errors(self):
+        """Warn about every target that failed."""
+        for target, exc in self.target_errors:
+            sys.stderr.write(colored("{0}: {1}\n".format(target.label, exc), "yellow"))
+
+    def _raise_if_all_targets_failed(self):
+        if self.target_errors and len(self.target_errors) == len(self.targets):
+            raise self.target_errors[0][1]
 
     def _get_streams_from_pattern(self, group, pattern):
         """Returns streams in ``group`` matching ``pattern``."""
@@ -102,134 +299,1096 @@ class AWSLogs(object):
             if re.match(reg, stream):
                 yield stream
 
-    def list_logs(self):
-        streams = []
-        if self.log_stream_name != self.ALL_WILDCARD:
-            streams = list(
-                self._get_streams_from_pattern(
-                    self.log_group_name, self.log_stream_name
-                )
+    def _filtered_streams(self):
+        """Returns the streams ``list_logs`` should be restricted to, or an
+        empty list if every stream in the group is wanted."""
+        if self.log_stream_name in (None, self.ALL_WILDCARD):
+            if self.engine != self.STREAMS_ENGINE:
+                return []
+
+        streams = list(
+            self._get_streams_from_pattern(self.log_group_name, self.log_stream_name)
+        )
+        if len(streams) > self.FILTER_LOG_EVENTS_STREAMS_LIMIT:
+            raise exceptions.TooManyStreamsFilteredError(
+                self.log_stream_name,
+                len(streams),
+                self.FILTER_LOG_EVENTS_STREAMS_LIMIT,
             )
-            if len(streams) > self.FILTER_LOG_EVENTS_STREAMS_LIMIT:
-                raise exceptions.TooManyStreamsFilteredError(
-                    self.log_stream_name,
-                    len(streams),
-                    self.FILTER_LOG_EVENTS_STREAMS_LIMIT,
+        if len(streams) == 0:
+            raise exceptions.NoStreamsFilteredError(self.log_stream_name)
+        return streams
+
+    def iter_events(self, batched=False):
+        """Yield ``LogEvent`` matching this configuration, in order.
+
+        Pages are only requested from CloudWatch when the consumer asks for
+        more events, so a slow consumer holds at most one page in memory
+        (plus ``read_ahead`` pages fetched on a background thread while the
+        current one is being consumed, if set). With ``batched`` every
+        fetched page is yielded as a list instead. In watch mode the
+        iterator never ends on its own; stop it by closing the generator or
+        calling ``close()`` from another thread.
+
+        With several targets, events are tagged with the target they come
+        from and every target is read concurrently.
+        """
+        if self.archive_path:
+            return self._archive_events(batched)
+        if self.fan_out:
+            return self._fan_out_events(batched)
+        return self._iter_events(self._filtered_streams(), batched)
+
+    def iter_batches(self, batch_size=65536):
+        """Yield the events ``iter_events`` would as columnar
+        ``EventBatch`` of up to ``batch_size`` events, see
+        ``awslogs.batches``. In watch mode every page read is yielded
+        right away, in batches of up to ``batch_size`` events."""
+        return batches(
+            self.iter_events(batched=True),
+            batch_size,
+            flush_pages=bool(self.watch),
+        )
+
+    def _archive_events(self, batched=False):
+        """Yield the events of the local archive in ``archive_path``
+        matching this configuration, and ``search`` if set."""
+        if self.watch:
+            raise exceptions.IncompatibleOptionsError("--archive", "--watch")
+        archive = Archive(self.archive_path)
+        found = None
+        try:
+            streams = None
+            if self.log_stream_name not in (None, self.ALL_WILDCARD):
+                reg = re.compile("^{0}".format(self.log_stream_name))
+                streams = [
+                    i for i, stream in enumerate(archive.streams) if reg.match(stream)
+                ]
+                if not streams:
+                    raise exceptions.NoStreamsFilteredError(self.log_stream_name)
+
+            # The window the archive was written for unless told otherwise
+            start = archive.start if self.start is None else self.start
+            end = archive.end if self.end is None else self.end
+            found = archive.search(self.search, start, end, streams)
+            indexes = found
+            if self.tail:
+                indexes = iter(deque(indexes, maxlen=self.tail))
+            if self._read_limit() is not None:
+                indexes = islice(indexes, self._read_limit())
+            while True:
+                with self.profiler.span("search"):
+                    page = [
+                        archive.event(i)
+                        for i in islice(indexes, self.MAX_EVENTS_PER_CALL)
+                    ]
+                if not page:
+                    break
+                if batched:
+                    yield page
+                else:
+                    yield from page
+        finally:
+            # The search holds slices of the index, release them first
+            if found is not None:
+                found.close()
+            archive.close()
+
+    def _fan_out_events(self, batched=False):
+        """Yield events of every target. Without watch they are put in
+        timestamp order by ``_ordered``; in watch mode (or with
+        ``unordered``) they are yielded as they arrive so a quiet or slow
+        target never holds back the others."""
+        pages = self._fan_out(lambda child: child.iter_events(batched=True))
+        depth = max(self.read_ahead, 1)
+        arrival_order = self.watch or self.unordered
+        if arrival_order:
+            readers = [Interleaver(pages, depth * len(pages))]
+            events = chain.from_iterable(readers[0])
+        else:
+            readers = [Interleaver(self._tagged(pages), depth * len(pages))]
+            events = ordered = self._ordered(readers[0], len(pages))
+        if self.tail and not self.watch:
+            events = iter(deque(events, maxlen=self.tail))
+        limit = self._read_limit()
+        if limit is not None:
+            events = islice(events, limit)
+
+        try:
+            if not batched:
+                yield from events
+            elif arrival_order and limit is None and not self.tail:
+                yield from readers[0]
+            else:
+                while True:
+                    page = list(islice(events, self.MAX_EVENTS_PER_CALL))
+                    if not page:
+                        break
+                    yield page
+        finally:
+            for reader in readers:
+                reader.close()
+            if not arrival_order:
+                ordered.close()
+
+        self._raise_if_all_targets_failed()
+
+    @staticmethod
+    def _tagged(iterables):
+        """Returns ``iterables`` yielding ``(n, item)`` pairs instead, and a
+        final ``(n, None)``, ``n`` being their position in the list."""
+
+        def tagged(n, iterable):
+            for item in iterable:
+                yield n, item
+            yield n, None
+
+        return [tagged(n, iterable) for n, iterable in enumerate(iterables)]
+
+    def _ordered(self, pages, shards):
+        """Yield the events of ``(shard, page)`` pairs from ``_tagged``
+        sources in timestamp order, each source being in order itself.
+
+        Events are buffered in an ``ExternalSorter`` and yielded as soon as
+        every source has gone past them, so memory only grows while a
+        source lags behind the others, and is capped by ``sort_memory``
+        past which sorted runs are spilled to temporary files.
+        """
+        sorter = ExternalSorter(max_memory=self.sort_memory)
+        latest = [None] * shards
+        try:
+            for shard, page in pages:
+                if page is None:
+                    latest[shard] = float("inf")
+                elif page:
+                    with self.profiler.span("order"):
+                        sorter.add_many(page)
+                    latest[shard] = page[-1].timestamp
+                if None not in latest:
+                    yield from sorter.pop(min(latest))
+            yield from sorter.pop()
+        finally:
+            sorter.close()
+
+    def _use_streams_engine(self, streams):
+        """Whether to read ``streams`` one by one through ``get_log_events``
+        instead of ``filter_log_events``."""
+        if self.engine == self.STREAMS_ENGINE:
+            if self.filter_pattern:
+                raise exceptions.EngineNotSupportedError(
+                    self.engine, "--filter-pattern"
                 )
-            if len(streams) == 0:
-                raise exceptions.NoStreamsFilteredError(self.log_stream_name)
+            return True
+        # A single stream has nothing to interleave, and get_log_events
+        # doesn't know about filter patterns or re-reading an overlap.
+        return (
+            self.engine == self.AUTO_ENGINE
+            and not self.filter_pattern
+            and not self.watch_overlap
+            and 1 < len(streams) <= self.STREAMS_ENGINE_MAX_STREAMS
+        )
 
-        max_stream_length = max([len(s) for s in streams]) if streams else 10
-        group_length = len(self.log_group_name)
+    def _iter_events(self, streams, batched=False):
+        if (
+            self.watch
+            and self.rediscover
+            and streams
+            and self.log_stream_name not in (None, self.ALL_WILDCARD)
+        ):
+            self.discovery = StreamDiscovery(
+                self.client,
+                self.log_group_name,
+                self.log_stream_name,
+                streams,
+                self.rediscover,
+                self._closed,
+                max_streams=self.FILTER_LOG_EVENTS_STREAMS_LIMIT,
+                stats=self.stats,
+                on_error=self._discovery_error,
+            )
+        if self.sample:
+            if self.watch:
+                raise exceptions.IncompatibleOptionsError("--sample", "--watch")
+            pages = self._sample_pages(streams)
+        elif self.tail:
+            pages = self._tail_pages(streams)
+        elif self._use_streams_engine(streams):
+            pages = self._merged_stream_pages(streams)
+        elif self.watch:
+            pages = self._watch_pages(streams, self.start, page_size=self._read_limit())
+        else:
+            pages = self._pages(
+                streams, self.start, self.end, False, page_size=self._read_limit()
+            )
+        if self.read_ahead:
+            pages = Prefetcher(pages, self.read_ahead)
+        remaining = self._read_limit()
+        try:
+            for events in pages:
+                if remaining is not None:
+                    events = events[:remaining]
+                    remaining -= len(events)
+                self.stats.observe_events(events)
+                if batched:
+                    yield events
+                else:
+                    yield from events
+                if remaining == 0:
+                    # Closing the pages below cancels any page still in flight
+                    return
+        finally:
+            pages.close()
+            if self.discovery is not None:
+                self.discovery.close()
+
+    def _read_limit(self):
+        """Returns how many events to read, ``limit`` unless stages drop
+        some of them, in which case ``LimitStage`` counts what's left."""
+        if self.grep is not None or self.stages:
+            return None
+        return self.limit
+
+    def _discovery_error(self, exc):
+        sys.stderr.write(
+            colored("Looking for new streams failed: {0}\n".format(exc), "yellow")
+        )
 
+    def _filter_kwargs(self, streams, start, end, page_size=None):
+        """Returns the ``filter_log_events`` arguments for a read of
+        ``streams`` (all of them if empty) between ``start`` and ``end``."""
+        kwargs = {"logGroupName": self.log_group_name, "interleaved": True}
+
+        if streams:
+            kwargs["logStreamNames"] = streams
+
+        if start:
+            kwargs["startTime"] = start
+
+        if end:
+            kwargs["endTime"] = end
+
+        if self.filter_pattern:
+            kwargs["filterPattern"] = self.filter_pattern
+
+        if page_size and page_size < self.MAX_EVENTS_PER_CALL:
+            kwargs["limit"] = page_size
+
+        return kwargs
+
+    def _filter_log_events(self, kwargs):
+        started = time.monotonic()
+        with self.profiler.span("filter_log_events"):
+            response = self.client.filter_log_events(**kwargs)
+        self.stats.observe("filter_log_events", time.monotonic() - started)
+        self.stats.incr("filter_log_events")
+        return response
+
+    def _count_duplicates(self, response, events):
+        dropped = len(response.get("events", ())) - len(events)
+        if dropped:
+            self.stats.incr("duplicates dropped", dropped)
+
+    def _pages(self, streams, start, end, watch, page_size=None):
+        """Yield pages of events trying to deduplicate them using a lru queue.
+        AWS API stands for the interleaved parameter that:
+            interleaved (boolean) -- If provided, the API will make a best
+            effort to provide responses that contain events from multiple
+            log streams within the log group interleaved in a single
+            response. That makes some responses return some subsequent
+            response duplicate events. In a similar way when awslogs is
+            called with --watch option, we need to find out which events we
+            have alredy put in the queue in order to not do it several
+            times while waiting for new ones and reusing the same
+            next_token. The site of this queue is MAX_EVENTS_PER_CALL in
+            order to not exhaust the memory.
+        """
         # Note: filter_log_events paginator is broken
         # ! Error during pagination: The same next token was received twice
-        do_wait = object()
-
-        def generator():
-            """Yield events into trying to deduplicate them using a lru queue.
-            AWS API stands for the interleaved parameter that:
-                interleaved (boolean) -- If provided, the API will make a best
-                effort to provide responses that contain events from multiple
-                log streams within the log group interleaved in a single
-                response. That makes some responses return some subsequent
-                response duplicate events. In a similar way when awslogs is
-                called with --watch option, we need to find out which events we
-                have alredy put in the queue in order to not do it several
-                times while waiting for new ones and reusing the same
-                next_token. The site of this queue is MAX_EVENTS_PER_CALL in
-                order to not exhaust the memory.
-            """
-            interleaving_sanity = deque(maxlen=self.MAX_EVENTS_PER_CALL)
-            kwargs = {"logGroupName": self.log_group_name, "interleaved": True}
-
-            if streams:
-                kwargs["logStreamNames"] = streams
-
-            if self.start:
-                kwargs["startTime"] = self.start
-
-            if self.end:
-                kwargs["endTime"] = self.end
+        interleaving_sanity = deque(maxlen=self.MAX_EVENTS_PER_CALL)
+        kwargs = self._filter_kwargs(streams, start, end, page_size)
 
-            if self.filter_pattern:
-                kwargs["filterPattern"] = self.filter_pattern
+        span = self.profiler.span
+        group = self.log_group_name
+        target = self.target
+        from_response = LogEvent.from_response
+        # New streams found while watching replace logStreamNames, reading
+        # again from the newest event read so far or from when discovery
+        # says the new streams may hold events, whichever is older. Events
+        # read again are dropped by interleaving_sanity.
+        discovery = self.discovery if watch and streams else None
+        version = discovery and discovery.version
+        position = start
+        while not self._closed.is_set():
+            if discovery is not None and discovery.version != version:
+                version = discovery.version
+                kwargs["logStreamNames"] = discovery.streams
+                kwargs.pop("nextToken", None)
+                if position:
+                    if discovery.replay_from is not None:
+                        position = min(position, discovery.replay_from)
+                    kwargs["startTime"] = max(position, start or 0)
 
-            while True:
-                response = self.client.filter_log_events(**kwargs)
+            response = self._filter_log_events(kwargs)
 
+            with span("dedup"):
+                events = []
                 for event in response.get("events", []):
                     if event["eventId"] not in interleaving_sanity:
                         interleaving_sanity.append(event["eventId"])
-                        yield event
+                        events.append(from_response(event, group, target))
+                self._count_duplicates(response, events)
 
-                if "nextToken" in response:
-                    kwargs["nextToken"] = response["nextToken"]
-                else:
-                    yield do_wait
+            if events:
+                if discovery is not None:
+                    position = max(position or 0, max(e.timestamp for e in events))
+                yield events
 
-        def consumer():
-            for event in generator():
+            if "nextToken" in response:
+                kwargs["nextToken"] = response["nextToken"]
+            elif not watch or self._closed.wait(self.watch_interval):
+                return
 
-                if event is do_wait:
-                    if self.watch:
-                        time.sleep(self.watch_interval)
-                        continue
-                    else:
-                        return
+    def _watch_pages(self, streams, start, page_size=None):
+        if self.watch_overlap:
+            return self._cursor_pages(streams, start, page_size)
+        return self._pages(streams, start, self.end, True, page_size)
 
-                output = []
-                if self.output_group_enabled:
-                    output.append(
-                        self.color(
-                            self.log_group_name.ljust(group_length, " "), "green"
-                        )
-                    )
-                if self.output_stream_enabled:
-                    output.append(
-                        self.color(
-                            event["logStreamName"].ljust(max_stream_length, " "), "cyan"
-                        )
-                    )
-                if self.output_timestamp_enabled:
-                    output.append(self.color(milis2iso(event["timestamp"]), "yellow"))
-                if self.output_ingestion_time_enabled:
-                    output.append(self.color(milis2iso(event["ingestionTime"]), "blue"))
-
-                message = event["message"]
-                if self.query is not None and message[0] == "{":
-                    parsed = json.loads(event["message"])
-                    message = self.query_expression.search(parsed)
-                    if not isinstance(message, str):
-                        message = json.dumps(message)
-                output.append(message.rstrip())
-                print(" ".join(output))
+    def _cursor_pages(self, streams, start, page_size=None):
+        """Yield pages of new events forever, in rounds every
+        ``watch_interval`` seconds.
 
-                try:
-                    sys.stdout.flush()
-                except IOError as e:
-                    if e.errno == errno.EPIPE:
-                        # SIGPIPE received, so exit
-                        os._exit(0)
-                    else:
-                        # We don't want to handle any other errors from this
-                        raise
+        Instead of reusing the last ``nextToken``, every round reads from
+        ``watch_overlap`` milliseconds before the newest timestamp seen so
+        far (further back if events took longer than that to be ingested in
+        the previous round, up to ``WATCH_OVERLAP_MAX_FACTOR`` times), so
+        events ingested late are still picked up. Events read again are
+        dropped using the ids seen within the overlap, kept in sets per
+        time bucket which are freed as the window moves forward.
+        """
+        kwargs = self._filter_kwargs(streams, start, self.end, page_size)
+        overlap = self.watch_overlap
+        max_overlap = overlap * self.WATCH_OVERLAP_MAX_FACTOR
+        bucket = max(overlap // 4, 1)
+        floor = start or 0
+        cursor = floor
+        lag = 0
+        seen = {}
+
+        span = self.profiler.span
+        group = self.log_group_name
+        target = self.target
+        from_response = LogEvent.from_response
+        while not self._closed.is_set():
+            if self.discovery is not None:
+                kwargs["logStreamNames"] = self.discovery.streams
+            window = max(cursor - min(max(overlap, lag), max_overlap), floor)
+            kwargs["startTime"] = window
+            kwargs.pop("nextToken", None)
+            for key in [k for k in seen if k < window // bucket]:
+                del seen[key]
+
+            lag = 0
+            while not self._closed.is_set():
+                response = self._filter_log_events(kwargs)
+
+                with span("dedup"):
+                    events = []
+                    for event in response.get("events", []):
+                        timestamp = event["timestamp"]
+                        ids = seen.get(timestamp // bucket)
+                        if ids is None:
+                            ids = seen[timestamp // bucket] = set()
+                        elif event["eventId"] in ids:
+                            continue
+                        ids.add(event["eventId"])
+                        events.append(from_response(event, group, target))
+                        if timestamp > cursor:
+                            cursor = timestamp
+                        if event["ingestionTime"] - timestamp > lag:
+                            lag = event["ingestionTime"] - timestamp
+                    self._count_duplicates(response, events)
 
+                if events:
+                    yield events
+
+                if "nextToken" not in response:
+                    break
+                kwargs["nextToken"] = response["nextToken"]
+
+            if self._closed.wait(self.watch_interval):
+                return
+
+    def _probe(self, streams, start, end, cap=None):
+        """Returns the events between ``start`` and ``end``, or ``None`` as
+        soon as there are more than ``cap`` of them."""
+        events = []
+        pages = self._pages(streams, start, end, False, cap and cap + 1)
         try:
-            consumer()
+            for page in pages:
+                events.extend(page)
+                if cap is not None and len(events) > cap:
+                    return None
+        finally:
+            pages.close()
+        return events
+
+    def _tail_pages(self, streams):
+        """Yield the last ``tail`` events before ``end`` (or now), oldest
+        first, then keep following the group in watch mode.
+
+        ``filter_log_events`` only reads forward, so time windows ending at
+        ``end`` are probed backwards. A window is read only up to twice the
+        number of events still missing: if it holds more, it is halved
+        towards its end and probed again. Otherwise the next window ends
+        where this one started and is sized after the event rate seen so
+        far, doubling while nothing has been found.
+        """
+        tail_end = self.end or self._now()
+        floor = self.start or 0
+        need = self.tail
+        width = self.TAIL_INITIAL_WINDOW
+        hi = tail_end
+        windows = []
+        while need > 0 and hi >= floor and not self._closed.is_set():
+            lo = max(hi - width + 1, floor)
+            # A single millisecond can't be split any further.
+            events = self._probe(streams, lo, hi, 2 * need if lo < hi else None)
+            if events is None:
+                width = max((hi - lo + 1) // 2, 1)
+                continue
+
+            events.sort(key=attrgetter("timestamp"))
+            events = events[-need:]
+            windows.append(events)
+            need -= len(events)
+            found = self.tail - need
+            width *= 2
+            if found:
+                # Aim the next window at the rate seen so far, with some
+                # margin, so it is unlikely to come back short or too busy.
+                width = min(width, (tail_end - lo) * need * 5 // (found * 4) + 1)
+            hi = lo - 1
+
+        for events in reversed(windows):
+            if events:
+                yield events
+
+        if self.watch:
+            yield from self._watch_pages(streams, tail_end + 1)
+
+    def _sample_pages(self, streams):
+        """Yield a sample of the events between ``start`` and ``end`` (or
+        now) made out of ``sample`` single-page probes run in parallel.
+
+        The window is split into ``sample`` slices and each probe reads the
+        first ``sample_size`` events from the start of its slice (or from a
+        random point in it). A probe that comes back full covered only up to
+        its last event, so ``sample_rate`` ends up being the fraction of the
+        window the sample covers.
+        """
+        start = self.start or 0
+        end = self.end or self._now()
+        width = max((end - start + 1) // self.sample, 1)
+        slices = [
+            (lo, min(lo + width - 1, end)) for lo in range(start, end + 1, width)
+        ][: self.sample]
+        # The last slice takes whatever the division left over.
+        slices[-1] = (slices[-1][0], end)
+
+        if self.sample_spacing == "random":
+            rand = random.Random(self.sample_seed)
+            slices = [(rand.randint(lo, hi), hi) for lo, hi in slices]
+
+        def probe(window):
+            lo, hi = window
+            kwargs = self._filter_kwargs(streams, lo, hi, self.sample_size)
+            response = self._filter_log_events(kwargs)
+            events = [
+                LogEvent.from_response(event, self.log_group_name, self.target)
+                for event in response.get("events", [])[: self.sample_size]
+            ]
+            if "nextToken" in response:
+                # There's more in this slice: we only know about it up to
+                # the last event we got.
+                hi = max(e.timestamp for e in events) if events else lo - 1
+            events.sort(key=attrgetter("timestamp"))
+            return events, hi - lo + 1
+
+        covered = 0
+        workers = min(len(slices), self.SAMPLE_MAX_WORKERS)
+        with ThreadPoolExecutor(workers, thread_name_prefix="awslogs-sample") as pool:
+            probes = [pool.submit(probe, window) for window in slices]
+            try:
+                for future in probes:
+                    events, probe_covered = future.result()
+                    covered += probe_covered
+                    self.sample_rate = covered / float(end - start + 1)
+                    if events:
+                        yield events
+            finally:
+                for future in probes:
+                    future.cancel()
+
+    def _now(self):
+        """Returns the current time in milliseconds since the epoch."""
+        return int(total_seconds(datetime.utcnow() - datetime(1970, 1, 1))) * 1000
+
+    def _stream_pages(self, stream, tokens):
+        """Yield pages of events of ``stream`` using ``get_log_events`` until
+        it is caught up. The forward token reached is kept in ``tokens`` so
+        the next call carries on from there."""
+        kwargs = {
+            "logGroupName": self.log_group_name,
+            "logStreamName": stream,
+            "startFromHead": True,
+        }
+
+        if self.start:
+            kwargs["startTime"] = self.start
+
+        if self.end:
+            # get_log_events leaves out events at endTime, unlike
+            # filter_log_events
+            kwargs["endTime"] = self.end + 1
+
+        span = self.profiler.span
+        group = self.log_group_name
+        while not self._closed.is_set():
+            token = tokens.get(stream)
+            if token:
+                kwargs["nextToken"] = token
+
+            started = time.monotonic()
+            with span("get_log_events"):
+                response = self.client.get_log_events(**kwargs)
+            self.stats.observe("get_log_events", time.monotonic() - started)
+            self.stats.incr("get_log_events")
+
+            events = [
+                LogEvent(
+                    None,
+                    event["timestamp"],
+                    event["ingestionTime"],
+                    group,
+                    stream,
+                    event["message"],
+                    self.target,
+                )
+                for event in response.get("events", [])
+            ]
+            if events:
+                yield events
+
+            tokens[stream] = response["nextForwardToken"]
+            # get_log_events hands back the token it was given once there
+            # is nothing else to read.
+            if response["nextForwardToken"] == token:
+                return
+
+    def _merged_stream_pages(self, streams):
+        """Read every stream concurrently and k-way merge them by timestamp.
+
+        Each stream is strictly ordered on its own, so merging them with a
+        heap gives ordered output without the duplicates interleaved
+        ``filter_log_events`` calls return. In watch mode every round reads
+        all streams until they are caught up, then waits for new events.
+        """
+        tokens = {}
+        while not self._closed.is_set():
+            if self.discovery is not None:
+                streams = self.discovery.streams
+            readers = [
+                Prefetcher(
+                    self._stream_pages(stream, tokens),
+                    max(self.read_ahead, 1),
+                    name="awslogs-stream",
+                )
+                for stream in streams
+            ]
+            try:
+                merged = heapq.merge(
+                    *[chain.from_iterable(reader) for reader in readers],
+                    key=attrgetter("timestamp")
+                )
+                while True:
+                    events = list(islice(merged, self.MAX_EVENTS_PER_CALL))
+                    if not events:
+                        break
+                    yield events
+            finally:
+                for reader in readers:
+                    reader.close()
+
+            if not self.watch or self._closed.wait(self.watch_interval):
+                return
+
+    def close(self):
+        """Stop any ``iter_events`` iterator of this instance. Safe to call
+        from a different thread than the one consuming events."""
+        self._closed.set()
+
+    def _serve_metrics(self):
+        if self.metrics_port is not None and self.metrics is None:
+            self.metrics = MetricsServer(self.stats, self.metrics_port)
+
+    def list_logs(self):
+        self._serve_metrics()
+        if self.summarize:
+            return self.summarize_logs()
+        if self.split_by_stream:
+            return self.split_logs()
+
+        sink = None
+        if self.sink:
+            query = self.query_expression if self.query is not None else None
+            sink = open_sink(self.sink, query)
+            resume = (
+                None if self.archive_path else sink.resume_from(self.log_group_name)
+            )
+            if resume is not None and self.resume:
+                # Only read what's newer than the last run, INSERT OR IGNORE
+                # drops the events of that millisecond already stored
+                self.start = resume
+
+        group_length = len(self.log_group_name)
+        if self.archive_path:
+            archive = Archive(self.archive_path)
+            streams, group_length = archive.streams, len(archive.group)
+            archive.close()
+        else:
+            streams = [] if self.fan_out else self._filtered_streams()
+        max_stream_length = max([len(s) for s in streams]) if streams else 10
+        if self.archive_path:
+            pages = self._archive_events(batched=True)
+        elif self.fan_out:
+            pages = self._fan_out_events(batched=True)
+        else:
+            pages = self._iter_events(streams, batched=True)
+
+        formatter = LineFormatter(
+            self.color,
+            group_length,
+            max_stream_length,
+            output_group_enabled=self.output_group_enabled,
+            output_stream_enabled=self.output_stream_enabled,
+            output_timestamp_enabled=self.output_timestamp_enabled,
+            output_ingestion_time_enabled=self.output_ingestion_time_enabled,
+            # Streams found while watching may be longer than any so far
+            grow_streams=bool(self.watch and self.rediscover),
+        )
+        # The sink extracts --query fields itself, next to the message
+        stages = self._stages(query=sink is None)
+        if self.limit is not None:
+            stages.append(LimitStage(self.limit))
+        if sink is None:
+            stages.extend([FormatStage(formatter), WriteStage()])
+        else:
+            stages.append(sink)
+        pipeline = Pipeline(stages, self.profiler)
+        if self.overflow:
+            # Keep polling while output is slow instead of waiting for it
+            pages = OverflowBuffer(
+                pages,
+                self.overflow,
+                self.overflow_buffer,
+                stats=self.stats,
+                status_out=status_stream(sys.stderr, None if sink else sys.stdout),
+            )
+
+        try:
+            with self.profiler.span("list_logs"):
+                try:
+                    pipeline.run(pages)
+                finally:
+                    if self.overflow:
+                        pages.close()
+            if sink is not None:
+                sys.stderr.write(
+                    "Wrote {0} new events to {1}\n".format(sink.inserted, sink.path)
+                )
+            if self.sample_rate is not None:
+                sys.stderr.write(
+                    "Sampled {0} probes covering {1:.4%} of the window\n".format(
+                        self.sample, self.sample_rate
+                    )
+                )
+        except IOError as e:
+            if e.errno == errno.EPIPE:
+                # SIGPIPE received, so exit
+                self.profiler.dump()
+                os._exit(0)
+            else:
+                # We don't want to handle any other errors from this
+                raise
         except KeyboardInterrupt:
             print("Closing...\n")
+            if self.show_stats:
+                self.stats.report(sys.stderr)
+            self.profiler.dump()
             os._exit(0)
+        finally:
+            self._report_target_errors()
+        if self.show_stats:
+            self.stats.report(sys.stderr)
+        self.profiler.dump()
+
+    def _stages(self, query=True):
+        """Returns the stages every page goes through before being
+        formatted: ``grep`` if set, the ones in ``stages``, then ``query``
+        if set and ``query`` is true."""
+        stages = [] if self.grep is None else [self.grep]
+        stages.extend(
+            load_stage(stage, self) if isinstance(stage, str) else stage
+            for stage in self.stages
+        )
+        if query and self.query is not None:
+            stages.append(QueryStage(self.query_expression))
+        return stages
+
+    def _filtered_pages(self):
+        """Yields the pages ``iter_events(batched=True)`` reads once through
+        ``grep``, the ones in ``stages`` and ``limit``, for the commands
+        which don't print events one by one."""
+        stages = self._stages(query=False)
+        if self.limit is not None:
+            stages.append(LimitStage(self.limit))
+        pipeline = Pipeline(stages, self.profiler)
+        pages = self.iter_events(batched=True)
+        try:
+            for page in pages:
+                page = pipeline.process(list(page))
+                if page:
+                    yield page
+                if any(getattr(stage, "done", False) for stage in stages):
+                    break
+        finally:
+            close = getattr(pages, "close", None)
+            if close is not None:
+                close()
+            for stage in stages:
+                stage.close()
+
+    def _query_message(self, message):
+        """Returns what ``query`` extracts from the JSON ``message``."""
+        message = self.query_expression.search(json.loads(message))
+        if not isinstance(message, str):
+            message = json.dumps(message)
+        return message
+
+    def split_logs(self):
+        """Writes events to one file per stream inside the
+        ``split_by_stream`` directory instead of printing them."""
+        span = self.profiler.span
+        formatter = LineFormatter(
+            lambda text, color: text,
+            0,
+            0,
+            output_group_enabled=False,
+            output_stream_enabled=False,
+            output_timestamp_enabled=self.output_timestamp_enabled,
+            output_ingestion_time_enabled=self.output_ingestion_time_enabled,
+        )
+        sink = StreamFiles(self.split_by_stream, compress=self.compress)
+        count = 0
+        try:
+            for events in self._filtered_pages():
+                for event in events:
+                    message = event.message
+                    if self.query is not None and message[:1] == "{":
+                        with span("query"):
+                            message = self._query_message(message)
+                    with span("format"):
+                        line = formatter.format(event, message)
+                    name = event.stream
+                    if event.target is not None:
+                        name = "{0}/{1}".format(event.target.label, name)
+                    with span("write"):
+                        sink.write(name, line + "\n")
+                count += len(events)
+                if self.watch:
+                    sink.flush()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            with span("write"):
+                sink.close()
+            self._report_target_errors()
+        if self.show_stats:
+            self.stats.report(sys.stderr)
+        sys.stderr.write(
+            "Wrote {0} events of {1} streams to {2}\n".format(
+                count, len(sink.paths), self.split_by_stream
+            )
+        )
+        self.profiler.dump()
+
+    def summarize_logs(self):
+        """Prints the ``top`` most frequent message templates of the
+        window with their counts, first and last timestamps and a few of
+        the values seen in their variable parts."""
+        if self.watch:
+            raise exceptions.IncompatibleOptionsError("--summarize", "--watch")
+
+        miner = TemplateMiner()
+        with self.profiler.span("summarize"):
+            for events in self._filtered_pages():
+                add = miner.add
+                for event in events:
+                    add(event.message, event.timestamp)
+
+        templates = miner.top(self.top)
+        digits = len(str(templates[0].count)) if templates else 1
+        for template in templates:
+            print(
+                "{0} {1} {2} {3}".format(
+                    str(template.count).rjust(digits),
+                    self.color(milis2iso(template.first), "yellow"),
+                    self.color(milis2iso(template.last), "yellow"),
+                    template.text,
+                )
+            )
+            for values in template.examples:
+                print(
+                    "{0} {1}".format(
+                        " " * digits, self.color(" | ".join(values), "cyan")
+                    )
+                )
+        if miner.evicted:
+            sys.stderr.write(
+                "{0} rarely seen templates were evicted\n".format(miner.evicted)
+            )
+        self._report_target_errors()
+        self.profiler.dump()
+
+    def archive(self):
+        """Downloads the events of the window into a local archive in
+        ``output_dir`` which ``get --archive`` can then search."""
+        if self.watch:
+            raise exceptions.IncompatibleOptionsError("archive", "--watch")
+        writer = ArchiveWriter(
+            self.output_dir, self.log_group_name, self.start, self.end or self._now()
+        )
+        with self.profiler.span("archive"):
+            for events in self.iter_events(batched=True):
+                writer.add_many(events)
+            count = writer.close()
+        sys.stderr.write(
+            "Archived {0} events of {1} to {2}\n".format(
+                count, self.log_group_name, self.output_dir
+            )
+        )
+        self._report_target_errors()
+        self.profiler.dump()
+
+    def _list(self, method):
+        """Print what ``method`` yields, tagged with the target it comes
+        from when running against several of them."""
+        if not self.fan_out:
+            for item in method(self):
+                print(item)
+            return
+
+        def tagged(child):
+            for item in method(child):
+                yield "{0} {1}".format(child.target, item)
+
+        for line in Interleaver(self._fan_out(tagged), 100 * len(self.targets)):
+            print(line)
+        self._report_target_errors()
+        self._raise_if_all_targets_failed()
+
+    def histogram(self):
+        """Prints how many events there are in each ``bucket`` of the
+        window, as bars or CSV, optionally split by stream or by the
+        value ``query`` extracts."""
+        if self.end is None:
+            self.end = self._now()
+        histogram = Histogram(self.start, self.end, self.bucket)
+        for events in self._filtered_pages():
+            if self.by_stream:
+                for event in events:
+                    histogram.add(event.timestamp, event.stream)
+            elif self.query is not None:
+                for event in events:
+                    histogram.add(event.timestamp, self._query_key(event.message))
+            else:
+                histogram.add_many([event.timestamp for event in events])
+
+        if self.output_format == "csv":
+            histogram.render_csv(sys.stdout)
+        else:
+            histogram.render_bars(sys.stdout, color=self.color)
+
+    def _query_key(self, message):
+        """Returns what ``query`` extracts from ``message`` as a string."""
+        if message[:1] != "{":
+            return None
+        try:
+            key = self.query_expression.search(json.loads(message))
+        except ValueError:
+            return None
+        if key is None or isinstance(key, str):
+            return key
+        return json.dumps(key)
 
     def list_groups(self):
         """Lists available CloudWatch logs groups"""
-        for group in self.get_groups():
-            print(group)
+        self._list(AWSLogs.get_groups)
 
     def list_streams(self):
-        """Lists available CloudWatch logs streams in ``log_group_name``."""
-        for stream in self.get_streams():
-            print(stream)
+        """Lists available CloudWatch logs streams in ``log_group_name``, or
+        in every group of ``log_group_names`` and starting with
+        ``log_group_prefix``."""
+        if len(self.log_group_names) > 1 or self.log_group_prefix or self.metadata:
+            self._list(AWSLogs._stream_rows)
+        else:
+            self._list(AWSLogs.get_streams)
+
+    def _stream_rows(self):
+        """Yields a line per stream of the groups ``list_streams`` lists,
+        as soon as they are read. Groups are read ``workers`` at a time and
+        lines are prefixed with their group when there are several."""
+        groups = self._selected_groups()
+        tag = len(groups) > 1 or bool(self.log_group_prefix)
+        errors = []
+
+        def rows(group):
+            try:
+                for stream in self.describe_streams(group):
+                    columns = [stream["logStreamName"]]
+                    if tag:
+                        columns.insert(0, group)
+                    if self.metadata:
+                        columns.extend(self._stream_metadata(stream))
+                    yield " ".join(columns)
+            except Exception as exc:
+                errors.append((group, exc))
+
+        lines = Interleaver(
+            [rows(group) for group in groups],
+            100 * max(self.workers, 1),
+            name="awslogs-streams",
+            workers=self.workers,
+        )
+        try:
+            yield from lines
+        finally:
+            lines.close()
+            for group, exc in errors:
+                sys.stderr.write(colored("{0}: {1}\n".format(group, exc), "yellow"))
+
+    def _selected_groups(self):
+        """Returns the groups of ``log_group_names`` followed by the other
+        groups starting with ``log_group_prefix``."""
+        groups = list(self.log_group_names)
+        if self.log_group_prefix:
+            listed = set(groups)
+            groups.extend(g for g in self.get_groups() if g not in listed)
+        return groups
+
+    def trace(self):
+        """Prints every event holding ``trace_id`` in the selected groups
+        as a single timeline.
+
+        Groups are searched ``workers`` at a time with the id as filter
+        pattern, so CloudWatch does the matching. Once any group finds it,
+        every search narrows to ``trace_around`` either side of that event
+        (see ``TraceWindow``) instead of going through the whole window.
+        """
+        if self.fan_out:
+            raise exceptions.IncompatibleOptionsError(
+                "trace", "several profiles or regions"
+            )
+        groups = self._selected_groups()
+        window = TraceWindow(
+            self.start or 0, self.end or self._now(), self.trace_around
+        )
+        pattern = trace_pattern(self.trace_id)
+        errors = []
+
+        def search(group):
+            try:
+                yield from self._trace_pages(group, pattern, window)
+            except Exception as exc:
+                errors.append((group, exc))
+
+        pages = Interleaver(
+            [search(group) for group in groups],
+            4 * max(self.workers, 1),
+            name="awslogs-trace",
+            workers=self.workers,
+        )
+        found = {}
+        try:
+            with self.profiler.span("trace"):
+                for page in pages:
+                    for event in page:
+                        # Searches starting over find some events again
+                        found.setdefault((event.group, event.event_id), event)
+        finally:
+            pages.close()
+            for group, exc in errors:
+                sys.stderr.write(colored("{0}: {1}\n".format(group, exc), "yellow"))
+
+        events = sorted(
+            (e for e in found.values() if e.timestamp in window),
+            key=lambda e: (e.timestamp, e.group, e.stream),
+        )
+        formatter = LineFormatter(
+            self.color,
+            max([len(e.group) for e in events] or [0]),
+            max([len(e.stream) for e in events] or [0]),
+            output_timestamp_enabled=True,
+        )
+        for event in events:
+            print(formatter.format(event, event.message))
+        sys.stderr.write(
+            "Found {0} events in {1} of {2} groups\n".format(
+                len(events), len(set(e.group for e in events)), len(groups)
+            )
+        )
+        self.profiler.dump()
+
+    def _trace_pages(self, group, pattern, window):
+        """Yields pages of the events of ``group`` matching ``pattern``
+        in ``window``, starting over whenever it narrows."""
+        start, end = window.bounds()
+        kwargs = {
+            "logGroupName": group,
+            "filterPattern": pattern,
+            "startTime": start,
+            "endTime": end,
+        }
+        while not self._closed.is_set():
+            response = self._filter_log_events(kwargs)
+            events = [
+                LogEvent.from_response(event, group)
+                for event in response.get("events", [])
+            ]
+            if events:
+                window.hit(min(e.timestamp for e in events))
+                yield events
+            if window.bounds() != (start, end):
+                # Whatever is left to scan outside the narrowed window
+                # needn't be read
+                start, end = window.bounds()
+                kwargs.update(startTime=start, endTime=end)
+                kwargs.pop("nextToken", None)
+                continue
+            if "nextToken" not in response:
+                return
+            kwargs["nextToken"] = response["nextToken"]
+
+    @staticmethod
+    def _stream_metadata(stream):
+        """Returns the first and last event times and stored bytes columns
+        of a ``describe_log_streams`` entry."""
+        columns = []
+        for key in ("firstEventTimestamp", "lastEventTimestamp"):
+            timestamp = stream.get(key)
+            columns.append("-" if timestamp is None else milis2iso(timestamp))
+        columns.append(str(stream.get("storedBytes", 0)))
+        return columns
 
     def get_groups(self):
         """Returns available CloudWatch logs groups"""
@@ -243,22 +1402,44 @@ class AWSLogs(object):
 
     def get_streams(self, log_group_name=None):
         """Returns available CloudWatch logs streams in ``log_group_name``."""
+        for stream in self.describe_streams(log_group_name):
+            yield stream["logStreamName"]
+
+    def describe_streams(self, log_group_name=None):
+        """Returns the ``describe_log_streams`` entries of the streams in
+        ``log_group_name`` with events in the window.
+
+        With ``latest_first`` the most recently active streams come first,
+        and listing stops at the first one quiet since before the window
+        (give or take ``StreamDiscovery.LAST_EVENT_LAG``, as CloudWatch
+        updates ``lastEventTimestamp`` lazily) instead of going through
+        every stream of the group.
+        """
         kwargs = {"logGroupName": log_group_name or self.log_group_name}
         window_start = self.start or 0
         window_end = self.end or sys.float_info.max
+        if self.latest_first:
+            kwargs.update(orderBy="LastEventTime", descending=True)
+            quiet_before = window_start - StreamDiscovery.LAST_EVENT_LAG
 
         paginator = self.client.get_paginator("describe_log_streams")
         for page in paginator.paginate(**kwargs):
             for stream in page.get("logStreams", []):
+                if self.latest_first:
+                    last = stream.get(
+                        "lastEventTimestamp", stream.get("creationTime", 0)
+                    )
+                    if last < quiet_before:
+                        return
                 if "firstEventTimestamp" not in stream:
                     # This is a specified log stream rather than
                     # a filter on the whole log group, so there's
                     # no firstEventTimestamp.
-                    yield stream["logStreamName"]
+                    yield stream
                 elif max(stream["firstEventTimestamp"], window_start) <= min(
                     stream["lastIngestionTime"], window_end
                 ):
-                    yield stream["logStreamName"]
+                    yield stream
 
     def color(self, text, color):
         """Returns coloured version of ``text`` if ``color_enabled``."""
@@ -270,6 +1451,22 @@ class AWSLogs(object):
         }
         return colored(text, color, **kwargs[self.color_preference])
 
+    def parse_duration(self, duration_text):
+        """Parse ``duration_text`` such as ``30s`` or ``5 minutes`` into
+        milliseconds."""
+        match = re.match(
+            r"^(\d+)\s?(ms|s|sec|second|seconds|m|min|minute|minutes|"
+            r"h|hour|hours|d|day|days|w|week|weeks)$",
+            duration_text.strip(),
+        )
+        if not match:
+            raise exceptions.UnknownDurationError(duration_text)
+        amount, unit = match.groups()
+        if unit == "ms":
+            return int(amount)
+        unit = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}[unit[0]]
+        return int(amount) * unit * 1000
+
     def parse_datetime(self, datetime_text):
         """Parse ``datetime_text`` into a ``datetime``."""
 
@@ -0,0 +1,102 @@
+"""Keeping temporary credentials fresh during long ``--watch`` runs."""
+
+import threading
+
+from botocore.credentials import RefreshableCredentials
+
+# Error codes meaning the credentials a request was signed with expired
+EXPIRED_CODES = frozenset(["ExpiredTokenException", "ExpiredToken"])
+
+
+def client_credentials(client):
+    """Returns the credentials ``client`` signs its requests with."""
+    # botocore has no public way of getting them back from a client; the
+    # signer reads them again for every request, so refreshing this object
+    # is enough for the client to use the new ones.
+    return getattr(client._request_signer, "_credentials", None)
+
+
+def _refresh(credentials, mandatory):
+    """Refreshes ``credentials`` the way botocore does when a request finds
+    them about to expire, holding the same lock."""
+    with credentials._refresh_lock:
+        credentials._protected_refresh(is_mandatory=mandatory)
+
+
+class CredentialRefresher(object):
+    """Refreshes ``credentials`` from a daemon thread ``ahead`` seconds
+    before they expire, until ``closed`` is set.
+
+    botocore refreshes temporary credentials (assumed roles, SSO,
+    ``credential_process``) lazily: the request finding them within 15
+    minutes of expiry calls STS before being sent, and every request waits
+    for it once they're within 10 minutes. Refreshing from another thread
+    instead, with botocore's own windows shrunk to ``FALLBACK_ADVISORY`` and
+    ``FALLBACK_MANDATORY`` so that it only steps in if this thread fell
+    behind, requests keep being signed with valid credentials without ever
+    waiting. Refreshed roles go through the ``JSONFileCache`` set up by
+    ``boto3_client``, so other processes using the profile reuse them.
+
+    Static credentials can't be refreshed, nothing is started for those.
+    """
+
+    AHEAD = 15 * 60
+    INTERVAL = 30
+    FALLBACK_ADVISORY = 5 * 60
+    FALLBACK_MANDATORY = 2 * 60
+
+    def __init__(self, credentials, closed, stats=None, ahead=AHEAD, interval=INTERVAL):
+        self.credentials = credentials
+        self.closed = closed
+        self.stats = stats
+        self.ahead = ahead
+        self.interval = interval
+        self.thread = None
+        if isinstance(credentials, RefreshableCredentials):
+            credentials._advisory_refresh_timeout = min(self.FALLBACK_ADVISORY, ahead)
+            credentials._mandatory_refresh_timeout = min(self.FALLBACK_MANDATORY, ahead)
+            self.thread = threading.Thread(
+                target=self._run, name="awslogs-credentials", daemon=True
+            )
+            self.thread.start()
+
+    def _run(self):
+        while not self.closed.is_set():
+            if self.credentials.refresh_needed(self.ahead):
+                # A failure is logged by botocore, the current credentials
+                # are kept and the next check tries again.
+                _refresh(self.credentials, mandatory=False)
+                if self.stats is not None and not self.credentials.refresh_needed(
+                    self.ahead
+                ):
+                    self.stats.incr("credential refreshes")
+            self.closed.wait(self.interval)
+
+
+def retry_expired(client, stats=None):
+    """Makes ``client`` refresh its credentials and retry a request rejected
+    because they expired, as happens when a laptop wakes up from sleep, if
+    refreshing gets it different credentials."""
+
+    def needs_retry(response=None, attempts=None, **kwargs):
+        if response is None:
+            return None
+        code = response[1].get("Error", {}).get("Code")
+        if code not in EXPIRED_CODES or attempts is None or attempts > 1:
+            return None
+        credentials = client_credentials(client)
+        if not isinstance(credentials, RefreshableCredentials):
+            return None
+        expired = credentials.get_frozen_credentials().access_key
+        try:
+            _refresh(credentials, mandatory=True)
+        except Exception:
+            return None
+        if credentials.get_frozen_credentials().access_key == expired:
+            return None
+        if stats is not None:
+            stats.incr("credential refreshes")
+        # Right away, the request is signed again before being resent
+        return 0
+
+    client.meta.events.register("needs-retry", needs_retry)
@@ -0,0 +1,137 @@
+"""Background discovery of streams appearing while ``--watch`` runs."""
+
+import re
+import threading
+import time
+
+
+class StreamDiscovery(object):
+    """Keeps ``streams``, the streams of ``group`` matching ``pattern``, up
+    to date from a background thread.
+
+    Every ``interval`` seconds it lists the streams of the group by last
+    event time, newest first, and stops as soon as it reaches streams which
+    have been quiet since before it started (minus ``LAST_EVENT_LAG``, since
+    CloudWatch updates ``lastEventTimestamp`` lazily), so a refresh costs a
+    request or two however big the group is. Readers compare ``version``
+    with the one they last saw to find out ``streams`` changed. At most
+    ``max_streams`` are kept, dropping the ones quiet for longest; the last
+    event time of every stream ever seen is remembered, so a stream
+    dropped that way isn't found again on every refresh.
+
+    New streams may hold events older than the newest one read so far,
+    logged between two refreshes or ingested late. ``replay_from`` is when
+    readers should read again from after picking up new streams: the
+    previous refresh, or the first event of a stream created since
+    watching started if older. Streams which existed before are only read
+    again from the previous refresh, their first event may be days old.
+    """
+
+    PAGE_SIZE = 50
+    MAX_PAGES = 10
+    LAST_EVENT_LAG = 60 * 60 * 1000
+
+    def __init__(
+        self,
+        client,
+        group,
+        pattern,
+        streams,
+        interval,
+        closed,
+        max_streams=100,
+        stats=None,
+        on_error=None,
+    ):
+        self.client = client
+        self.group = group
+        self.pattern = re.compile("^{0}".format(pattern))
+        self.streams = list(streams)
+        self.interval = interval
+        self.closed = closed
+        self.max_streams = max_streams
+        self.stats = stats
+        self.on_error = on_error
+        self.version = 0
+        self.max_length = max([len(s) for s in self.streams] or [0])
+        self.since = int(time.time() * 1000) - self.LAST_EVENT_LAG
+        self.started = self.refreshed_at = int(time.time() * 1000)
+        self.replay_from = None
+        self.last_event = dict.fromkeys(self.streams, 0)
+        self._stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, name="awslogs-discovery", daemon=True
+        )
+        self.thread.start()
+
+    def _incr(self, name, n=1):
+        if self.stats is not None:
+            self.stats.incr(name, n)
+
+    def _run(self):
+        while not (self._stopped.wait(self.interval) or self.closed.is_set()):
+            try:
+                self.refresh()
+            except Exception as exc:
+                self._incr("discovery errors")
+                if self.on_error is not None:
+                    self.on_error(exc)
+
+    def recent(self):
+        """Yield ``(name, last event time, first event time)`` of the
+        streams of the group active since ``since``, most recent first."""
+        kwargs = {
+            "logGroupName": self.group,
+            "orderBy": "LastEventTime",
+            "descending": True,
+            "limit": self.PAGE_SIZE,
+        }
+        for _ in range(self.MAX_PAGES):
+            response = self.client.describe_log_streams(**kwargs)
+            self._incr("describe_log_streams")
+            for stream in response.get("logStreams", []):
+                last = stream.get("lastEventTimestamp", stream.get("creationTime", 0))
+                if last < self.since:
+                    return
+                first = stream.get("firstEventTimestamp", stream.get("creationTime"))
+                yield stream["logStreamName"], last, first
+            if "nextToken" not in response:
+                return
+            kwargs["nextToken"] = response["nextToken"]
+
+    def refresh(self):
+        """Looks for new streams, returning the ones added to ``streams``."""
+        started = int(time.time() * 1000)
+        last_event = dict(self.last_event)
+        firsts = {}
+        for name, last, first in self.recent():
+            if not self.pattern.match(name):
+                continue
+            firsts[name] = first
+            last_event[name] = max(last, last_event.get(name, 0))
+        published = set(self.streams)
+        streams = self.streams + [n for n in last_event if n not in published]
+        if len(streams) > self.max_streams:
+            streams = sorted(streams, key=last_event.__getitem__, reverse=True)
+            streams = streams[: self.max_streams]
+        added = [name for name in streams if name not in published]
+        replay_from = self.refreshed_at
+        self.last_event = last_event
+        self.refreshed_at = started
+        if not added:
+            return added
+
+        for name in added:
+            first = firsts.get(name)
+            if first is not None and first >= self.started:
+                replay_from = min(replay_from, first)
+        self.max_length = max(self.max_length, max(len(s) for s in added))
+        # Readers pick up the new list on their next request
+        self.replay_from = replay_from
+        self.streams = streams
+        self.version += 1
+        self._incr("streams discovered", len(added))
+        return added
+
+    def close(self):
+        self._stopped.set()
@@ -0,0 +1,143 @@
+"""Compact event representation and line formatting used by ``list_logs``."""
+
+from collections import namedtuple
+from datetime import datetime
+
+
+def milis2iso(milis):
+    res = datetime.utcfromtimestamp(milis / 1000.0).isoformat()
+    return (res + ".000")[:23] + "Z"
+
+
+class LogEvent(
+    namedtuple(
+        "LogEvent",
+        (
+            "event_id",
+            "timestamp",
+            "ingestion_time",
+            "group",
+            "stream",
+            "message",
+            "target",
+        ),
+        defaults=(None,),
+    )
+):
+    """A CloudWatch event holding only the fields awslogs uses. ``target``
+    is the profile/region it was read from when running against several.
+
+    Backed by a tuple, so building one is a single C-level allocation and
+    instances are much smaller than the dictionaries botocore parses
+    responses into.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_response(cls, event, group, target=None):
+        """Build a ``LogEvent`` out of a ``filter_log_events`` event."""
+        return cls(
+            event["eventId"],
+            event["timestamp"],
+            event["ingestionTime"],
+            group,
+            event["logStreamName"],
+            event["message"],
+            target,
+        )
+
+    def as_dict(self):
+        """Return this event shaped like a ``filter_log_events`` event."""
+        return {
+            "eventId": self.event_id,
+            "timestamp": self.timestamp,
+            "ingestionTime": self.ingestion_time,
+            "logGroupName": self.group,
+            "logStreamName": self.stream,
+            "message": self.message,
+        }
+
+
+class LineFormatter(object):
+    """Builds output lines for ``LogEvent`` with as few intermediate
+    objects as possible.
+
+    Padded and coloured group/stream prefixes are computed once per stream
+    and timestamps are rendered from a per-second cache, so the common case
+    costs a couple of string concatenations per event. With
+    ``grow_streams``, streams longer than ``stream_length`` widen the
+    padding of every stream from then on.
+    """
+
+    def __init__(
+        self,
+        color,
+        group_length,
+        stream_length,
+        output_group_enabled=True,
+        output_stream_enabled=True,
+        output_timestamp_enabled=False,
+        output_ingestion_time_enabled=False,
+        grow_streams=False,
+    ):
+        self.color = color
+        self.group_length = group_length
+        self.stream_length = stream_length
+        self.output_group_enabled = output_group_enabled
+        self.output_stream_enabled = output_stream_enabled
+        self.output_timestamp_enabled = output_timestamp_enabled
+        self.output_ingestion_time_enabled = output_ingestion_time_enabled
+        self.grow_streams = grow_streams
+        self._prefixes = {}
+        # [start escape, end escape, last second, last second as iso]
+        self._timestamp = list(self._color_codes("yellow")) + [None, None]
+        self._ingestion_time = list(self._color_codes("blue")) + [None, None]
+
+    def _color_codes(self, color):
+        """Return the (start, end) escape sequences ``color`` wraps text in."""
+        start, _, end = self.color("\0", color).partition("\0")
+        return start, end
+
+    def _prefix(self, target, group, stream):
+        if self.grow_streams:
+            self.widen_streams(len(stream))
+        output = []
+        if target is not None:
+            output.append(self.color(target, "magenta"))
+        if self.output_group_enabled:
+            output.append(self.color(group.ljust(self.group_length, " "), "green"))
+        if self.output_stream_enabled:
+            output.append(self.color(stream.ljust(self.stream_length, " "), "cyan"))
+        prefix = " ".join(output)
+        if prefix:
+            prefix += " "
+        self._prefixes.setdefault(target, {}).setdefault(group, {})[stream] = prefix
+        return prefix
+
+    def widen_streams(self, stream_length):
+        """Pad stream names to ``stream_length`` from now on if it is more
+        than they are padded to already."""
+        if stream_length > self.stream_length:
+            self.stream_length = stream_length
+            self._prefixes = {}
+
+    @staticmethod
+    def _iso(milis, cache):
+        second, milis = divmod(milis, 1000)
+        if second != cache[2]:
+            cache[2] = second
+            cache[3] = datetime.utcfromtimestamp(second).isoformat()
+        return "{0}{1}.{2:03d}Z{3} ".format(cache[0], cache[3], milis, cache[1])
+
+    def format(self, event, message):
+        """Return the output line for ``event`` showing ``message``."""
+        try:
+            line = self._prefixes[event.target][event.group][event.stream]
+        except KeyError:
+            line = self._prefix(event.target, event.group, event.stream)
+        if self.output_timestamp_enabled:
+            line += self._iso(event.timestamp, self._timestamp)
+        if self.output_ingestion_time_enabled:
+            line += self._iso(event.ingestion_time, self._ingestion_time)
+        return line + message.rstrip()
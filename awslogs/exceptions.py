@@ -35,3 +35,83 @@ class NoStreamsFilteredError(BaseAWSLogsException):
         return (
             f"No streams match your pattern '{self.args[0]}' for the given time period."
         )
+
+
+class EngineNotSupportedError(BaseAWSLogsException):
+
+    code = 8
+
+    def hint(self):
+        return (
+            f"The '{self.args[0]}' engine can't be used together with {self.args[1]}."
+        )
+
+
+class IncompatibleOptionsError(BaseAWSLogsException):
+
+    code = 9
+
+    def hint(self):
+        return f"{self.args[0]} can't be used together with {self.args[1]}."
+
+
+class UnknownDurationError(BaseAWSLogsException):
+
+    code = 10
+
+    def hint(self):
+        return f"awslogs doesn't understand '{self.args[0]}' as a duration."
+
+
+class NotAnArchiveError(BaseAWSLogsException):
+
+    code = 11
+
+    def hint(self):
+        return f"'{self.args[0]}' isn't an archive written by 'awslogs archive'."
+
+
+class MissingOptionError(BaseAWSLogsException):
+
+    code = 12
+
+    def hint(self):
+        return f"{self.args[0]} can only be used together with {self.args[1]}."
+
+
+class UnknownStageError(BaseAWSLogsException):
+
+    code = 13
+
+    def hint(self):
+        return (
+            f"There is no '{self.args[0]}' stage. Stages are registered "
+            "under the 'awslogs.stages' entry point group."
+        )
+
+
+class InvalidPatternError(BaseAWSLogsException):
+
+    code = 14
+
+    def hint(self):
+        return f"'{self.args[0]}' isn't a valid regular expression: {self.args[1]}."
+
+
+class UnknownSinkError(BaseAWSLogsException):
+
+    code = 15
+
+    def hint(self):
+        return f"'{self.args[0]}' isn't a sink awslogs knows, use sqlite:PATH."
+
+
+class InvalidWindowError(BaseAWSLogsException):
+
+    code = 16
+
+    def hint(self):
+        start, end = self.args
+        if start is None or end is None:
+            return "A histogram needs both a start and an end time."
+        return f"The window ends at {end}, before it starts at {start}."
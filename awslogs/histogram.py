@@ -0,0 +1,101 @@
+"""Constant-memory event counts over fixed time buckets."""
+
+from array import array
+
+from . import exceptions
+from .events import milis2iso
+
+
+class Histogram(object):
+    """Counts events per ``bucket`` milliseconds between ``start`` and
+    ``end``, optionally split by a key such as the stream name.
+
+    Counts live in one ``array('q')`` per key, so memory depends on the
+    number of buckets and keys, never on the number of events. Once
+    ``max_keys`` different keys have been seen, new ones are counted
+    under ``OTHER``. With no event at all, a single ``count`` series of
+    zeros is rendered.
+    """
+
+    OTHER = "(other)"
+    BAR = "█"
+
+    def __init__(self, start, end, bucket, max_keys=20):
+        if start is None or end is None or start > end:
+            raise exceptions.InvalidWindowError(
+                None if start is None else milis2iso(start),
+                None if end is None else milis2iso(end),
+            )
+        self.start = start
+        self.bucket = bucket
+        self.size = (end - start) // bucket + 1
+        self.max_keys = max_keys
+        self.counts = {}
+
+    def _counts(self, key):
+        try:
+            return self.counts[key]
+        except KeyError:
+            if len(self.counts) >= self.max_keys and key != self.OTHER:
+                return self._counts(self.OTHER)
+            counts = self.counts[key] = array("q", bytes(8 * self.size))
+            return counts
+
+    def add(self, timestamp, key=None):
+        index = (timestamp - self.start) // self.bucket
+        if 0 <= index < self.size:
+            self._counts(key)[index] += 1
+
+    def add_many(self, timestamps, key=None):
+        """Count every timestamp in ``timestamps`` under the same ``key``."""
+        counts = self._counts(key)
+        start, bucket, size = self.start, self.bucket, self.size
+        for timestamp in timestamps:
+            index = (timestamp - start) // bucket
+            if 0 <= index < size:
+                counts[index] += 1
+
+    def keys(self):
+        """Returns keys sorted by total count, busiest first."""
+        if not self.counts:
+            self._counts(None)
+        return sorted(self.counts, key=lambda k: (-sum(self.counts[k]), str(k)))
+
+    def labels(self):
+        return [milis2iso(self.start + i * self.bucket) for i in range(self.size)]
+
+    def render_csv(self, out):
+        keys = self.keys()
+        if keys == [None]:
+            out.write("bucket,count\n")
+        else:
+            out.write(",".join(["bucket"] + [self._csv(k) for k in keys]) + "\n")
+        columns = [self.counts[k] for k in keys]
+        for i, label in enumerate(self.labels()):
+            out.write(",".join([label] + [str(c[i]) for c in columns]) + "\n")
+
+    @staticmethod
+    def _csv(key):
+        key = str(key)
+        if any(c in key for c in ',"\n'):
+            key = '"{0}"'.format(key.replace('"', '""'))
+        return key
+
+    def render_bars(self, out, width=60, color=lambda text, color: text):
+        """Write one horizontal bar per bucket, in a block per key."""
+        labels = self.labels()
+        keys = self.keys()
+        peak = max(max(c) for c in self.counts.values()) or 1
+        digits = len(str(peak))
+        for n, key in enumerate(keys):
+            if key is not None:
+                if n:
+                    out.write("\n")
+                out.write(color(str(key), "cyan") + "\n")
+            for label, count in zip(labels, self.counts[key]):
+                bar = self.BAR * int(round(count * width / float(peak)))
+                out.write(
+                    "{0} {1} {2}\n".format(
+                        color(label, "yellow"), str(count).rjust(digits), bar
+                    )
+                )
@@ -0,0 +1,128 @@
+"""OpenMetrics exposition of ``Stats`` over HTTP."""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Error codes botocore retries which mean requests are being throttled
+THROTTLING_CODES = frozenset(
+    ["ThrottlingException", "Throttling", "TooManyRequestsException"]
+)
+
+
+def _name(text):
+    return "".join(c if c.isalnum() else "_" for c in text.lower())
+
+
+def _label(value):
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return value.replace("\n", "\\n")
+
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    return "{{{0}}}".format(
+        ",".join('{0}="{1}"'.format(k, _label(v)) for k, v in sorted(labels.items()))
+    )
+
+
+def render(stats):
+    """Returns ``stats`` in the OpenMetrics text format."""
+    counts, timings, events, lags = stats.snapshot()
+    lines = []
+
+    def family(name, kind, help, samples):
+        lines.append("# TYPE {0} {1}".format(name, kind))
+        lines.append("# HELP {0} {1}".format(name, help))
+        for suffix, labels, value in samples:
+            lines.append("{0}{1}{2} {3}".format(name, suffix, labels, value))
+
+    family(
+        "awslogs_events",
+        "counter",
+        "Events read, per group and stream.",
+        [
+            ("_total", _labels(group=group, stream=stream), count)
+            for (group, stream), count in sorted(events.items())
+        ],
+    )
+    family(
+        "awslogs_lag_seconds",
+        "gauge",
+        "Time between the newest event read and when it was read.",
+        [
+            ("", _labels(group=group), lag / 1000.0)
+            for group, (lag, _) in sorted(lags.items())
+        ],
+    )
+    family(
+        "awslogs_ingestion_lag_seconds",
+        "gauge",
+        "Time CloudWatch took to ingest the newest event read.",
+        [
+            ("", _labels(group=group), lag / 1000.0)
+            for group, (_, lag) in sorted(lags.items())
+        ],
+    )
+    for name, (count, total) in sorted(timings.items()):
+        family(
+            "awslogs_{0}_seconds".format(_name(name)),
+            "summary",
+            "Duration of {0} requests.".format(name),
+            [("_count", "", count), ("_sum", "", total)],
+        )
+    counts.setdefault("throttles", 0)
+    counts.setdefault("duplicates dropped", 0)
+    for name, count in sorted(counts.items()):
+        family(
+            "awslogs_{0}".format(_name(name)),
+            "counter",
+            "Number of {0}.".format(name),
+            [("_total", "", count)],
+        )
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer(object):
+    """Serves ``render(stats)`` on every request to ``host``:``port`` from
+    a daemon thread."""
+
+    def __init__(self, stats, port, host=""):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = render(stats).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="awslogs-metrics", daemon=True
+        )
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def count_throttles(client, stats):
+    """Counts in ``stats`` every throttled request ``client`` retries."""
+
+    def needs_retry(response=None, **kwargs):
+        if response is not None:
+            code = response[1].get("Error", {}).get("Code")
+            if code in THROTTLING_CODES:
+                stats.incr("throttles")
+
+    client.meta.events.register("needs-retry", needs_retry)
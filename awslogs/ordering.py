@@ -0,0 +1,130 @@
+"""Ordering of events read from several sources concurrently."""
+
+import heapq
+import pickle
+import tempfile
+from itertools import count
+from operator import attrgetter
+
+# Rough memory taken by a buffered ``LogEvent`` on top of its message.
+EVENT_OVERHEAD = 250
+
+
+def event_size(event):
+    return len(event.message) + EVENT_OVERHEAD
+
+
+class _Run(object):
+    """A sorted run of ``(key, seq, item)`` entries spilled to a temporary
+    file, read back a chunk at a time."""
+
+    def __init__(self, file):
+        self.file = file
+        self.chunk = iter(())
+
+    def __next__(self):
+        while True:
+            for item in self.chunk:
+                return item
+            try:
+                self.chunk = iter(pickle.load(self.file))
+            except EOFError:
+                self.close()
+                raise StopIteration
+
+    def close(self):
+        self.file.close()
+
+
+class ExternalSorter(object):
+    """Sorts any amount of items with bounded memory.
+
+    Items are kept in a heap until their total ``size`` reaches
+    ``max_memory``; then the heap is written to a temporary file as a
+    sorted run. ``pop(until)`` yields, in ``key`` order, every item not
+    greater than ``until`` from a k-way merge of the heap and the runs, so
+    when the inputs are roughly in order items go through without ever
+    being spilled.
+    """
+
+    CHUNK_SIZE = 1000
+
+    def __init__(
+        self,
+        key=attrgetter("timestamp"),
+        max_memory=256 * 1024 * 1024,
+        size=event_size,
+        directory=None,
+    ):
+        self.key = key
+        self.max_memory = max_memory
+        self.size = size
+        self.directory = directory
+        self.memory = 0
+        self.heap = []
+        # Heads of the spilled runs, as (key, seq, item, run)
+        self.heads = []
+        self.runs = 0
+        self.spilled = 0
+        self._seq = count()
+
+    def add(self, item):
+        heapq.heappush(self.heap, (self.key(item), next(self._seq), item))
+        self.memory += self.size(item)
+        if self.memory >= self.max_memory:
+            self._spill()
+
+    def add_many(self, items):
+        for item in items:
+            self.add(item)
+
+    def _spill(self):
+        file = tempfile.TemporaryFile(prefix="awslogs-", dir=self.directory)
+        heap, chunk = self.heap, []
+        while heap:
+            chunk.append(heapq.heappop(heap))
+            if len(chunk) == self.CHUNK_SIZE:
+                pickle.dump(chunk, file, pickle.HIGHEST_PROTOCOL)
+                self.spilled += len(chunk)
+                chunk = []
+        if chunk:
+            pickle.dump(chunk, file, pickle.HIGHEST_PROTOCOL)
+            self.spilled += len(chunk)
+        file.seek(0)
+        self.memory = 0
+        self.runs += 1
+        self._advance(_Run(file))
+
+    def _advance(self, run):
+        try:
+            key, seq, item = next(run)
+        except StopIteration:
+            return
+        heapq.heappush(self.heads, (key, seq, item, run))
+
+    def pop(self, until=None):
+        """Yield items in order up to (and including) key ``until``, or
+        every item left if it is None."""
+        heap, heads = self.heap, self.heads
+        while heap or heads:
+            if heads and (not heap or heads[0][:2] < heap[0][:2]):
+                key, _, item, run = heads[0]
+                if until is not None and key > until:
+                    return
+                heapq.heappop(heads)
+                self._advance(run)
+            else:
+                key, _, item = heap[0]
+                if until is not None and key > until:
+                    return
+                heapq.heappop(heap)
+                self.memory -= self.size(item)
+            yield item
+
+    def close(self):
+        """Discard whatever is left, removing the spilled runs."""
+        for _, _, _, run in self.heads:
+            run.close()
+        self.heads = []
+        self.heap = []
+        self.memory = 0
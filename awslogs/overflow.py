@@ -0,0 +1,241 @@
+"""Reading events ahead of a slow consumer in watch mode."""
+
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+from .prefetch import POLL_INTERVAL
+
+BLOCK = "block"
+DROP_OLDEST = "drop-oldest"
+SAMPLE = "sample"
+SPILL = "spill"
+
+POLICIES = (BLOCK, DROP_OLDEST, SAMPLE, SPILL)
+
+_DONE = object()
+
+
+def status_stream(err, out=None):
+    """Returns ``err`` if a status line can be rewritten on it, or None.
+
+    That takes a terminal, other than ``out``, the one events are printed
+    to if any: the status line is written from the reading thread and
+    would otherwise land in the middle of events being printed.
+    """
+    if not err.isatty():
+        return None
+    if out is not None and out.isatty():
+        try:
+            if os.path.samestat(os.fstat(out.fileno()), os.fstat(err.fileno())):
+                return None
+        except (OSError, ValueError):
+            return None
+    return err
+
+
+class OverflowBuffer(object):
+    """Reads pages of events from ``pages`` on a background thread into a
+    buffer of up to ``capacity`` events, which the caller iterates over a
+    page at a time.
+
+    Polling CloudWatch never waits for the caller unless ``policy`` says
+    so. When the buffer is full:
+
+    * ``block`` makes the reader wait for room, as reading without a
+      buffer would;
+    * ``drop-oldest`` drops the oldest buffered events;
+    * ``sample`` drops every other buffered event and from then on only
+      keeps one event in ``stride`` read, ``stride`` doubling every time
+      the buffer fills up again and going back to one once it drained;
+    * ``spill`` writes pages to a temporary file, read back in order once
+      the buffer drained.
+
+    With ``status_out``, a status line showing how far behind the caller is
+    and how many events were dropped is rewritten on it every
+    ``STATUS_INTERVAL`` seconds, see ``status_stream()``.
+    """
+
+    POLL_INTERVAL = POLL_INTERVAL
+    STATUS_INTERVAL = 1.0
+
+    def __init__(
+        self,
+        pages,
+        policy=BLOCK,
+        capacity=50000,
+        stats=None,
+        status_out=None,
+        clock=time.time,
+    ):
+        self.policy = policy
+        self.capacity = max(capacity, 1)
+        self.stats = stats
+        self.status_out = status_out
+        self.clock = clock
+        self.buffer = deque()
+        self.dropped = 0
+        self.stride = 1
+        self._phase = 0
+        # Spilled pages are read back from read_at until write_at
+        self.spill = None
+        self.spilled = 0
+        self._read_at = self._write_at = 0
+        # Newest timestamp handed out, to tell how far behind the caller is
+        self.newest = None
+        self._status_at = 0
+        self._done = None
+        self._cond = threading.Condition()
+        self.closed = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, args=(pages,), name="awslogs-overflow", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self, pages):
+        iterator = iter(pages)
+        done = _DONE
+        try:
+            for page in iterator:
+                with self._cond:
+                    if self.closed.is_set():
+                        break
+                    self._add(list(page))
+                    self._cond.notify_all()
+                self._show_status()
+        except Exception as exc:
+            done = exc
+        finally:
+            with self._cond:
+                self._done = done
+                self._cond.notify_all()
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def _drop(self, n):
+        self.dropped += n
+        if self.stats is not None:
+            self.stats.incr("events dropped", n)
+
+    def _add(self, page):
+        buffer = self.buffer
+        if self.policy == BLOCK:
+            while buffer and len(buffer) + len(page) > self.capacity:
+                if self.closed.is_set():
+                    return
+                self._cond.wait(self.POLL_INTERVAL)
+        elif self.policy == SPILL:
+            if self.spilled or len(buffer) + len(page) > self.capacity:
+                self._spill(page)
+                return
+        elif self.policy == SAMPLE:
+            if self.stride > 1:
+                kept = page[self._phase :: self.stride]
+                self._phase = (self._phase - len(page)) % self.stride
+                self._drop(len(page) - len(kept))
+                page = kept
+            if len(buffer) + len(page) > self.capacity:
+                kept = deque(islice(buffer, 0, None, 2))
+                self._drop(len(buffer) - len(kept))
+                self.buffer = buffer = kept
+                self.stride *= 2
+        buffer.extend(page)
+        if self.policy != BLOCK and len(buffer) > self.capacity:
+            # A single page bigger than the buffer, or dropping oldest
+            overflow = len(buffer) - self.capacity
+            for _ in range(overflow):
+                buffer.popleft()
+            self._drop(overflow)
+
+    def _spill(self, page):
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile(prefix="awslogs-")
+        self.spill.seek(self._write_at)
+        pickle.dump(page, self.spill, pickle.HIGHEST_PROTOCOL)
+        self._write_at = self.spill.tell()
+        self.spilled += len(page)
+
+    def _unspill(self):
+        self.spill.seek(self._read_at)
+        page = pickle.load(self.spill)
+        self._read_at = self.spill.tell()
+        self.spilled -= len(page)
+        if self._read_at == self._write_at:
+            self.spill.seek(0)
+            self.spill.truncate()
+            self._read_at = self._write_at = 0
+        return page
+
+    def _take(self):
+        if self.buffer:
+            page = list(self.buffer)
+            self.buffer.clear()
+        elif self.spilled:
+            page = self._unspill()
+        else:
+            return None
+        if not self.buffer:
+            self.stride, self._phase = 1, 0
+        return page
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._cond:
+            while True:
+                page = self._take()
+                if page is not None:
+                    self._cond.notify_all()
+                    break
+                if self._done is not None or self.closed.is_set():
+                    done, self._done = self._done, _DONE
+                    if isinstance(done, Exception):
+                        raise done
+                    raise StopIteration
+                self._cond.wait(self.POLL_INTERVAL)
+        if page:
+            self.newest = max(self.newest or 0, max(e.timestamp for e in page))
+        return page
+
+    def lag(self):
+        """Seconds between now and the newest event handed out."""
+        if self.newest is None:
+            return 0.0
+        return max(self.clock() - self.newest / 1000.0, 0.0)
+
+    def status(self):
+        with self._cond:
+            buffered, spilled, dropped = len(self.buffer), self.spilled, self.dropped
+        status = "{0:.1f}s behind, {1} buffered".format(self.lag(), buffered)
+        if self.policy == SPILL:
+            status += ", {0} spilled".format(spilled)
+        return status + ", {0} dropped".format(dropped)
+
+    def _show_status(self):
+        if self.status_out is None:
+            return
+        now = time.monotonic()
+        if now - self._status_at >= self.STATUS_INTERVAL:
+            self._status_at = now
+            self.status_out.write("\r\033[K" + self.status())
+            self.status_out.flush()
+
+    def close(self):
+        """Stop reading and drop whatever was read ahead."""
+        self.closed.set()
+        with self._cond:
+            self.buffer.clear()
+            if self.spill is not None:
+                self.spill.close()
+                self.spill = None
+                self.spilled = 0
+            self._cond.notify_all()
+        if self.status_out is not None and self._status_at:
+            self.status_out.write("\n")
+            self.status_out.flush()
@@ -0,0 +1,319 @@
+"""Page-at-a-time processing of events.
+
+``list_logs`` pushes every page of events it reads through a ``Pipeline``
+of stages. A stage gets a whole page (a list) and returns the page the
+next stage should get, so per-call overhead is paid once per page rather
+than once per event. Stages before ``format`` see ``LogEvent`` and stages
+after it see output lines.
+
+Extra stages can be shipped as separate packages: register a factory
+taking the ``AWSLogs`` instance and returning a ``Stage`` under the
+``awslogs.stages`` entry point group::
+
+    [options.entry_points]
+    awslogs.stages =
+        geoip = mypackage.stages:GeoIPStage
+
+and run it with ``awslogs get ... --stage geoip``. Stages given with
+``--stage`` run in that order, before ``query`` and ``format``.
+"""
+
+import json
+import re
+import sys
+from bisect import bisect_right
+from itertools import accumulate, repeat
+from operator import add
+from importlib.metadata import entry_points
+
+from . import exceptions
+from .archive import required_literals
+
+ENTRY_POINT_GROUP = "awslogs.stages"
+
+
+class Stage(object):
+    """A step of a ``Pipeline``. Subclasses override ``process``; any
+    object with ``process`` and ``close`` methods and a ``name`` will do
+    too."""
+
+    #: Name shown in profiles
+    name = "stage"
+    #: Set once no further page needs reading, which stops the pipeline
+    done = False
+
+    def process(self, page):
+        """Returns what's left of ``page`` (a list) after this stage. An
+        empty list stops the page there."""
+        return page
+
+    def close(self):
+        """Called once the last page went through."""
+
+
+def compile_patterns(patterns):
+    """Returns a regex matching any of ``patterns``, or ``None`` if there
+    are none. ``^`` and ``$`` match at line boundaries, as with grep."""
+    if not patterns:
+        return None
+    for pattern in patterns:
+        try:
+            re.compile(pattern)
+        except re.error as exc:
+            raise exceptions.InvalidPatternError(pattern, exc)
+    if len(patterns) > 1:
+        patterns = ["|".join("(?:{0})".format(pattern) for pattern in patterns)]
+    return re.compile(patterns[0], re.MULTILINE)
+
+
+def _locator(buffer, messages):
+    """Returns a function mapping an offset of ``buffer``, ``messages``
+    joined by newlines, to the index of the message it falls in and the
+    offset that message ends at. Offsets must be asked for in order."""
+    if buffer.count("\n") == len(messages) - 1:
+        # The nth newline ends the nth message
+        state = [0, 0]  # message, offset newlines were counted up to
+
+        def locate(position):
+            state[0] += buffer.count("\n", state[1], position)
+            state[1] = position
+            end = buffer.find("\n", position)
+            return state[0], len(buffer) if end < 0 else end
+
+    else:
+        starts = list(accumulate(map(add, map(len, messages), repeat(1)), initial=0))
+
+        def locate(position):
+            n = bisect_right(starts, position) - 1
+            return n, starts[n + 1] - 1
+
+    return locate
+
+
+def matching(regex, literal, messages):
+    """Yields the index of every message ``regex`` matches, ``literal``
+    being a string every match contains.
+
+    Rather than searching every message on its own, the messages are joined
+    by newlines and scanned for ``literal`` with ``str.find``, so stretches
+    without it are skipped without going back to Python. A hit is mapped
+    back to its message by counting the newlines before it (or, if some
+    message spans several lines, with a bisect on the message offsets), only
+    that message is searched with ``regex`` and the scan resumes at the next
+    message.
+    """
+    buffer = "\n".join(messages)
+    find = buffer.find
+    position = find(literal)
+    if position < 0:
+        return
+    search = regex.search
+    last = len(messages) - 1
+    locate = _locator(buffer, messages)
+    while position >= 0:
+        n, end = locate(position)
+        if search(messages[n]) is not None:
+            yield n
+        if n == last:
+            return
+        position = find(literal, end + 1)
+
+
+class _Matcher(object):
+    """Finds the events of a page whose message ``regex`` matches.
+
+    Pages are scanned with ``matching`` when every match contains some
+    literal (other than a prefix of the pattern), unless many events
+    matched on the previous page. Otherwise
+    every message is searched on its own: a regex scanning a joined page
+    gets nothing done faster than it does one message at a time, and with
+    many hits mapping them back to their message costs more than the
+    searches it saves.
+    """
+
+    #: Share of matching events above which pages are searched event by
+    #: event
+    DENSE = 1 / 16.0
+
+    def __init__(self, regex):
+        self.regex = regex
+        literals = [
+            literal.decode("utf-8")
+            for literal in required_literals(regex)
+            if b"\n" not in literal
+        ]
+        self.literal = max(literals, key=len) if literals else None
+        if self.literal is not None and regex.pattern.startswith(self.literal):
+            # re skips to a literal prefix as fast as str.find does
+            self.literal = None
+        self.dense = False
+
+    def select(self, page, keep=True):
+        """Returns the events of ``page`` which match, or with ``keep``
+        false the ones which don't."""
+        if self.literal is None or self.dense:
+            search = self.regex.search
+            if keep:
+                selected = [event for event in page if search(event.message)]
+                hits = len(selected)
+            else:
+                selected = [event for event in page if not search(event.message)]
+                hits = len(page) - len(selected)
+        else:
+            messages = [event.message for event in page]
+            found = list(matching(self.regex, self.literal, messages))
+            hits = len(found)
+            if keep:
+                selected = [page[n] for n in found]
+            else:
+                selected, previous = [], 0
+                for n in found:
+                    selected.extend(page[previous:n])
+                    previous = n + 1
+                selected.extend(page[previous:])
+        self.dense = hits > len(page) * self.DENSE
+        return selected
+
+
+class GrepStage(Stage):
+    """Keeps events whose message matches any of ``patterns`` and none of
+    ``exclude``, like piping the output through ``grep -E`` but before
+    spending any time formatting events which are dropped."""
+
+    name = "grep"
+
+    def __init__(self, patterns=(), exclude=()):
+        regex = compile_patterns(patterns)
+        exclude = compile_patterns(exclude)
+        self.matching = None if regex is None else _Matcher(regex)
+        self.excluded = None if exclude is None else _Matcher(exclude)
+
+    def process(self, page):
+        if self.matching is not None:
+            page = self.matching.select(page)
+        if self.excluded is not None and page:
+            page = self.excluded.select(page, keep=False)
+        return page
+
+
+class QueryStage(Stage):
+    """Replaces JSON messages by what the compiled JMESPath ``expression``
+    extracts from them."""
+
+    name = "query"
+
+    def __init__(self, expression):
+        self.expression = expression
+
+    def process(self, page):
+        search = self.expression.search
+        for n, event in enumerate(page):
+            message = event.message
+            if message[:1] == "{":
+                message = search(json.loads(message))
+                if not isinstance(message, str):
+                    message = json.dumps(message)
+                page[n] = event._replace(message=message)
+        return page
+
+
+class LimitStage(Stage):
+    """Lets the first ``limit`` events through, then stops the pipeline.
+    Running after the stages filtering events, it counts the events left
+    rather than the ones read."""
+
+    name = "limit"
+
+    def __init__(self, limit):
+        self.remaining = limit
+
+    @property
+    def done(self):
+        return self.remaining <= 0
+
+    def process(self, page):
+        page = page[: max(self.remaining, 0)]
+        self.remaining -= len(page)
+        return page
+
+
+class FormatStage(Stage):
+    """Turns events into output lines with a ``LineFormatter``."""
+
+    name = "format"
+
+    def __init__(self, formatter):
+        self.formatter = formatter
+
+    def process(self, page):
+        format = self.formatter.format
+        return [format(event, event.message) for event in page]
+
+
+class WriteStage(Stage):
+    """Writes lines to ``out`` (standard output by default) and flushes it
+    once per page."""
+
+    name = "write"
+
+    def __init__(self, out=None):
+        self.out = out
+
+    def process(self, page):
+        out = self.out or sys.stdout
+        out.write("\n".join(page))
+        out.write("\n")
+        out.flush()
+        return page
+
+
+class Pipeline(object):
+    """Runs pages through ``stages`` in order, timing every stage with
+    ``profiler``."""
+
+    def __init__(self, stages, profiler=None):
+        self.stages = list(stages)
+        self.profiler = profiler
+
+    def process(self, page):
+        for stage in self.stages:
+            if not page:
+                break
+            if self.profiler is None:
+                page = stage.process(page)
+            else:
+                with self.profiler.span(stage.name):
+                    page = stage.process(page)
+        return page
+
+    def run(self, pages):
+        try:
+            for page in pages:
+                # Stages may change the page in place
+                self.process(list(page))
+                if any(getattr(stage, "done", False) for stage in self.stages):
+                    # Cancels whatever is still being read
+                    close = getattr(pages, "close", None)
+                    if close is not None:
+                        close()
+                    break
+        finally:
+            for stage in self.stages:
+                stage.close()
+
+
+def _entry_points():
+    found = entry_points()
+    if hasattr(found, "select"):
+        return found.select(group=ENTRY_POINT_GROUP)
+    # Python < 3.10
+    return found.get(ENTRY_POINT_GROUP, [])
+
+
+def load_stage(name, logs):
+    """Returns the stage registered as ``name``, built for the ``AWSLogs``
+    instance ``logs``."""
+    for entry_point in _entry_points():
+        if entry_point.name == name:
+            return entry_point.load()(logs)
+    raise exceptions.UnknownStageError(name)
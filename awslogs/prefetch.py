@@ -0,0 +1,130 @@
+"""Read-ahead of blocking iterators on a background thread."""
+
+import queue
+import threading
+from collections import deque
+
+_DONE = object()
+
+# Seconds after which waits on other threads time out and start over, so
+# that signals such as Ctrl-C are delivered on every platform.
+POLL_INTERVAL = 0.1
+
+
+class _Error(object):
+
+    __slots__ = ("exc",)
+
+    def __init__(self, exc):
+        self.exc = exc
+
+
+class Prefetcher(object):
+    """Consume ``iterable`` on a background thread keeping up to ``depth``
+    items ready for the caller.
+
+    The worker blocks once ``depth`` items are waiting, so memory stays
+    bounded however slow the caller is. Exceptions raised by ``iterable``
+    are re-raised to the caller. ``close()`` stops the worker at the next
+    item boundary; since the worker is a daemon thread, a request still in
+    flight never keeps the process alive.
+    """
+
+    POLL_INTERVAL = POLL_INTERVAL
+
+    def __init__(self, iterable, depth=1, name="awslogs-prefetch"):
+        self._start([iterable], depth, name)
+        self.thread = self.threads[0]
+
+    def _start(self, iterables, depth, name):
+        self.queue = queue.Queue(maxsize=max(depth, 1))
+        self.closed = threading.Event()
+        self.running = len(iterables)
+        self.threads = [
+            threading.Thread(target=self._run, args=(it,), name=name, daemon=True)
+            for it in iterables
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _put(self, item):
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=self.POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self, iterable):
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not self._put(item):
+                    break
+            else:
+                self._put(_DONE)
+        except Exception as exc:
+            self._put(_Error(exc))
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self.closed.is_set():
+            try:
+                item = self.queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+            if item is _DONE:
+                self.running -= 1
+                if not self.running:
+                    self.closed.set()
+                continue
+            if isinstance(item, _Error):
+                self.closed.set()
+                raise item.exc
+            return item
+        raise StopIteration
+
+    def close(self):
+        """Stop the worker and drop whatever it had read ahead."""
+        self.closed.set()
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+
+class Interleaver(Prefetcher):
+    """Consume each of ``iterables`` on its own background thread and yield
+    their items in the order they arrive, so a slow iterable never holds
+    back the others. Up to ``depth`` items are kept ready in total.
+
+    With ``workers``, at most that many threads are started, each taking
+    the next iterable nobody consumes yet once it's done with one.
+    """
+
+    def __init__(self, iterables, depth=1, name="awslogs-interleave", workers=None):
+        iterables = list(iterables)
+        if not iterables:
+            iterables = [()]
+        if workers is not None and workers < len(iterables):
+            pending = deque(iterables)
+
+            def drain():
+                while True:
+                    try:
+                        iterable = pending.popleft()
+                    except IndexError:
+                        return
+                    yield from iterable
+
+            iterables = [drain() for _ in range(max(workers, 1))]
+        self._start(iterables, depth, name)
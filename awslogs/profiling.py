@@ -0,0 +1,117 @@
+"""Named timing spans used to profile ``awslogs get`` runs.
+
+Spans are accumulated in memory as self-time per stack and written in the
+collapsed stack format (``frame;frame;frame value``) understood by
+``flamegraph.pl``, inferno and speedscope. Values are microseconds.
+"""
+
+import threading
+import time
+
+
+class _NullSpan(object):
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class NullProfiler(object):
+    """Profiler used when profiling is disabled. Every span is the same
+    shared no-op context manager, so hooks can stay in the hot loop."""
+
+    enabled = False
+
+    def span(self, name):
+        return NULL_SPAN
+
+    def dump(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class _Span(object):
+
+    __slots__ = ("profiler", "name")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._push(self.name)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler._pop()
+        return False
+
+
+class Profiler(object):
+    """Deterministic profiler built out of nested, named timing spans.
+
+    Each thread keeps its own stack of open spans. When a span is closed
+    its self time (total time minus the time spent in child spans) is
+    added to the collapsed stack it belongs to.
+    """
+
+    enabled = True
+
+    def __init__(self, path, root="awslogs"):
+        self.path = path
+        self.root = root
+        self.samples = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def _frames(self):
+        try:
+            return self._local.frames
+        except AttributeError:
+            thread = threading.current_thread()
+            if thread is threading.main_thread():
+                base = (self.root,)
+            else:
+                base = (self.root, thread.name)
+            # Each frame is [stack, started_at, children_time]
+            self._local.frames = frames = [[base, None, 0]]
+            return frames
+
+    def _push(self, name):
+        frames = self._frames()
+        frames.append([frames[-1][0] + (name,), time.perf_counter_ns(), 0])
+
+    def _pop(self):
+        frames = self._frames()
+        stack, started_at, children = frames.pop()
+        elapsed = time.perf_counter_ns() - started_at
+        frames[-1][2] += elapsed
+        key = ";".join(stack)
+        with self._lock:
+            self.samples[key] = self.samples.get(key, 0) + elapsed - children
+
+    def dump(self):
+        """Close any span still open in this thread and write the samples
+        to ``path``."""
+        frames = self._frames()
+        while len(frames) > 1:
+            self._pop()
+
+        with self._lock:
+            samples = sorted(self.samples.items())
+
+        with open(self.path, "w") as f:
+            for stack, nanoseconds in samples:
+                f.write("{0} {1}\n".format(stack, nanoseconds // 1000))
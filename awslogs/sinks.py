@@ -0,0 +1,344 @@
+"""Output destinations other than standard output."""
+
+import gzip
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import quote
+
+from . import exceptions
+from .pipeline import Stage
+
+_DONE = object()
+
+
+class _Writer(object):
+    """Appends chunks to files on a background thread, keeping at most
+    ``max_open`` of them open and closing the least recently used one when
+    it needs another."""
+
+    def __init__(self, sink, max_open, name):
+        self.sink = sink
+        self.max_open = max(max_open, 1)
+        self.handles = OrderedDict()
+        self.created = set()
+        self.error = None
+        self.queue = queue.Queue(maxsize=sink.queue_size)
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _handle(self, path):
+        handle = self.handles.get(path)
+        if handle is not None:
+            self.handles.move_to_end(path)
+            return handle
+        if len(self.handles) >= self.max_open:
+            _, oldest = self.handles.popitem(last=False)
+            oldest.close()
+        # Files are truncated the first time they are opened, reopening a
+        # file closed to stay under max_open appends to it.
+        mode = "ab" if path in self.created else "wb"
+        if path not in self.created:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.created.add(path)
+        if self.sink.compress:
+            # Every reopen adds a gzip member, which gzip readers concatenate
+            handle = gzip.open(path, mode, compresslevel=self.sink.compresslevel)
+        else:
+            handle = open(path, mode)
+        self.handles[path] = handle
+        return handle
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                break
+            if self.error is not None:
+                continue
+            path, data = item
+            try:
+                self._handle(path).write(data)
+            except Exception as exc:
+                self.error = exc
+        for handle in self.handles.values():
+            try:
+                handle.close()
+            except Exception as exc:
+                self.error = self.error or exc
+        self.handles.clear()
+
+    def put(self, path, data):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((path, data))
+
+    def close(self):
+        self.queue.put(_DONE)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class StreamFiles(object):
+    """Writes lines to one file per stream inside ``directory``.
+
+    Lines are buffered per stream and handed over ``buffer_size`` bytes at
+    a time (or all at once when ``max_buffered`` bytes are waiting) to one
+    of ``workers`` background writers, always the same for a given stream
+    so its lines stay in order. Between them, writers keep
+    at most ``max_open`` files open, so any number of streams can be
+    written without running out of file descriptors. With ``compress``
+    files are gzipped.
+    """
+
+    EXTENSION = ".log"
+
+    def __init__(
+        self,
+        directory,
+        compress=False,
+        max_open=64,
+        workers=4,
+        buffer_size=64 * 1024,
+        max_buffered=16 * 1024 * 1024,
+        queue_size=64,
+        compresslevel=6,
+    ):
+        self.directory = directory
+        self.compress = compress
+        self.compresslevel = compresslevel
+        self.buffer_size = buffer_size
+        self.max_buffered = max_buffered
+        self.buffered = 0
+        self.queue_size = queue_size
+        self.buffers = {}
+        self.sizes = {}
+        self.paths = {}
+        workers = max(min(workers, max_open), 1)
+        self.writers = [
+            _Writer(self, max_open // workers, "awslogs-sink-{0}".format(n))
+            for n in range(workers)
+        ]
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name):
+        """Returns the file lines of stream ``name`` are written to."""
+        path = self.paths.get(name)
+        if path is None:
+            filename = quote(name, safe=" []$@=+,-_") + self.EXTENSION
+            if self.compress:
+                filename += ".gz"
+            path = self.paths[name] = os.path.join(self.directory, filename)
+        return path
+
+    def write(self, name, line):
+        buffer = self.buffers.get(name)
+        if buffer is None:
+            buffer = self.buffers[name] = []
+            self.sizes[name] = 0
+        buffer.append(line)
+        self.sizes[name] += len(line)
+        self.buffered += len(line)
+        if self.sizes[name] >= self.buffer_size:
+            self._flush(name)
+        elif self.buffered >= self.max_buffered:
+            self.flush()
+
+    def _flush(self, name):
+        data = "".join(self.buffers.pop(name)).encode("utf-8")
+        self.buffered -= self.sizes.pop(name)
+        path = self.path(name)
+        writer = self.writers[zlib.crc32(path.encode("utf-8")) % len(self.writers)]
+        writer.put(path, data)
+
+    def flush(self):
+        """Hand whatever is buffered over to the writers."""
+        for name in list(self.buffers):
+            self._flush(name)
+
+    def close(self):
+        """Write whatever is still buffered and wait for the writers."""
+        self.flush()
+        errors = []
+        for writer in self.writers:
+            try:
+                writer.close()
+            except Exception as exc:
+                errors.append(exc)
+        if errors:
+            raise errors[0]
+
+
+class SQLiteSink(Stage):
+    """A last pipeline stage inserting events into the ``events`` table of
+    the SQLite database at ``path``, created if needed.
+
+    Rows are inserted with ``executemany`` a page at a time, inside
+    transactions committed every ``transaction_rows`` rows or
+    ``commit_interval`` seconds, whichever comes first, in WAL mode so the
+    database can be queried while it's being loaded. Rows still
+    uncommitted after ``commit_interval`` seconds because no page came
+    since are committed from a daemon thread, so they show up while
+    watching a quiet group too. The secondary indexes are only built once
+    loading is over, which is much faster than updating them row by row,
+    and kept when appending to the database later.
+
+    Events are keyed by their id (events read without one, from an archive
+    or with ``get_log_events``, by their stream, timestamp and message) and
+    inserted with ``INSERT OR IGNORE``, so loading overlapping windows
+    never duplicates rows. With ``query`` (a compiled JMESPath expression)
+    what it extracts from JSON messages goes to the ``query`` column as
+    JSON, next to the whole message.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (
+            event_id TEXT PRIMARY KEY,
+            timestamp INTEGER NOT NULL,
+            ingestion_time INTEGER,
+            log_group TEXT NOT NULL,
+            log_stream TEXT NOT NULL,
+            message TEXT NOT NULL,
+            query TEXT
+        )
+    """
+    INDEXES = (
+        "CREATE INDEX IF NOT EXISTS events_timestamp ON events (timestamp)",
+        "CREATE INDEX IF NOT EXISTS events_group_timestamp "
+        "ON events (log_group, timestamp)",
+        "CREATE INDEX IF NOT EXISTS events_stream_timestamp "
+        "ON events (log_group, log_stream, timestamp)",
+    )
+    INSERT = "INSERT OR IGNORE INTO events VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+    def __init__(self, path, query=None, transaction_rows=200000, commit_interval=5.0):
+        self.path = path
+        self.query = query
+        self.transaction_rows = transaction_rows
+        self.commit_interval = commit_interval
+        self.inserted = 0
+        self._pending = 0
+        self._committed_at = time.monotonic()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Transactions are begun explicitly, so they span many executemany.
+        # The connection is shared with the flusher, under _lock.
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        # Durable once the WAL is checkpointed, safe from corruption anyway
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.execute("PRAGMA cache_size = -65536")
+        self.db.execute(self.SCHEMA)
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush, name="awslogs-sqlite", daemon=True
+        )
+        self._flusher.start()
+
+    def resume_from(self, group):
+        """Returns the newest timestamp stored for ``group``, or None, for
+        a later run to start from."""
+        row = self.db.execute(
+            "SELECT max(timestamp) FROM events WHERE log_group = ?", (group,)
+        ).fetchone()
+        return row[0]
+
+    def _rows(self, page):
+        search = None if self.query is None else self.query.search
+        for event in page:
+            message = event.message
+            event_id = event.event_id
+            if event_id is None:
+                digest = hashlib.blake2b(
+                    message.encode("utf-8"), digest_size=8
+                ).hexdigest()
+                event_id = "{0}/{1}/{2}".format(event.stream, event.timestamp, digest)
+            extracted = None
+            if search is not None and message[:1] == "{":
+                try:
+                    extracted = search(json.loads(message))
+                except ValueError:
+                    pass  # Not JSON after all, stored without a query
+                if extracted is not None:
+                    extracted = json.dumps(extracted)
+            yield (
+                event_id,
+                event.timestamp,
+                event.ingestion_time,
+                event.group,
+                event.stream,
+                message,
+                extracted,
+            )
+
+    def process(self, page):
+        rows = list(self._rows(page))
+        with self._lock:
+            db = self.db
+            if not db.in_transaction:
+                db.execute("BEGIN")
+            before = db.total_changes
+            db.executemany(self.INSERT, rows)
+            self.inserted += db.total_changes - before
+            self._pending += len(page)
+            if (
+                self._pending >= self.transaction_rows
+                or time.monotonic() - self._committed_at >= self.commit_interval
+            ):
+                self._commit()
+        return page
+
+    def _flush(self):
+        while not self._closed.wait(self.commit_interval):
+            with self._lock:
+                if (
+                    self.db is not None
+                    and self._pending
+                    and time.monotonic() - self._committed_at >= self.commit_interval
+                ):
+                    self._commit()
+
+    def _commit(self):
+        if self.db.in_transaction:
+            self.db.execute("COMMIT")
+        self._pending = 0
+        self._committed_at = time.monotonic()
+
+    def close(self):
+        """Commits what's left and builds the indexes."""
+        if self.db is None:
+            return
+        self._closed.set()
+        self._flusher.join()
+        try:
+            self._commit()
+            for index in self.INDEXES:
+                self.db.execute(index)
+        finally:
+            self.db.close()
+            self.db = None
+
+
+SINKS = {"sqlite": SQLiteSink}
+
+
+def open_sink(spec, query=None):
+    """Returns the sink ``spec`` (``KIND:PATH``, e.g. ``sqlite:logs.db``)
+    names."""
+    kind, _, path = spec.partition(":")
+    if kind not in SINKS or not path:
+        raise exceptions.UnknownSinkError(spec)
+    return SINKS[kind](path, query=query)
@@ -0,0 +1,83 @@
+"""Counters of what an ``AWSLogs`` run did, reported with ``--stats`` and
+served by ``--metrics-port``."""
+
+import threading
+import time
+from collections import Counter
+
+
+class Stats(object):
+    """Thread-safe named counters, reported with their rate since the
+    instance was created.
+
+    Request timings are kept as ``(count, total seconds)`` summaries. With
+    ``track_events``, ``observe_events`` also counts events per group and
+    stream and keeps the lag of the newest event of every group, taking the
+    lock once per page.
+    """
+
+    def __init__(self, clock=time.monotonic, track_events=False):
+        self.clock = clock
+        self.started = clock()
+        self.track_events = track_events
+        self.counts = Counter()
+        self.timings = {}
+        self.events = Counter()
+        # group -> (now - timestamp, ingestionTime - timestamp) in ms
+        self.lags = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def __getitem__(self, name):
+        return self.counts[name]
+
+    def observe(self, name, seconds):
+        with self._lock:
+            count, total = self.timings.get(name, (0, 0.0))
+            self.timings[name] = (count + 1, total + seconds)
+
+    def observe_events(self, events, now=None):
+        """Counts a page of ``LogEvent`` if ``track_events`` is set."""
+        if not self.track_events or not events:
+            return
+        if now is None:
+            now = int(time.time() * 1000)
+        counts = self.events
+        with self._lock:
+            for event in events:
+                counts[event.group, event.stream] += 1
+            newest = max(events, key=_timestamp)
+            self.lags[newest.group] = (
+                now - newest.timestamp,
+                (newest.ingestion_time or newest.timestamp) - newest.timestamp,
+            )
+
+    def snapshot(self):
+        """Returns copies of ``counts``, ``timings``, ``events`` and
+        ``lags``."""
+        with self._lock:
+            return (
+                dict(self.counts),
+                dict(self.timings),
+                dict(self.events),
+                dict(self.lags),
+            )
+
+    def report(self, out):
+        elapsed = max(self.clock() - self.started, 1e-9)
+        with self._lock:
+            counts = sorted(self.counts.items())
+        width = max([len(name) for name, _ in counts] or [0])
+        for name, count in counts:
+            out.write(
+                "{0} {1:>8} {2:>10.2f}/s\n".format(
+                    name.ljust(width), count, count / elapsed
+                )
+            )
+
+
+def _timestamp(event):
+    return event.timestamp
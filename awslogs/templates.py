@@ -0,0 +1,147 @@
+"""Online log template mining with bounded memory.
+
+A streaming variant of the Drain algorithm: messages are routed through a
+fixed-depth parse tree (by token count, then by their first tokens) to a
+small list of templates, and merged into the most similar one or added as
+a new template. Tokens containing digits are masked up front, which lets
+the vast majority of messages skip the tree entirely through a cache keyed
+by the masked message.
+"""
+
+import re
+from collections import OrderedDict
+
+WILDCARD = "<*>"
+
+_VARIABLE_TOKENS = re.compile(r"\S*\d\S*")
+
+
+class Template(object):
+
+    __slots__ = ("tokens", "count", "first", "last", "examples", "leaf", "alive")
+
+    def __init__(self, tokens, timestamp, leaf):
+        self.tokens = tokens
+        self.count = 0
+        self.first = timestamp
+        self.last = timestamp
+        self.examples = []
+        self.leaf = leaf
+        self.alive = True
+
+    @property
+    def text(self):
+        return " ".join(self.tokens)
+
+    def similarity(self, tokens):
+        """Fraction of ``tokens`` equal to the constant tokens of this
+        template."""
+        same = 0
+        for mine, theirs in zip(self.tokens, tokens):
+            if mine == theirs and mine != WILDCARD:
+                same += 1
+        return same / float(len(tokens))
+
+    def merge(self, tokens):
+        self.tokens = [
+            mine if mine == theirs else WILDCARD
+            for mine, theirs in zip(self.tokens, tokens)
+        ]
+
+
+class TemplateMiner(object):
+    """Clusters messages into templates such as ``Took <*> ms`` while they
+    stream by.
+
+    Memory is bounded: every node of the parse tree has at most
+    ``max_children`` children (more go down a wildcard branch), at most
+    ``max_templates`` templates are kept, evicting the least recently seen
+    one, and the masked message cache holds ``cache_size`` entries.
+    """
+
+    def __init__(
+        self,
+        depth=4,
+        similarity=0.5,
+        max_children=100,
+        max_templates=1000,
+        max_examples=3,
+        cache_size=10000,
+    ):
+        self.depth = depth
+        self.similarity = similarity
+        self.max_children = max_children
+        self.max_templates = max_templates
+        self.max_examples = max_examples
+        self.cache_size = cache_size
+        self.root = {}
+        self.templates = OrderedDict()
+        self.cache = {}
+        self.evicted = 0
+
+    def add(self, message, timestamp):
+        masked = _VARIABLE_TOKENS.sub(WILDCARD, message)
+        template = self.cache.get(masked)
+        if template is None or not template.alive:
+            template = self._match(masked.split(), timestamp)
+            if len(self.cache) >= self.cache_size:
+                self.cache.clear()
+            self.cache[masked] = template
+
+        template.count += 1
+        if timestamp < template.first:
+            template.first = timestamp
+        if timestamp > template.last:
+            template.last = timestamp
+        self.templates.move_to_end(template)
+
+        if len(template.examples) < self.max_examples:
+            values = tuple(
+                value
+                for token, value in zip(template.tokens, message.split())
+                if token == WILDCARD
+            )
+            if values and values not in template.examples:
+                template.examples.append(values)
+
+    def _leaf(self, tokens):
+        node = self.root.setdefault(len(tokens), {})
+        for token in tokens[: self.depth - 1]:
+            child = node.get(token)
+            if child is None:
+                if token != WILDCARD and len(node) >= self.max_children:
+                    token = WILDCARD
+                child = node.setdefault(token, {})
+            node = child
+        return node.setdefault(None, [])
+
+    def _match(self, tokens, timestamp):
+        if not tokens:
+            tokens = [""]
+        leaf = self._leaf(tokens)
+        best, best_similarity = None, -1.0
+        for template in leaf:
+            similarity = template.similarity(tokens)
+            if similarity > best_similarity:
+                best, best_similarity = template, similarity
+
+        if best is not None and best_similarity >= self.similarity:
+            best.merge(tokens)
+            return best
+
+        template = Template(tokens, timestamp, leaf)
+        leaf.append(template)
+        self.templates[template] = None
+        if len(self.templates) > self.max_templates:
+            self._evict()
+        return template
+
+    def _evict(self):
+        template, _ = self.templates.popitem(last=False)
+        template.alive = False
+        template.leaf.remove(template)
+        self.evicted += 1
+
+    def top(self, n=None):
+        """Returns templates sorted by count, most frequent first."""
+        return sorted(self.templates, key=lambda t: -t.count)[:n]
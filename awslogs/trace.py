@@ -0,0 +1,47 @@
+"""Following one request id across log groups."""
+
+import threading
+
+
+def trace_pattern(term):
+    """Returns the filter pattern matching events holding ``term``
+    verbatim."""
+    return '"{0}"'.format(term.replace("\\", "\\\\").replace('"', '\\"'))
+
+
+class TraceWindow(object):
+    """The window every group of a trace is searched in.
+
+    It starts as ``start``-``end`` and is narrowed to ``around``
+    milliseconds either side of the first event found in any group, since
+    the events of one request are never hours apart. Searches check
+    ``bounds()`` after every request and start over in the narrowed window,
+    so groups still scanning the rest of a wide window stop early and
+    groups not searched yet only search the narrowed one.
+    """
+
+    def __init__(self, start, end, around):
+        self.start = start
+        self.end = end
+        self.around = around
+        self.first_hit = None
+        self._lock = threading.Lock()
+
+    def bounds(self):
+        with self._lock:
+            return self.start, self.end
+
+    def hit(self, timestamp):
+        """Narrows the window around ``timestamp`` if it's the first hit.
+        Returns whether it did."""
+        with self._lock:
+            if self.first_hit is not None:
+                return False
+            self.first_hit = timestamp
+            self.start = max(self.start, timestamp - self.around)
+            self.end = min(self.end, timestamp + self.around)
+            return True
+
+    def __contains__(self, timestamp):
+        start, end = self.bounds()
+        return start <= timestamp <= end
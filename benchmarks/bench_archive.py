@@ -0,0 +1,81 @@
+"""Measure searches over a local archive.
+
+Usage::
+
+    $ python benchmarks/bench_archive.py [--events N] [--dir DIR]
+
+Writes an archive of ``--events`` synthetic events (reusing ``--dir`` if it
+already holds one) and times a few ``get --archive --search`` style
+queries against it: selective literals answered from the trigram index, a
+regular expression with literal parts, a time range bisected on the
+timestamps and a pattern without literals, which has to scan every event.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from awslogs.archive import Archive, ArchiveWriter
+from awslogs.events import LogEvent
+
+STREAMS = ["2024/01/01/[$LATEST]{0:032x}".format(i) for i in range(16)]
+
+SHAPES = [
+    "START RequestId: {0:08x} Version: $LATEST",
+    "END RequestId: {0:08x}",
+    "REPORT RequestId: {0:08x} Duration: {1} ms Billed Duration: {1} ms",
+    "GET /api/v1/users/{1} 200",
+    "cache miss for key session:{0:012x}",
+]
+
+
+def write(path, total):
+    rand = random.Random(0)
+    writer = ArchiveWriter(path, "/aws/lambda/checkout-service", 0, total * 10)
+    for i in range(total):
+        if rand.random() < 0.0001:
+            message = "ERROR Task timed out after {0} seconds".format(
+                rand.randint(3, 30)
+            )
+        else:
+            message = rand.choice(SHAPES).format(rand.getrandbits(32), i % 997)
+        writer.add(
+            LogEvent(None, i * 10, i * 10 + 40, writer.group, STREAMS[i % 16], message)
+        )
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--dir")
+    options = parser.parse_args()
+
+    path = options.dir or os.path.join(tempfile.mkdtemp(), "archive")
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        started = time.perf_counter()
+        write(path, options.events)
+        print("wrote {0} in {1:.1f}s".format(path, time.perf_counter() - started))
+
+    archive = Archive(path)
+    middle = archive.timestamps[len(archive) // 2]
+    queries = [
+        ("literal", "Task timed out", None, None),
+        ("regex", r"timed out after [12]\d seconds", None, None),
+        ("time range", "RequestId", middle, middle + 1000),
+        ("no literals", r"\d{13}", None, None),
+    ]
+    print("{0:<12} {1:>8} {2:>12}".format("query", "matches", "ms"))
+    for name, pattern, start, end in queries:
+        started = time.perf_counter()
+        found = archive.search(pattern, start, end)
+        matches = sum(1 for _ in found)
+        elapsed = time.perf_counter() - started
+        print("{0:<12} {1:>8} {2:>12.2f}".format(name, matches, elapsed * 1000))
+    archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Measure how long completing a group or stream name takes.
+
+Usage::
+
+    $ python benchmarks/bench_completion.py [--groups N] [--streams N] [--runs N]
+
+Writes a catalog of ``--groups`` groups, one of which has ``--streams``
+streams, into a temporary cache directory, then times lookups in process
+and whole ``python -m awslogs.completion complete ...`` runs, which is what
+a shell pays for every tab press.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from awslogs import completion
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--groups", type=int, default=10000)
+    parser.add_argument("--streams", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=20)
+    options = parser.parse_args()
+
+    os.environ["AWSLOGS_CACHE_DIR"] = tempfile.mkdtemp()
+    catalog = completion.Catalog(completion.catalog_path())
+    catalog.replace(
+        "g",
+        None,
+        ["/aws/lambda/function-{0:06d}".format(n) for n in range(options.groups)],
+    )
+    catalog.replace(
+        "s",
+        "/aws/lambda/function-000042",
+        ["2024/01/01/[$LATEST]{0:032x}".format(n) for n in range(options.streams)],
+    )
+    print("catalog of {0} bytes".format(os.path.getsize(catalog.path)))
+
+    lines = [
+        ("group", ["awslogs", "get", "/aws/lambda/function-0099"]),
+        (
+            "stream",
+            [
+                "awslogs",
+                "get",
+                "/aws/lambda/function-000042",
+                "2024/01/01/[$LATEST]00ff",
+            ],
+        ),
+    ]
+    print("{0:<8} {1:>12} {2:>12}".format("name", "lookup ms", "process ms"))
+    for name, words in lines:
+        started = time.perf_counter()
+        for _ in range(options.runs):
+            completion.complete(words, len(words) - 1, background=False)
+        lookup = (time.perf_counter() - started) / options.runs
+
+        command = [sys.executable, "-m", "awslogs.completion", "complete"]
+        command += [str(len(words) - 1)] + words
+        timings = []
+        for _ in range(options.runs):
+            started = time.perf_counter()
+            subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+            timings.append(time.perf_counter() - started)
+        print(
+            "{0:<8} {1:>12.3f} {2:>12.1f}".format(
+                name, lookup * 1000, statistics.median(timings) * 1000
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
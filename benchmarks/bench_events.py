@@ -0,0 +1,207 @@
+"""Compare per-event allocations of the dict and compact event paths.
+
+Usage::
+
+    $ python benchmarks/bench_events.py [--events N] [--timestamp]
+
+``dict`` is the path ``list_logs`` used to take (botocore dicts, an
+``output`` list and coloured strings per event), ``compact`` is
+``LogEvent`` + ``LineFormatter``. For each one it reports throughput,
+the bytes allocated while printing an event (the peak tracemalloc sees
+over one event, its output included), the bytes and memory blocks held
+per buffered event, garbage collector runs and peak RSS.
+
+Each mode runs in its own interpreter so peak RSS numbers don't leak
+between them. Pages are generated lazily, shaped like botocore's parsed
+``filter_log_events`` responses.
+"""
+
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from termcolor import colored
+
+from awslogs.core import milis2iso
+from awslogs.events import LineFormatter, LogEvent
+
+PAGE_SIZE = 10000
+GROUP = "/aws/lambda/checkout-service"
+
+
+def pages(total):
+    """Yield ``filter_log_events``-like pages until ``total`` events."""
+    timestamp = 1700000000000
+    for first in range(0, total, PAGE_SIZE):
+        events = []
+        for i in range(first, min(first + PAGE_SIZE, total)):
+            events.append(
+                {
+                    "logStreamName": "2024/01/01/[$LATEST]{0:032x}".format(i % 8),
+                    "timestamp": timestamp + i,
+                    "message": "START RequestId: {0:08x} Version: $LATEST\n".format(i),
+                    "ingestionTime": timestamp + i + 40,
+                    "eventId": "{0:056d}".format(i),
+                }
+            )
+        yield {"events": events}
+
+
+def color(text, name):
+    return colored(text, name, force_color=True)
+
+
+def print_dict(out, timestamp):
+    """The per-event path ``list_logs`` used before ``LogEvent``."""
+
+    def print_event(event):
+        output = [color(GROUP.ljust(len(GROUP), " "), "green")]
+        output.append(color(event["logStreamName"].ljust(48, " "), "cyan"))
+        if timestamp:
+            output.append(color(milis2iso(event["timestamp"]), "yellow"))
+        output.append(event["message"].rstrip())
+        out.write(" ".join(output))
+        out.write("\n")
+
+    return print_event
+
+
+def print_compact(out, timestamp):
+    formatter = LineFormatter(color, len(GROUP), 48, output_timestamp_enabled=timestamp)
+    from_response = LogEvent.from_response
+
+    def print_event(event):
+        event = from_response(event, GROUP)
+        out.write(formatter.format(event, event.message))
+        out.write("\n")
+
+    return print_event
+
+
+def hold(mode, total):
+    """Yield events the way each path keeps them while they are buffered."""
+    for page in pages(total):
+        if mode == "dict":
+            yield from page["events"]
+        else:
+            yield from [LogEvent.from_response(e, GROUP) for e in page["events"]]
+
+
+def reset_peak():
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    else:
+        # Python < 3.9: tracing again from scratch resets the peak too
+        tracemalloc.stop()
+        tracemalloc.start()
+
+
+def peak_rss_mib():
+    try:
+        import resource
+    except ImportError:
+        return float("nan")
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return maxrss / (1024.0 if sys.platform != "darwin" else 1024.0**2)
+
+
+def measure(mode, total, timestamp):
+    printer = {"dict": print_dict, "compact": print_compact}[mode]
+    with open(os.devnull, "w") as out:
+        print_event = printer(out, timestamp)
+        gc.collect()
+        collections = sum(s["collections"] for s in gc.get_stats())
+        started = time.perf_counter()
+        for page in pages(total):
+            for event in page["events"]:
+                print_event(event)
+        elapsed = time.perf_counter() - started
+        collections = sum(s["collections"] for s in gc.get_stats()) - collections
+        # Before tracemalloc adds its own overhead
+        rss = peak_rss_mib()
+
+        # Allocations and memory held per event, measured on a single page
+        # since tracemalloc is too slow to leave on for the whole run.
+        page = next(pages(PAGE_SIZE))["events"]
+        allocated = 0
+        tracemalloc.start()
+        for event in page:
+            reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            print_event(event)
+            _, peak = tracemalloc.get_traced_memory()
+            allocated += peak - before
+        tracemalloc.stop()
+        del page
+
+        gc.collect()
+        blocks = sys.getallocatedblocks()
+        held = list(hold(mode, PAGE_SIZE))
+        blocks = sys.getallocatedblocks() - blocks
+        del held
+        tracemalloc.start()
+        held = list(hold(mode, PAGE_SIZE))
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del held
+
+    result = {
+        "events_per_second": total / elapsed,
+        "gc_collections": collections,
+        "allocated_bytes_per_event": allocated / PAGE_SIZE,
+        "held_bytes_per_event": size / PAGE_SIZE,
+        "held_blocks_per_event": blocks / PAGE_SIZE,
+    }
+    result["peak_rss_mib"] = rss
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--timestamp", action="store_true")
+    parser.add_argument("--mode", choices=["dict", "compact"])
+    options = parser.parse_args()
+
+    if options.mode:
+        json.dump(measure(options.mode, options.events, options.timestamp), sys.stdout)
+        return
+
+    print(
+        "{0:<8} {1:>12} {2:>13} {3:>13} {4:>17} {5:>8} {6:>13}".format(
+            "mode",
+            "events/s",
+            "alloc B/event",
+            "held B/event",
+            "held blocks/event",
+            "gc runs",
+            "peak RSS MiB",
+        )
+    )
+    for mode in ("dict", "compact"):
+        argv = [
+            sys.executable,
+            __file__,
+            "--mode",
+            mode,
+            "--events",
+            str(options.events),
+        ]
+        if options.timestamp:
+            argv.append("--timestamp")
+        result = json.loads(subprocess.check_output(argv))
+        print(
+            "{0:<8} {events_per_second:>12,.0f} {allocated_bytes_per_event:>13.1f} "
+            "{held_bytes_per_event:>13.1f} {held_blocks_per_event:>17.2f} "
+            "{gc_collections:>8} {peak_rss_mib:>13.1f}".format(mode, **result)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Compare ways of keeping only the events matching a regular expression.
+
+Usage::
+
+    $ python benchmarks/bench_grep.py [--events N] [--page-size N] [--repeat N]
+
+Runs synthetic pages of events through:
+
+* ``page``: ``GrepStage``, which looks for a literal of the pattern in
+  each page joined by newlines and only runs the regex on the messages
+  holding it, then formats the events left;
+* ``per event``: one ``re.search`` per message, then formats the events
+  left;
+* ``pipe``: formats every event and pipes the lines through ``grep -E``,
+  which is what ``awslogs get ... | grep -E`` does (skipped if there is no
+  ``grep`` on the path).
+"""
+
+import argparse
+import random
+import re
+import shutil
+import subprocess
+import time
+
+from awslogs.events import LineFormatter, LogEvent
+from awslogs.pipeline import GrepStage
+
+SHAPES = [
+    "START RequestId: {0:08x} Version: $LATEST",
+    "END RequestId: {0:08x}",
+    "REPORT RequestId: {0:08x} Duration: {1} ms Billed Duration: {1} ms",
+    "GET /api/v1/users/{1} 200",
+    "cache miss for key session:{0:012x}",
+]
+
+PATTERNS = [
+    # Rare, starting with a literal re.search already skips to
+    ("prefix", r"timed out after [12]\d seconds"),
+    # Rare, with its literals after the start
+    ("inner", r"\w+ out after [12]\d seconds"),
+    # Rare, without any literal
+    ("none", r"(?i)timed out"),
+    # One event in five
+    ("common", r"Duration: \d+ ms"),
+]
+
+
+def pages(total, page_size):
+    rand = random.Random(0)
+    page = []
+    for i in range(total):
+        if rand.random() < 0.001:
+            message = "ERROR Task timed out after {0} seconds".format(
+                rand.randint(3, 30)
+            )
+        else:
+            message = rand.choice(SHAPES).format(rand.getrandbits(32), i % 997)
+        page.append(LogEvent(str(i), i, i, "AAA", "DDD", message))
+        if len(page) == page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def formatter():
+    return LineFormatter(lambda text, color: text, 3, 3)
+
+
+def by_page(data, pattern):
+    stage = GrepStage([pattern])
+    format = formatter().format
+    return sum(
+        len([format(e, e.message) for e in stage.process(page)]) for page in data
+    )
+
+
+def by_event(data, pattern):
+    search = re.compile(pattern, re.MULTILINE).search
+    format = formatter().format
+    return sum(
+        len([format(e, e.message) for e in page if search(e.message)]) for page in data
+    )
+
+
+def by_pipe(data, pattern):
+    format = formatter().format
+    lines = "\n".join(format(e, e.message) for page in data for e in page) + "\n"
+    command = ["grep", "-E"]
+    if pattern.startswith("(?i)"):
+        command.append("-i")
+        pattern = pattern[4:]
+    pattern = pattern.replace(r"\d", "[0-9]").replace(r"\w", "[[:alnum:]_]")
+    output = subprocess.run(
+        command + [pattern],
+        input=lines.encode("utf-8"),
+        stdout=subprocess.PIPE,
+        check=False,
+    ).stdout
+    return output.count(b"\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--page-size", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    data = list(pages(options.events, options.page_size))
+    ways = [("page", by_page), ("per event", by_event)]
+    if shutil.which("grep"):
+        ways.append(("pipe", by_pipe))
+    print("{0:<8} {1:<10} {2:>8} {3:>10}".format("pattern", "way", "matches", "ms"))
+    for label, pattern in PATTERNS:
+        for name, way in ways:
+            # Best of a few runs, the first one warms caches up
+            elapsed = None
+            for _ in range(options.repeat):
+                started = time.perf_counter()
+                matches = way(data, pattern)
+                took = time.perf_counter() - started
+                elapsed = took if elapsed is None else min(elapsed, took)
+            print(
+                "{0:<8} {1:<10} {2:>8} {3:>10.1f}".format(
+                    label, name, matches, elapsed * 1000
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
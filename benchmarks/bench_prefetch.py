@@ -0,0 +1,73 @@
+"""Measure how read-ahead overlaps fetching with consuming pages.
+
+Usage::
+
+    $ python benchmarks/bench_prefetch.py [--pages N] [--latency S] [--work S]
+
+A fake client answers ``filter_log_events`` after ``--latency`` seconds and
+the consumer spends ``--work`` seconds on each page, standing in for a
+high-latency link and formatting/printing.
+"""
+
+import argparse
+import time
+from unittest.mock import patch
+
+from awslogs import AWSLogs
+
+
+class SlowClient(object):
+    def __init__(self, pages, latency):
+        self.pages = pages
+        self.latency = latency
+
+    def filter_log_events(self, **kwargs):
+        time.sleep(self.latency)
+        page = int(kwargs.get("nextToken", 0))
+        response = {
+            "events": [
+                {
+                    "eventId": "{0}-{1}".format(page, i),
+                    "timestamp": page,
+                    "ingestionTime": page,
+                    "logStreamName": "stream",
+                    "message": "Hello",
+                }
+                for i in range(100)
+            ]
+        }
+        if page + 1 < self.pages:
+            response["nextToken"] = str(page + 1)
+        return response
+
+
+def run(pages, latency, work, read_ahead):
+    with patch("awslogs.core.boto3_client") as client:
+        client.return_value = SlowClient(pages, latency)
+        logs = AWSLogs(log_group_name="group", read_ahead=read_ahead)
+    started = time.perf_counter()
+    for _ in logs.iter_events(batched=True):
+        time.sleep(work)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--work", type=float, default=0.1)
+    options = parser.parse_args()
+
+    baseline = None
+    for read_ahead in (0, 1, 2):
+        elapsed = run(options.pages, options.latency, options.work, read_ahead)
+        baseline = baseline or elapsed
+        print(
+            "read-ahead {0}: {1:.2f}s ({2:.2f}x)".format(
+                read_ahead, elapsed, baseline / elapsed
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
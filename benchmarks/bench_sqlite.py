@@ -0,0 +1,93 @@
+"""Measure how fast ``--sink sqlite:PATH`` loads events.
+
+Usage::
+
+    $ python benchmarks/bench_sqlite.py [--events N] [--page-size N]
+
+Loads synthetic pages of events into a fresh database with:
+
+* ``sink``: ``SQLiteSink``, ``executemany`` a page at a time inside large
+  transactions, indexes built once loading is over;
+* ``naive``: one ``INSERT`` per event into an indexed table, committing
+  every page, the way a hand-written loader usually starts out.
+
+and prints events loaded per minute.
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+from awslogs.events import LogEvent
+from awslogs.sinks import SQLiteSink
+
+
+def pages(total, page_size):
+    for start in range(0, total, page_size):
+        yield [
+            LogEvent(
+                str(i),
+                i,
+                i + 250,
+                "/aws/lambda/function",
+                "2024/01/01/[$LATEST]{0:032x}".format(i % 50),
+                "REPORT RequestId: {0:08x} Duration: {1} ms".format(i, i % 997),
+            )
+            for i in range(start, min(start + page_size, total))
+        ]
+
+
+def by_sink(path, data):
+    sink = SQLiteSink(path)
+    for page in data:
+        sink.process(page)
+    sink.close()
+
+
+def naive(path, data):
+    db = sqlite3.connect(path)
+    db.execute(SQLiteSink.SCHEMA)
+    for index in SQLiteSink.INDEXES:
+        db.execute(index)
+    for page in data:
+        for e in page:
+            db.execute(
+                SQLiteSink.INSERT,
+                (
+                    e.event_id,
+                    e.timestamp,
+                    e.ingestion_time,
+                    e.group,
+                    e.stream,
+                    e.message,
+                    None,
+                ),
+            )
+        db.commit()
+    db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--page-size", type=int, default=10000)
+    options = parser.parse_args()
+
+    data = list(pages(options.events, options.page_size))
+    print("{0:<8} {1:>10} {2:>16}".format("way", "seconds", "events/minute"))
+    for name, way in [("sink", by_sink), ("naive", naive)]:
+        with tempfile.TemporaryDirectory() as directory:
+            started = time.perf_counter()
+            way(os.path.join(directory, "logs.db"), data)
+            elapsed = time.perf_counter() - started
+        print(
+            "{0:<8} {1:>10.2f} {2:>16,.0f}".format(
+                name, elapsed, options.events / elapsed * 60
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
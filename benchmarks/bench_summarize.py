@@ -0,0 +1,82 @@
+"""Measure how many events per second ``TemplateMiner`` clusters.
+
+Usage::
+
+    $ python benchmarks/bench_summarize.py [--events N] [--templates N]
+
+Messages are generated up front from ``--templates`` different shapes
+(request ids, durations, user names, IP addresses...) so only the miner is
+timed. ``get --summarize`` has to keep up with ``filter_log_events``, which
+tops out at around 100k events per second.
+"""
+
+import argparse
+import random
+import time
+
+from awslogs.templates import TemplateMiner
+
+SHAPES = [
+    "START RequestId: {uuid} Version: $LATEST",
+    "END RequestId: {uuid}",
+    "REPORT RequestId: {uuid} Duration: {float} ms Billed Duration: {int} ms",
+    "GET /api/v1/users/{int} 200 {int}ms",
+    "POST /api/v1/orders 201 {int}ms from {ip}",
+    "user {name} logged in from {ip}",
+    "cache miss for key session:{hex}",
+    "retrying request to {ip} attempt {int} of 5",
+    "[ERROR] Timeout while connecting to db-{int}.internal after {float}s",
+    "payment {hex} for customer {name} accepted",
+]
+
+NAMES = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi"]
+
+
+def fill(shape, rand):
+    return shape.format(
+        uuid="{0:08x}-{1:04x}-{2:04x}".format(
+            rand.getrandbits(32), rand.getrandbits(16), rand.getrandbits(16)
+        ),
+        float="{0:.2f}".format(rand.random() * 1000),
+        int=rand.randint(1, 100000),
+        ip="10.0.{0}.{1}".format(rand.randint(0, 255), rand.randint(0, 255)),
+        name=rand.choice(NAMES),
+        hex="{0:012x}".format(rand.getrandbits(48)),
+    )
+
+
+def messages(total, templates, rand):
+    shapes = [
+        "{0} (worker {1})".format(SHAPES[i % len(SHAPES)], chr(97 + i // len(SHAPES)))
+        if i >= len(SHAPES)
+        else SHAPES[i]
+        for i in range(templates)
+    ]
+    return [fill(rand.choice(shapes), rand) for _ in range(total)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=500000)
+    parser.add_argument("--templates", type=int, default=len(SHAPES))
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+
+    rand = random.Random(options.seed)
+    batch = messages(options.events, options.templates, rand)
+
+    miner = TemplateMiner()
+    add = miner.add
+    started = time.perf_counter()
+    for timestamp, message in enumerate(batch):
+        add(message, timestamp)
+    elapsed = time.perf_counter() - started
+
+    print("{0:>12,.0f} events/s".format(options.events / elapsed))
+    print("{0:>12} templates".format(len(miner.templates)))
+    for template in miner.top(5):
+        print("{0:>12} {1}".format(template.count, template.text))
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,7 @@ setup(
     platforms="any",
     python_requires=">=3.8",
     install_requires=install_requires,
+    extras_require={"arrow": ["pyarrow>=12"], "numpy": ["numpy>=1.22"]},
     test_suite="tests",
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -40,6 +41,7 @@ setup(
     entry_points={
         "console_scripts": [
             "awslogs = awslogs.bin:main",
+            "awslogs-complete = awslogs.completion:main",
         ]
     },
     zip_safe=False,
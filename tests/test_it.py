@@ -1,23 +1,70 @@
+import gzip
+import json
+import os
+import re
+import sqlite3
 import sys
+import time
+import tempfile
+import threading
 import unittest
-from datetime import datetime
+from array import array
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
 
 try:
     from StringIO import StringIO
 except ImportError:
     from io import StringIO
 
+from botocore.client import ClientError
 from botocore.compat import total_seconds
+from botocore.credentials import RefreshableCredentials
+from botocore.hooks import HierarchicalEmitter
 from termcolor import colored
 
 try:
-    from mock import patch, Mock
+    from mock import ANY, call, patch, Mock
 except ImportError:
-    from unittest.mock import patch, Mock
+    from unittest.mock import ANY, call, patch, Mock
 
 from awslogs import AWSLogs
-from awslogs.exceptions import UnknownDateError
-from awslogs.bin import main
+from awslogs.exceptions import (
+    EngineNotSupportedError,
+    InvalidPatternError,
+    InvalidWindowError,
+    MissingOptionError,
+    NotAnArchiveError,
+    UnknownDateError,
+    UnknownDurationError,
+    UnknownStageError,
+)
+from awslogs.archive import Archive, ArchiveWriter, required_literals
+from awslogs import completion
+from awslogs.batches import batches
+from awslogs.bin import build_parser, main
+from awslogs.credentials import CredentialRefresher, retry_expired
+from awslogs.discovery import StreamDiscovery
+from awslogs.events import LineFormatter, LogEvent
+from awslogs.histogram import Histogram
+from awslogs.metrics import CONTENT_TYPE, count_throttles, render
+from awslogs.ordering import EVENT_OVERHEAD, ExternalSorter
+from awslogs.overflow import OverflowBuffer, status_stream
+from awslogs.pipeline import (
+    GrepStage,
+    Pipeline,
+    QueryStage,
+    Stage,
+    load_stage,
+    matching,
+)
+from awslogs.prefetch import Interleaver, Prefetcher
+from awslogs.profiling import NULL_PROFILER, Profiler
+from awslogs.sinks import SQLiteSink, StreamFiles
+from awslogs.stats import Stats
+from awslogs.templates import TemplateMiner
+from awslogs.trace import TraceWindow, trace_pattern
 
 
 def mapkeys(keys, rec_lst):
@@ -30,6 +77,38 @@ def mapkeys(keys, rec_lst):
     return [dict(zip(keys, vals)) for vals in rec_lst]
 
 
+def log_event(event_id, timestamp, message, stream="DDD", ingestion_time=None):
+    """Returns an event the way ``filter_log_events`` does."""
+    return {
+        "eventId": str(event_id),
+        "timestamp": timestamp,
+        "ingestionTime": timestamp if ingestion_time is None else ingestion_time,
+        "message": message,
+        "logStreamName": stream,
+    }
+
+
+def fake_filter_log_events(events, page_size=3):
+    """Returns a ``filter_log_events`` stand-in serving ``events`` (dicts
+    sorted by timestamp) honouring time bounds, limit and nextToken."""
+
+    def filter_log_events(**kwargs):
+        matching = [
+            e
+            for e in events
+            if kwargs.get("startTime", 0) <= e["timestamp"]
+            and e["timestamp"] <= kwargs.get("endTime", sys.maxsize)
+        ]
+        offset = int(kwargs.get("nextToken", 0))
+        size = min(page_size, kwargs.get("limit", page_size))
+        response = {"events": matching[offset : offset + size]}
+        if offset + size < len(matching):
+            response["nextToken"] = str(offset + size)
+        return response
+
+    return filter_log_events
+
+
 class TestAWSLogsDatetimeParse(unittest.TestCase):
     @patch("awslogs.core.boto3_client")
     @patch("awslogs.core.datetime")
@@ -86,7 +165,6 @@ class TestAWSLogsDatetimeParse(unittest.TestCase):
 
 
 class TestAWSLogs(unittest.TestCase):
-
     def _stream(self, name, start=0, ingestion=sys.maxsize, end=None):
         if end is None:
             end = ingestion - 1
@@ -719,3 +797,2545 @@ class TestAWSLogs(unittest.TestCase):
 
         awslogs = AWSLogs()
         self.assertEqual(client, awslogs.client)
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main_get_profile_out(self, mock_stdout, botoclient):
+        self.set_json_logs(botoclient)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profile.folded")
+            exit_code = main(
+                "awslogs get AAA DDD --query foo --profile-out {0}".format(path).split()
+            )
+            with open(path) as f:
+                samples = dict(line.rsplit(" ", 1) for line in f.read().splitlines())
+
+        self.assertEqual(
+            sorted(samples),
+            [
+                "awslogs;awslogs-prefetch;dedup",
+                "awslogs;awslogs-prefetch;filter_log_events",
+                "awslogs;list_logs",
+                "awslogs;list_logs;format",
+                "awslogs;list_logs;query",
+                "awslogs;list_logs;write",
+            ],
+        )
+        self.assertTrue(all(int(value) >= 0 for value in samples.values()))
+        assert exit_code == 0
+
+
+class TestProfiler(unittest.TestCase):
+    def test_null_profiler_shares_span(self):
+        self.assertIs(NULL_PROFILER.span("a"), NULL_PROFILER.span("b"))
+        with NULL_PROFILER.span("a"):
+            pass
+
+    def test_nested_spans_record_self_time(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profile.folded")
+            profiler = Profiler(path)
+            with profiler.span("outer"):
+                with profiler.span("inner"):
+                    time.sleep(0.01)
+            profiler.dump()
+            with open(path) as f:
+                samples = dict(line.rsplit(" ", 1) for line in f.read().splitlines())
+
+        self.assertGreaterEqual(int(samples["awslogs;outer;inner"]), 10000)
+        self.assertLess(int(samples["awslogs;outer"]), 10000)
+
+    def test_dump_closes_open_spans(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profile.folded")
+            profiler = Profiler(path)
+            profiler.span("outer").__enter__()
+            profiler.dump()
+            with open(path) as f:
+                self.assertTrue(f.read().startswith("awslogs;outer "))
+
+
+class TestLineFormatter(unittest.TestCase):
+    def test_format(self):
+        formatter = LineFormatter(
+            lambda text, color: "<{0}>{1}</{0}>".format(color, text),
+            4,
+            5,
+            output_timestamp_enabled=True,
+            output_ingestion_time_enabled=True,
+        )
+        plan = (
+            (LogEvent(1, 999, 1000, "AAA", "DDD", "Hello 1\n"), "Hello 1"),
+            (LogEvent(2, 1001, 61001, "AAA", "EEE", "Hello 2"), "Hello 2"),
+            (LogEvent(3, 1002, 61001, "AAA", "DDD", "{}"), "bar"),
+        )
+        expected = [
+            "<green>AAA </green> <cyan>DDD  </cyan> "
+            "<yellow>1970-01-01T00:00:00.999Z</yellow> "
+            "<blue>1970-01-01T00:00:01.000Z</blue> Hello 1",
+            "<green>AAA </green> <cyan>EEE  </cyan> "
+            "<yellow>1970-01-01T00:00:01.001Z</yellow> "
+            "<blue>1970-01-01T00:01:01.001Z</blue> Hello 2",
+            "<green>AAA </green> <cyan>DDD  </cyan> "
+            "<yellow>1970-01-01T00:00:01.002Z</yellow> "
+            "<blue>1970-01-01T00:01:01.001Z</blue> bar",
+        ]
+        self.assertEqual(
+            [formatter.format(event, message) for event, message in plan], expected
+        )
+
+    def test_format_message_only(self):
+        formatter = LineFormatter(
+            colored, 3, 3, output_group_enabled=False, output_stream_enabled=False
+        )
+        event = LogEvent(1, 0, 0, "AAA", "DDD", "Hello 1  ")
+        self.assertEqual(formatter.format(event, event.message), "Hello 1")
+
+    def test_log_event_as_dict(self):
+        event = LogEvent.from_response(
+            {
+                "eventId": 1,
+                "timestamp": 2,
+                "ingestionTime": 3,
+                "logStreamName": "DDD",
+                "message": "Hello",
+            },
+            "AAA",
+        )
+        self.assertEqual(event.stream, "DDD")
+        self.assertEqual(
+            event.as_dict(),
+            {
+                "eventId": 1,
+                "timestamp": 2,
+                "ingestionTime": 3,
+                "logGroupName": "AAA",
+                "logStreamName": "DDD",
+                "message": "Hello",
+            },
+        )
+
+
+class TestIterEvents(unittest.TestCase):
+    def _page(self, ids, next_token=None):
+        page = {"events": [log_event(i, i, "Hello {0}".format(i)) for i in ids]}
+        if next_token:
+            page["nextToken"] = next_token
+        return page
+
+    @patch("awslogs.core.boto3_client")
+    def test_iter_events(self, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = [
+            self._page([1, 2], "a"),
+            self._page([2, 3]),
+        ]
+        awslogs = AWSLogs(log_group_name="AAA", log_stream_name="ALL")
+        self.assertEqual(
+            list(awslogs.iter_events()),
+            [
+                LogEvent(str(i), i, i, "AAA", "DDD", "Hello {0}".format(i))
+                for i in (1, 2, 3)
+            ],
+        )
+        self.assertEqual(
+            client.filter_log_events.call_args_list[1][1]["nextToken"], "a"
+        )
+
+    @patch("awslogs.core.boto3_client")
+    def test_iter_events_batched(self, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = [
+            self._page([1, 2], "a"),
+            self._page([2], "b"),
+            self._page([3]),
+        ]
+        awslogs = AWSLogs(log_group_name="AAA")
+        batches = [[e.event_id for e in b] for b in awslogs.iter_events(batched=True)]
+        self.assertEqual(batches, [["1", "2"], ["3"]])
+
+    @patch("awslogs.core.boto3_client")
+    def test_iter_events_fetches_on_demand(self, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = (
+            self._page(range(i * 10, i * 10 + 10), str(i)) for i in range(1000)
+        )
+        awslogs = AWSLogs(log_group_name="AAA")
+        events = awslogs.iter_events()
+        for _ in range(25):
+            next(events)
+        # A slow consumer never has more than the current page in memory.
+        self.assertEqual(client.filter_log_events.call_count, 3)
+        events.close()
+        self.assertEqual(client.filter_log_events.call_count, 3)
+
+    @patch("awslogs.core.boto3_client")
+    def test_iter_events_watch_close(self, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = lambda **kwargs: self._page([1])
+        awslogs = AWSLogs(log_group_name="AAA", watch=True, watch_interval=60)
+        events = awslogs.iter_events()
+        self.assertEqual(next(events).event_id, "1")
+
+        timer = threading.Timer(0.05, awslogs.close)
+        timer.start()
+        started = time.time()
+        self.assertEqual(list(events), [])
+        self.assertLess(time.time() - started, 5)
+        self.assertEqual(client.filter_log_events.call_count, 1)
+
+
+class TestPrefetcher(unittest.TestCase):
+    def test_prefetch(self):
+        self.assertEqual(list(Prefetcher(iter(range(100)), depth=3)), list(range(100)))
+
+    def test_prefetch_reads_ahead_up_to_depth(self):
+        produced = []
+
+        def pages():
+            for i in range(100):
+                produced.append(i)
+                yield i
+
+        prefetcher = Prefetcher(pages(), depth=2)
+        self.assertEqual(next(prefetcher), 0)
+        time.sleep(0.2)
+        # Two pages queued plus one blocked waiting for room.
+        self.assertEqual(produced, [0, 1, 2, 3])
+        prefetcher.close()
+        prefetcher.thread.join(1)
+        self.assertFalse(prefetcher.thread.is_alive())
+        self.assertEqual(list(prefetcher), [])
+
+    def test_prefetch_raises(self):
+        def pages():
+            yield 1
+            raise UnknownDateError("X")
+
+        prefetcher = Prefetcher(pages())
+        self.assertEqual(next(prefetcher), 1)
+        self.assertRaises(UnknownDateError, next, prefetcher)
+
+    @patch("awslogs.core.boto3_client")
+    def test_iter_events_read_ahead(self, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = [
+            {
+                "events": [log_event(i, i, "Hello")],
+                "nextToken": str(i),
+            }
+            for i in range(5)
+        ] + [{"events": []}]
+        awslogs = AWSLogs(log_group_name="AAA", read_ahead=2)
+        self.assertEqual(
+            [e.event_id for e in awslogs.iter_events()], [str(i) for i in range(5)]
+        )
+
+
+class TestStreamsEngine(unittest.TestCase):
+
+    # stream -> pages of (timestamp, message)
+    PAGES = {
+        "AAA1": [[(1, "a1"), (4, "a4")], [(6, "a6")]],
+        "AAA2": [[(2, "b2")], [], [(3, "b3"), (9, "b9")]],
+        "AAA3": [[(5, "c5")]],
+    }
+
+    def set_streams(self, botoclient, pages=None):
+        pages = pages or self.PAGES
+        client = botoclient.return_value
+        client.get_paginator.return_value.paginate.return_value = [
+            {"logStreams": [{"logStreamName": name} for name in sorted(pages)]}
+        ]
+
+        def get_log_events(**kwargs):
+            stream = kwargs["logStreamName"]
+            position = int(kwargs.get("nextToken", "0"))
+            response = {"nextForwardToken": str(position)}
+            start = kwargs.get("startTime", 0)
+            # Unlike filter_log_events, endTime is exclusive
+            end = kwargs.get("endTime", float("inf"))
+            if position < len(pages[stream]):
+                response["nextForwardToken"] = str(position + 1)
+                response["events"] = [
+                    {"timestamp": t, "ingestionTime": t, "message": m}
+                    for t, m in pages[stream][position]
+                    if start <= t < end
+                ]
+            return response
+
+        client.get_log_events.side_effect = get_log_events
+        return client
+
+    @patch("awslogs.core.boto3_client")
+    def test_merge(self, botoclient):
+        client = self.set_streams(botoclient)
+        awslogs = AWSLogs(log_group_name="G", log_stream_name="AAA")
+        events = list(awslogs.iter_events())
+        self.assertEqual(
+            [e.message for e in events], ["a1", "b2", "b3", "a4", "c5", "a6", "b9"]
+        )
+        self.assertEqual(events[0].stream, "AAA1")
+        client.filter_log_events.assert_not_called()
+
+    @patch("awslogs.core.boto3_client")
+    def test_merge_time_bounds(self, botoclient):
+        client = self.set_streams(botoclient)
+        awslogs = AWSLogs(log_group_name="G", log_stream_name="AAA")
+        awslogs.start, awslogs.end = 3, 6
+        events = list(awslogs.iter_events())
+        # Both ends included, as with filter_log_events
+        self.assertEqual([e.message for e in events], ["b3", "a4", "c5", "a6"])
+        for request in client.get_log_events.call_args_list:
+            self.assertEqual(request[1]["startTime"], 3)
+            self.assertEqual(request[1]["endTime"], 7)
+            self.assertTrue(request[1]["startFromHead"])
+
+    @patch("awslogs.core.boto3_client")
+    def test_auto_engine(self, botoclient):
+        awslogs = AWSLogs(log_group_name="G")
+        self.assertFalse(awslogs._use_streams_engine([]))
+        self.assertFalse(awslogs._use_streams_engine(["A"]))
+        self.assertTrue(awslogs._use_streams_engine(["A", "B"]))
+        self.assertFalse(awslogs._use_streams_engine([str(i) for i in range(11)]))
+        awslogs.filter_pattern = "ERROR"
+        self.assertFalse(awslogs._use_streams_engine(["A", "B"]))
+        awslogs = AWSLogs(log_group_name="G", watch=True, watch_overlap="30s")
+        self.assertFalse(awslogs._use_streams_engine(["A", "B"]))
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_watch_overlap_uses_filter_engine(self, mock_stderr, botoclient):
+        client = self.set_streams(botoclient)
+        client.filter_log_events.return_value = {"events": []}
+        awslogs = AWSLogs(
+            log_group_name="G",
+            log_stream_name="AAA",
+            watch=True,
+            watch_interval=60,
+            watch_overlap="30s",
+        )
+        pages = awslogs.iter_events(batched=True)
+        timer = threading.Timer(0.05, awslogs.close)
+        timer.start()
+        self.assertEqual(list(pages), [])
+        client.filter_log_events.assert_called()
+        client.get_log_events.assert_not_called()
+
+        code = main(
+            "awslogs get G AAA --watch --watch-overlap 30s --engine streams".split()
+        )
+        self.assertEqual(code, 9)
+        self.assertIn(
+            "--engine streams can't be used together with --watch-overlap",
+            mock_stderr.getvalue(),
+        )
+
+    @patch("awslogs.core.boto3_client")
+    def test_forced_engines(self, botoclient):
+        awslogs = AWSLogs(log_group_name="G", engine="filter")
+        self.assertFalse(awslogs._use_streams_engine(["A", "B"]))
+        awslogs = AWSLogs(log_group_name="G", engine="streams")
+        self.assertTrue(awslogs._use_streams_engine(["A"]))
+        awslogs.filter_pattern = "ERROR"
+        self.assertRaises(
+            EngineNotSupportedError, awslogs._use_streams_engine, ["A", "B"]
+        )
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main_get_streams_engine(self, mock_stdout, botoclient):
+        self.set_streams(botoclient, {"AAA1": self.PAGES["AAA1"]})
+        exit_code = main(
+            "awslogs get G -s 1/1/1970 --engine streams --color=never".split()
+        )
+        self.assertEqual(
+            mock_stdout.getvalue(), "G AAA1 a1\n" "G AAA1 a4\n" "G AAA1 a6\n"
+        )
+        assert exit_code == 0
+
+
+class TestTailAndLimit(unittest.TestCase):
+    def _events(self, timestamps):
+        return [
+            log_event(i, t, "Hello {0}".format(i)) for i, t in enumerate(timestamps)
+        ]
+
+    @patch("awslogs.core.boto3_client")
+    def test_limit(self, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            self._events(range(100))
+        )
+        awslogs = AWSLogs(log_group_name="AAA", limit=4)
+        self.assertEqual(
+            [e.event_id for e in awslogs.iter_events()], ["0", "1", "2", "3"]
+        )
+        self.assertEqual(client.filter_log_events.call_count, 2)
+        self.assertEqual(client.filter_log_events.call_args_list[0][1]["limit"], 4)
+
+    @patch("awslogs.core.boto3_client")
+    def test_limit_batched_read_ahead(self, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            self._events(range(100))
+        )
+        awslogs = AWSLogs(log_group_name="AAA", limit=5, read_ahead=2)
+        batches = [len(b) for b in awslogs.iter_events(batched=True)]
+        self.assertEqual(batches, [3, 2])
+
+    @patch("awslogs.core.boto3_client")
+    def test_tail(self, botoclient):
+        client = botoclient.return_value
+        # One event per second for almost three hours.
+        timestamps = list(range(0, 10000 * 1000, 1000))
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            self._events(timestamps), page_size=100
+        )
+        awslogs = AWSLogs(log_group_name="AAA", tail=200)
+        awslogs.end = timestamps[-1]
+        events = list(awslogs.iter_events())
+        self.assertEqual([e.timestamp for e in events], timestamps[-200:])
+        self.assertLess(client.filter_log_events.call_count, 6)
+
+    @patch("awslogs.core.boto3_client")
+    def test_tail_bisects_busy_windows(self, botoclient):
+        client = botoclient.return_value
+        # 10 events per millisecond
+        timestamps = [t // 10 for t in range(50000)]
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            self._events(timestamps), page_size=10000
+        )
+        awslogs = AWSLogs(log_group_name="AAA", tail=25)
+        awslogs.end = timestamps[-1]
+        events = list(awslogs.iter_events())
+        self.assertEqual([e.timestamp for e in events], timestamps[-25:])
+        for request in client.filter_log_events.call_args_list:
+            self.assertLessEqual(request[1]["limit"], 51)
+
+    @patch("awslogs.core.boto3_client")
+    def test_tail_short_group(self, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            self._events([5, 6, 7])
+        )
+        awslogs = AWSLogs(log_group_name="AAA", tail=10)
+        awslogs.start, awslogs.end = 1, 100000
+        self.assertEqual([e.timestamp for e in awslogs.iter_events()], [5, 6, 7])
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main_get_tail(self, mock_stdout, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            self._events([5, 6, 7])
+        )
+        # Without --start the tail isn't limited to the default 5 minutes.
+        exit_code = main("awslogs get AAA --tail 2 -e 1970-01-01T00:00:01".split())
+        self.assertEqual(
+            mock_stdout.getvalue(), "AAA DDD        Hello 1\nAAA DDD        Hello 2\n"
+        )
+        assert exit_code == 0
+
+
+class TestFanOut(unittest.TestCase):
+    def _client(self, timestamps, groups=()):
+        client = Mock()
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [log_event(t, t, "Hello {0}".format(t)) for t in timestamps]
+        )
+        client.get_paginator.return_value.paginate.return_value = [
+            {"logGroups": [{"logGroupName": g} for g in groups]}
+        ]
+        return client
+
+    def _clients(self, botoclient, clients):
+        def boto3_client(profile, key, secret, token, region, endpoint):
+            client = clients[profile, region]
+            if isinstance(client, Exception):
+                raise client
+            return client
+
+        botoclient.side_effect = boto3_client
+
+    @patch("awslogs.core.boto3_client")
+    def test_targets(self, botoclient):
+        awslogs = AWSLogs(aws_profile="a,b", aws_region="eu-west-1,us-east-1")
+        self.assertEqual(
+            [t.label for t in awslogs.targets],
+            ["a/eu-west-1", "a/us-east-1", "b/eu-west-1", "b/us-east-1"],
+        )
+        self.assertIsNone(awslogs.client)
+        botoclient.assert_not_called()
+
+        awslogs = AWSLogs(targets=[("a", None)], aws_region="eu-west-1")
+        self.assertFalse(awslogs.fan_out)
+        self.assertEqual(awslogs.targets[0].label, "a/default")
+
+    @patch("awslogs.core.boto3_client")
+    def test_single_target_client(self, botoclient):
+        client = self._client([1, 2])
+        self._clients(botoclient, {("prod", "eu-west-1"): client})
+        awslogs = AWSLogs(log_group_name="AAA", targets=[("prod", "eu-west-1")])
+        self.assertIs(awslogs.client, client)
+        self.assertEqual(
+            (awslogs.aws_profile, awslogs.aws_region), ("prod", "eu-west-1")
+        )
+        self.assertEqual([e.timestamp for e in awslogs.iter_events()], [1, 2])
+
+    @patch("awslogs.core.boto3_client")
+    def test_iter_events_merged_by_timestamp(self, botoclient):
+        self._clients(
+            botoclient,
+            {
+                ("p", "r1"): self._client([1, 4, 5, 9]),
+                ("p", "r2"): self._client([2, 3, 6, 7, 8]),
+            },
+        )
+        awslogs = AWSLogs(log_group_name="AAA", aws_profile="p", aws_region="r1,r2")
+        events = list(awslogs.iter_events())
+        self.assertEqual([e.timestamp for e in events], list(range(1, 10)))
+        self.assertEqual([e.target for e in events[:3]], ["p/r1", "p/r2", "p/r2"])
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main_get_failing_target(self, mock_stdout, mock_stderr, botoclient):
+        failing = Mock()
+        failing.filter_log_events.side_effect = ClientError(
+            {"Error": {"Code": "AccessDeniedException", "Message": "Denied"}},
+            "FilterLogEvents",
+        )
+        self._clients(
+            botoclient,
+            {
+                ("p", "r1"): self._client([1, 3]),
+                ("p", "r2"): failing,
+                ("p", "r3"): self._client([2]),
+            },
+        )
+        exit_code = main(
+            "awslogs get AAA --profile p --aws-region r1,r2,r3 "
+            "--color=never -s1/1/1970".split()
+        )
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "p/r1 AAA DDD        Hello 1\n"
+            "p/r3 AAA DDD        Hello 2\n"
+            "p/r1 AAA DDD        Hello 3\n",
+        )
+        self.assertIn(
+            "p/r2: An error occurred (AccessDeniedException)", mock_stderr.getvalue()
+        )
+        assert exit_code == 0
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_main_get_every_target_failing(self, mock_stderr, botoclient):
+        self._clients(
+            botoclient,
+            {("p", "r1"): ValueError("Boom"), ("p", "r2"): ValueError("Boom")},
+        )
+        exit_code = main("awslogs get AAA --profile p --aws-region r1,r2".split())
+        self.assertIn("You've found a bug!", mock_stderr.getvalue())
+        assert exit_code == 1
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main_groups(self, mock_stdout, botoclient):
+        self._clients(
+            botoclient,
+            {
+                ("a", "r"): self._client([], ["AAA", "BBB"]),
+                ("b", "r"): self._client([], ["CCC"]),
+            },
+        )
+        exit_code = main("awslogs groups --profile a,b --aws-region r".split())
+        self.assertEqual(
+            sorted(mock_stdout.getvalue().splitlines()),
+            ["a/r AAA", "a/r BBB", "b/r CCC"],
+        )
+        assert exit_code == 0
+
+
+class TestSample(unittest.TestCase):
+    def _set_events(self, botoclient, timestamps):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [log_event(t, t, "Hello {0}".format(t)) for t in timestamps],
+            page_size=10000,
+        )
+        return client
+
+    @patch("awslogs.core.boto3_client")
+    def test_sample_even(self, botoclient):
+        client = self._set_events(botoclient, range(0, 100000, 10))
+        awslogs = AWSLogs(log_group_name="AAA", sample=10, sample_size=5)
+        awslogs.start, awslogs.end = 0, 99999
+        events = [e.timestamp for e in awslogs.iter_events()]
+        self.assertEqual(
+            events, [lo + i * 10 for lo in range(0, 100000, 10000) for i in range(5)]
+        )
+        self.assertEqual(client.filter_log_events.call_count, 10)
+        self.assertAlmostEqual(awslogs.sample_rate, 10 * 41 / 100000.0)
+
+    @patch("awslogs.core.boto3_client")
+    def test_sample_random(self, botoclient):
+        self._set_events(botoclient, range(0, 100000, 10))
+        awslogs = AWSLogs(
+            log_group_name="AAA",
+            sample=4,
+            sample_size=3,
+            sample_spacing="random",
+            sample_seed=1,
+        )
+        awslogs.start, awslogs.end = 0, 99999
+        events = [e.timestamp for e in awslogs.iter_events()]
+        self.assertEqual(len(events), 12)
+        self.assertEqual(events, sorted(events))
+        for i in range(4):
+            self.assertTrue(i * 25000 <= events[i * 3] < (i + 1) * 25000)
+
+    @patch("awslogs.core.boto3_client")
+    def test_sample_sparse_window(self, botoclient):
+        self._set_events(botoclient, [5, 70])
+        awslogs = AWSLogs(log_group_name="AAA", sample=2, sample_size=5)
+        awslogs.start, awslogs.end = 0, 99
+        self.assertEqual([e.timestamp for e in awslogs.iter_events()], [5, 70])
+        self.assertEqual(awslogs.sample_rate, 1.0)
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_main_sample_watch(self, mock_stderr, botoclient):
+        exit_code = main("awslogs get AAA --sample 3 --watch".split())
+        self.assertEqual(
+            mock_stderr.getvalue(),
+            colored("--sample can't be used together with --watch.\n", "red"),
+        )
+        assert exit_code == 9
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_main_sample_positive(self, mock_stderr, botoclient):
+        for argv in ("--sample -2", "--sample 0", "--sample 3 --sample-size -1"):
+            argv = "awslogs get AAA {0}".format(argv).split()
+            self.assertRaises(SystemExit, main, argv)
+        self.assertIn("--sample: must be at least 1, not -2", mock_stderr.getvalue())
+        self.assertIn("--sample-size: must be at least 1", mock_stderr.getvalue())
+        botoclient.assert_not_called()
+
+
+class TestHistogram(unittest.TestCase):
+    def test_counts(self):
+        histogram = Histogram(0, 299999, 60000)
+        histogram.add_many([0, 1, 59999, 60000, 250000, 300000, -1])
+        histogram.add(61000)
+        self.assertEqual(list(histogram.counts[None]), [3, 2, 0, 0, 1])
+
+    def test_max_keys(self):
+        histogram = Histogram(0, 9, 10, max_keys=2)
+        for key in "ABACD":
+            histogram.add(1, key)
+        self.assertEqual(
+            {k: list(v) for k, v in histogram.counts.items()},
+            {"A": [2], "B": [1], Histogram.OTHER: [2]},
+        )
+
+    def test_render_csv(self):
+        histogram = Histogram(0, 119999, 60000)
+        histogram.add(1, "a,b")
+        histogram.add(2, "c")
+        histogram.add(60001, "c")
+        out = StringIO()
+        histogram.render_csv(out)
+        self.assertEqual(
+            out.getvalue(),
+            'bucket,c,"a,b"\n'
+            "1970-01-01T00:00:00.000Z,1,1\n"
+            "1970-01-01T00:01:00.000Z,1,0\n",
+        )
+
+    def test_render_bars(self):
+        histogram = Histogram(0, 119999, 60000)
+        histogram.add_many([1, 2, 3, 4, 60000, 60001])
+        out = StringIO()
+        histogram.render_bars(out, width=4)
+        self.assertEqual(
+            out.getvalue(),
+            "1970-01-01T00:00:00.000Z 4 ████\n" "1970-01-01T00:01:00.000Z 2 ██\n",
+        )
+
+    def test_no_events(self):
+        histogram = Histogram(0, 119999, 60000)
+        out = StringIO()
+        histogram.render_csv(out)
+        self.assertEqual(
+            out.getvalue(),
+            "bucket,count\n"
+            "1970-01-01T00:00:00.000Z,0\n"
+            "1970-01-01T00:01:00.000Z,0\n",
+        )
+        out = StringIO()
+        histogram.render_bars(out)
+        self.assertEqual(
+            out.getvalue(),
+            "1970-01-01T00:00:00.000Z 0 \n" "1970-01-01T00:01:00.000Z 0 \n",
+        )
+
+    def test_invalid_window(self):
+        with self.assertRaises(InvalidWindowError) as cm:
+            Histogram(60000, 0, 1000)
+        self.assertEqual(
+            cm.exception.hint(),
+            "The window ends at 1970-01-01T00:00:00.000Z, "
+            "before it starts at 1970-01-01T00:01:00.000Z.",
+        )
+        self.assertEqual(cm.exception.code, 16)
+        with self.assertRaises(InvalidWindowError) as cm:
+            Histogram(None, 60000, 1000)
+        self.assertIn("needs both a start and an end", cm.exception.hint())
+
+    @patch("awslogs.core.boto3_client")
+    def test_parse_duration(self, botoclient):
+        awslogs = AWSLogs()
+        self.assertEqual(awslogs.parse_duration("250ms"), 250)
+        self.assertEqual(awslogs.parse_duration("30s"), 30000)
+        self.assertEqual(awslogs.parse_duration("5 minutes"), 300000)
+        self.assertEqual(awslogs.parse_duration("1h"), 3600000)
+        self.assertEqual(awslogs.parse_duration("2d"), 172800000)
+        self.assertRaises(UnknownDurationError, awslogs.parse_duration, "soon")
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main_histogram(self, mock_stdout, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [
+                log_event(i, t, '{"level": "%s"}' % level)
+                for i, (t, level) in enumerate(
+                    [(1000, "INFO"), (2000, "ERROR"), (61000, "INFO")]
+                )
+            ]
+        )
+        exit_code = main(
+            "awslogs histogram AAA -s 1970-01-01T00:00:00 -e 1970-01-01T00:01:59 "
+            "--query level --format csv".split()
+        )
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "bucket,INFO,ERROR\n"
+            "1970-01-01T00:00:00.000Z,1,1\n"
+            "1970-01-01T00:01:00.000Z,1,0\n",
+        )
+        assert exit_code == 0
+
+
+class TestSummarize(unittest.TestCase):
+    def test_templates(self):
+        miner = TemplateMiner()
+        for i in range(10):
+            miner.add("GET /users/%d took %d ms" % (i, i * 10), 1000 + i)
+            miner.add("user logged in as alice%d" % i, 2000 + i)
+        miner.add("user logged in as bob", 3000)
+        miner.add("Service started", 500)
+
+        first, second, third = miner.top()
+        self.assertEqual(first.text, "user logged in as <*>")
+        self.assertEqual(first.count, 11)
+        self.assertEqual((first.first, first.last), (2000, 3000))
+        self.assertEqual(first.examples, [("alice0",), ("alice1",), ("alice2",)])
+        self.assertEqual(second.text, "GET <*> took <*> ms")
+        self.assertEqual(second.count, 10)
+        self.assertEqual(third.text, "Service started")
+        self.assertEqual(third.examples, [])
+
+    def test_bounded(self):
+        miner = TemplateMiner(max_templates=3, max_children=2, cache_size=4)
+        for word in "abcdefgh":
+            miner.add(" ".join([word] * 3), 1)
+            miner.add("all good", 1)
+        self.assertEqual(len(miner.templates), 3)
+        self.assertEqual(miner.evicted, 6)
+        self.assertEqual(miner.top(1)[0].count, 8)
+        self.assertTrue(len(miner.cache) <= 4)
+        self.assertTrue(len(miner.root[3]) <= 3)
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main_summarize(self, mock_stdout, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [
+                log_event(i, i * 1000, message + "\n")
+                for i, message in enumerate(
+                    ["took 5 ms", "Service started", "took 7 ms", "took 9 ms"]
+                )
+            ]
+        )
+        exit_code = main(
+            "awslogs get AAA -s 1970-01-01T00:00:00 -e 1970-01-01T00:01:00 "
+            "--summarize --top 1".split()
+        )
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "3 1970-01-01T00:00:00.000Z 1970-01-01T00:00:03.000Z took <*> ms\n"
+            "  5\n"
+            "  7\n"
+            "  9\n",
+        )
+        assert exit_code == 0
+
+        # Only the events left after --grep/--exclude are summarized
+        mock_stdout.truncate(0)
+        mock_stdout.seek(0)
+        exit_code = main(
+            "awslogs get AAA -s 1970-01-01T00:00:00 -e 1970-01-01T00:01:00 "
+            "--summarize --top 1 --grep took --exclude 7".split()
+        )
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "2 1970-01-01T00:00:00.000Z 1970-01-01T00:00:03.000Z took <*> ms\n"
+            "  5\n"
+            "  9\n",
+        )
+        assert exit_code == 0
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.assertEqual(self.write(self.path), 5)
+
+    def write(self, path, **kwargs):
+        writer = ArchiveWriter(path, "AAA", 0, 10000, **kwargs)
+        messages = [
+            ("stream-b", 3000, "GET /health 200\n"),
+            ("stream-a", 1000, "ERROR Timeout talking to db-1\n"),
+            ("stream-a", 2000, "GET /orders 500\n"),
+            ("stream-b", 4000, "ERROR timeout talking to db-2 ünïcode\n"),
+            ("stream-a", 5000, "ERROR Timeout talking to db-3\n"),
+        ]
+        for i, (stream, timestamp, message) in enumerate(messages):
+            writer.add(
+                LogEvent(str(i), timestamp, timestamp + 1, "AAA", stream, message)
+            )
+        return writer.close()
+
+    def search(self, *args, **kwargs):
+        archive = Archive(self.path)
+        try:
+            return [archive.message(i) for i in archive.search(*args, **kwargs)]
+        finally:
+            archive.close()
+
+    def test_sorted_by_timestamp(self):
+        archive = Archive(self.path)
+        self.assertEqual(list(archive.timestamps), [1000, 2000, 3000, 4000, 5000])
+        self.assertEqual(archive.streams, ["stream-b", "stream-a"])
+        self.assertEqual(
+            archive.event(3),
+            LogEvent(
+                None,
+                4000,
+                4001,
+                "AAA",
+                "stream-b",
+                "ERROR timeout talking to db-2 ünïcode\n",
+            ),
+        )
+        archive.close()
+
+    def test_search(self):
+        self.assertEqual(
+            self.search("Timeout"),
+            ["ERROR Timeout talking to db-1\n", "ERROR Timeout talking to db-3\n"],
+        )
+        self.assertEqual(
+            self.search("db-[23]"),
+            [
+                "ERROR timeout talking to db-2 ünïcode\n",
+                "ERROR Timeout talking to db-3\n",
+            ],
+        )
+        self.assertEqual(
+            self.search("(?i)TIMEOUT", start=2000, end=4000),
+            [
+                "ERROR timeout talking to db-2 ünïcode\n",
+            ],
+        )
+        self.assertEqual(
+            self.search("ünï"), ["ERROR timeout talking to db-2 ünïcode\n"]
+        )
+        self.assertEqual(self.search("GET|POST", streams=[1]), ["GET /orders 500\n"])
+        self.assertEqual(self.search("nothing like this"), [])
+
+    def test_chunked_index(self):
+        # Posting lists built and merged a couple of events at a time
+        path = tempfile.mkdtemp()
+        self.write(path, chunk_size=2)
+        self.assertEqual(sorted(os.listdir(path)), sorted(os.listdir(self.path)))
+        for name in os.listdir(path):
+            with open(os.path.join(path, name), "rb") as a:
+                with open(os.path.join(self.path, name), "rb") as b:
+                    self.assertEqual(a.read(), b.read(), name)
+
+    def test_required_literals(self):
+        self.assertEqual(
+            required_literals(re.compile(r"ERROR \w+ db-\d+ x?yz")),
+            [b"ERROR ", b" db-", b" ", b"yz"],
+        )
+        self.assertEqual(required_literals(re.compile("a|b")), [])
+        self.assertEqual(required_literals(re.compile("(?i)abc")), [])
+
+    def test_not_an_archive(self):
+        self.assertRaises(NotAnArchiveError, Archive, tempfile.mkdtemp())
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main_archive(self, mock_stdout, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [
+                log_event(i, i * 1000, "request %d took %d ms\n" % (i, i * 7))
+                for i in range(10)
+            ]
+        )
+        path = os.path.join(tempfile.mkdtemp(), "archive")
+        exit_code = main(
+            (
+                "awslogs archive AAA %s -s 1970-01-01T00:00:00 -e 1970-01-01T00:01:00"
+                % path
+            ).split()
+        )
+        assert exit_code == 0
+        client.filter_log_events.reset_mock()
+
+        exit_code = main(
+            (
+                "awslogs get --archive %s --search took.4 -s 1970-01-01T00:00:00 "
+                "--color never" % path
+            ).split()
+        )
+        assert exit_code == 0
+        self.assertEqual(client.filter_log_events.call_count, 0)
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "AAA DDD request 6 took 42 ms\n" "AAA DDD request 7 took 49 ms\n",
+        )
+
+        mock_stdout.truncate(0)
+        mock_stdout.seek(0)
+        exit_code = main(
+            (
+                "awslogs get --archive %s --search ook --limit 1 "
+                "-s 1970-01-01T00:00:00 --color never" % path
+            ).split()
+        )
+        assert exit_code == 0
+        self.assertEqual(mock_stdout.getvalue(), "AAA DDD request 0 took 0 ms\n")
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_archive_read_offline(self, mock_stdout, botoclient):
+        code = main(
+            "awslogs get --archive {0} -G -S --search db-3".format(self.path).split()
+        )
+        self.assertEqual(code, 0)
+        self.assertEqual(mock_stdout.getvalue(), "ERROR Timeout talking to db-3\n")
+        botoclient.assert_not_called()
+
+    @patch("awslogs.core.boto3_client")
+    def test_search_needs_archive(self, botoclient):
+        self.assertRaises(MissingOptionError, AWSLogs, search="x")
+
+
+class TestSplitByStream(unittest.TestCase):
+    def read(self, path):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as f:
+            return f.read()
+
+    def test_bounded_handles(self):
+        directory = tempfile.mkdtemp()
+        sink = StreamFiles(directory, max_open=2, workers=1, buffer_size=10)
+        names = ["a/1", "b [$LATEST]", "c", "d"]
+        for i in range(20):
+            sink.write(names[i % 4], "line %d\n" % i)
+            self.assertTrue(len(sink.writers[0].handles) <= 2)
+        sink.close()
+
+        self.assertEqual(
+            sorted(os.listdir(directory)),
+            ["a%2F1.log", "b [$LATEST].log", "c.log", "d.log"],
+        )
+        self.assertEqual(
+            self.read(sink.path("a/1")),
+            "".join("line %d\n" % i for i in range(0, 20, 4)),
+        )
+
+    def test_compress(self):
+        directory = tempfile.mkdtemp()
+        sink = StreamFiles(directory, compress=True, max_open=1, workers=1)
+        sink.write("a", "first\n")
+        sink.flush()
+        sink.write("b", "other\n")
+        sink.flush()
+        sink.write("a", "second\n")
+        sink.close()
+        self.assertEqual(self.read(sink.path("a")), "first\nsecond\n")
+        self.assertTrue(sink.path("a").endswith("a.log.gz"))
+
+    def test_write_errors(self):
+        directory = tempfile.mkdtemp()
+        sink = StreamFiles(directory, workers=1, buffer_size=1)
+        os.mkdir(sink.path("a"))
+        sink.write("a", "line\n")
+        self.assertRaises(IsADirectoryError, sink.close)
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_main_split_by_stream(self, mock_stderr, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [
+                log_event(i, i * 1000, "event %d\n" % i, stream="stream-%d" % (i % 3))
+                for i in range(7)
+            ]
+        )
+        directory = tempfile.mkdtemp()
+        exit_code = main(
+            (
+                "awslogs get AAA -s 1970-01-01T00:00:00 -e 1970-01-01T00:01:00 "
+                "--split-by-stream %s --timestamp" % directory
+            ).split()
+        )
+        assert exit_code == 0
+        self.assertEqual(
+            sorted(os.listdir(directory)),
+            ["stream-0.log", "stream-1.log", "stream-2.log"],
+        )
+        self.assertEqual(
+            self.read(os.path.join(directory, "stream-1.log")),
+            "1970-01-01T00:00:01.000Z event 1\n1970-01-01T00:00:04.000Z event 4\n",
+        )
+        self.assertEqual(
+            mock_stderr.getvalue(), "Wrote 7 events of 3 streams to %s\n" % directory
+        )
+
+    @patch("awslogs.pipeline._entry_points")
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_main_split_by_stream_stages(self, mock_stderr, botoclient, entry_points):
+        entry_point = Mock()
+        entry_point.name = "upper"
+        entry_point.load.return_value = UpperStage
+        entry_points.return_value = [entry_point]
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [
+                log_event(i, i * 1000, "event %d\n" % i, stream="stream-%d" % (i % 2))
+                for i in range(6)
+            ]
+        )
+        directory = tempfile.mkdtemp()
+        exit_code = main(
+            (
+                "awslogs get AAA -s 1970-01-01T00:00:00 -e 1970-01-01T00:01:00 "
+                "--split-by-stream %s --grep [0-3] --stage upper --limit 3" % directory
+            ).split()
+        )
+        assert exit_code == 0
+        self.assertEqual(
+            self.read(os.path.join(directory, "stream-0.log")), "EVENT 0\nEVENT 2\n"
+        )
+        self.assertEqual(
+            self.read(os.path.join(directory, "stream-1.log")), "EVENT 1\n"
+        )
+        self.assertEqual(
+            mock_stderr.getvalue(), "Wrote 3 events of 2 streams to %s\n" % directory
+        )
+
+
+class TestExternalSorter(unittest.TestCase):
+    def event(self, timestamp):
+        return LogEvent(str(timestamp), timestamp, timestamp, "AAA", "DDD", "x")
+
+    def test_spills_and_merges(self):
+        sorter = ExternalSorter(max_memory=4, size=lambda event: 1)
+        sorter.CHUNK_SIZE = 3
+        timestamps = [9, 3, 7, 1, 8, 2, 6, 4, 5, 0, 11, 10]
+        sorter.add_many(self.event(t) for t in timestamps)
+        self.assertEqual(sorter.runs, 3)
+        self.assertEqual(sorter.spilled, 12)
+        self.assertEqual([e.timestamp for e in sorter.pop(5)], list(range(6)))
+        sorter.add(self.event(5))
+        self.assertEqual([e.timestamp for e in sorter.pop()], [5, 6, 7, 8, 9, 10, 11])
+        sorter.close()
+
+    def test_ties_keep_insertion_order(self):
+        sorter = ExternalSorter(max_memory=2, size=lambda event: 1)
+        events = [
+            LogEvent(str(i), t, t, "AAA", "DDD", "x")
+            for i, t in enumerate([1, 1, 0, 1, 0])
+        ]
+        sorter.add_many(events)
+        self.assertEqual([e.event_id for e in sorter.pop()], ["2", "4", "0", "1", "3"])
+
+    @patch("awslogs.core.boto3_client")
+    def test_fan_out_spilling(self, botoclient):
+        TestFanOut._clients(
+            None,
+            botoclient,
+            {
+                ("p", "r1"): TestFanOut._client(None, range(0, 300, 3)),
+                ("p", "r2"): TestFanOut._client(None, range(1, 300, 3)),
+                ("p", "r3"): TestFanOut._client(None, range(2, 300, 3)),
+            },
+        )
+        awslogs = AWSLogs(log_group_name="AAA", aws_profile="p", aws_region="r1,r2,r3")
+        awslogs.sort_memory = 10 * EVENT_OVERHEAD
+        events = list(awslogs.iter_events())
+        self.assertEqual([e.timestamp for e in events], list(range(300)))
+
+    @patch("awslogs.core.boto3_client")
+    def test_unordered(self, botoclient):
+        TestFanOut._clients(
+            None,
+            botoclient,
+            {
+                ("p", "r1"): TestFanOut._client(None, [1, 4, 5]),
+                ("p", "r2"): TestFanOut._client(None, [2, 3]),
+            },
+        )
+        awslogs = AWSLogs(
+            log_group_name="AAA", aws_profile="p", aws_region="r1,r2", unordered=True
+        )
+        timestamps = [e.timestamp for e in awslogs.iter_events()]
+        self.assertEqual(sorted(timestamps), [1, 2, 3, 4, 5])
+        self.assertEqual([t for t in timestamps if t in (1, 4, 5)], [1, 4, 5])
+
+
+class TestStreamDiscovery(unittest.TestCase):
+    def _discovery(self, client, streams, **kwargs):
+        discovery = StreamDiscovery(
+            client, "AAA", "web-", streams, 3600, threading.Event(), **kwargs
+        )
+        self.addCleanup(discovery.close)
+        return discovery
+
+    def test_refresh(self):
+        now = int(time.time() * 1000)
+        client = Mock()
+        client.describe_log_streams.side_effect = [
+            {
+                "logStreams": [
+                    {"logStreamName": "web-3", "lastEventTimestamp": now},
+                    {"logStreamName": "worker-1", "lastEventTimestamp": now},
+                    {"logStreamName": "web-1", "lastEventTimestamp": now - 10},
+                ],
+                "nextToken": "next",
+            },
+            {
+                "logStreams": [
+                    {"logStreamName": "web-long-name", "creationTime": now - 20},
+                    {"logStreamName": "web-old", "lastEventTimestamp": 0},
+                    {"logStreamName": "web-older", "lastEventTimestamp": 0},
+                ],
+                "nextToken": "never used",
+            },
+        ]
+        stats = Stats()
+        discovery = self._discovery(client, ["web-1", "web-2"], stats=stats)
+        self.assertEqual(discovery.refresh(), ["web-3", "web-long-name"])
+        self.assertEqual(
+            discovery.streams, ["web-1", "web-2", "web-3", "web-long-name"]
+        )
+        self.assertEqual(discovery.version, 1)
+        self.assertEqual(discovery.max_length, len("web-long-name"))
+        self.assertEqual(client.describe_log_streams.call_count, 2)
+        self.assertEqual(
+            client.describe_log_streams.call_args_list[0],
+            call(
+                logGroupName="AAA", orderBy="LastEventTime", descending=True, limit=50
+            ),
+        )
+        self.assertEqual(stats["describe_log_streams"], 2)
+        self.assertEqual(stats["streams discovered"], 2)
+
+        client.describe_log_streams.side_effect = None
+        client.describe_log_streams.return_value = {"logStreams": []}
+        self.assertEqual(discovery.refresh(), [])
+        self.assertEqual(discovery.version, 1)
+
+    def test_max_streams(self):
+        now = int(time.time() * 1000)
+        client = Mock()
+        client.describe_log_streams.return_value = {
+            "logStreams": [
+                {"logStreamName": "web-3", "lastEventTimestamp": now},
+                {"logStreamName": "web-1", "lastEventTimestamp": now - 10},
+            ]
+        }
+        discovery = self._discovery(client, ["web-1", "web-2"], max_streams=2)
+        discovery.refresh()
+        self.assertEqual(discovery.streams, ["web-3", "web-1"])
+
+    @patch("awslogs.core.boto3_client")
+    def test_watch_picks_up_new_streams(self, botoclient):
+        now = int(time.time() * 1000)
+        client = botoclient.return_value
+        client.get_paginator.return_value.paginate.return_value = [
+            {"logStreams": [{"logStreamName": "web-1"}]}
+        ]
+        client.describe_log_streams.return_value = {
+            "logStreams": [{"logStreamName": "web-2", "lastEventTimestamp": now}]
+        }
+
+        def event(event_id, timestamp, stream):
+            return log_event(event_id, timestamp, "Hello", stream=stream)
+
+        calls = []
+
+        def filter_log_events(**kwargs):
+            calls.append(dict(kwargs, logStreamNames=list(kwargs["logStreamNames"])))
+            if len(calls) == 1:
+                return {"events": [event("1", 100, "web-1")], "nextToken": "a"}
+            return {"events": [event("1", 100, "web-1"), event("2", 150, "web-2")]}
+
+        client.filter_log_events.side_effect = filter_log_events
+
+        awslogs = AWSLogs(
+            log_group_name="AAA",
+            log_stream_name="web-",
+            watch=True,
+            watch_interval=0.01,
+            rediscover=3600,
+            start="1/1/1970",
+        )
+        pages = awslogs.iter_events(batched=True)
+        self.assertEqual([e.event_id for e in next(pages)], ["1"])
+        awslogs.discovery.refresh()
+        self.assertEqual([e.event_id for e in next(pages)], ["2"])
+        pages.close()
+
+        self.assertEqual(calls[0]["logStreamNames"], ["web-1"])
+        self.assertEqual(calls[1]["logStreamNames"], ["web-1", "web-2"])
+        self.assertEqual(calls[1]["startTime"], 100)
+        self.assertNotIn("nextToken", calls[1])
+        self.assertEqual(awslogs.stats["filter_log_events"], 2)
+
+    @patch("awslogs.core.boto3_client")
+    def test_new_stream_older_than_position(self, botoclient):
+        now = int(time.time() * 1000)
+        client = botoclient.return_value
+        client.get_paginator.return_value.paginate.return_value = [
+            {"logStreams": [{"logStreamName": "web-1"}]}
+        ]
+        client.describe_log_streams.return_value = {
+            "logStreams": [
+                {
+                    "logStreamName": "web-2",
+                    "firstEventTimestamp": now + 90,
+                    "lastEventTimestamp": now + 120,
+                }
+            ]
+        }
+        events = [
+            log_event(event_id, timestamp, "Hello", stream=stream)
+            for event_id, timestamp, stream in [
+                ("1", now + 50, "web-1"),
+                ("3", now + 90, "web-2"),
+                ("2", now + 100, "web-1"),
+                ("4", now + 120, "web-2"),
+            ]
+        ]
+        calls = []
+
+        def filter_log_events(**kwargs):
+            calls.append(kwargs)
+            return {
+                "events": [
+                    e
+                    for e in events
+                    if e["logStreamName"] in kwargs["logStreamNames"]
+                    and e["timestamp"] >= kwargs.get("startTime", 0)
+                ]
+            }
+
+        client.filter_log_events.side_effect = filter_log_events
+        awslogs = AWSLogs(
+            log_group_name="AAA",
+            log_stream_name="web-",
+            watch=True,
+            watch_interval=0.01,
+            rediscover=3600,
+            start="1/1/1970",
+        )
+        pages = awslogs.iter_events(batched=True)
+        self.assertEqual([e.event_id for e in next(pages)], ["1", "2"])
+        awslogs.discovery.refresh()
+        # web-2 started logging before the newest event read from web-1
+        self.assertEqual([e.event_id for e in next(pages)], ["3", "4"])
+        pages.close()
+        self.assertLessEqual(calls[-1]["startTime"], now + 90)
+
+    def test_trimmed_streams_not_found_again(self):
+        now = int(time.time() * 1000)
+        client = Mock()
+        client.describe_log_streams.return_value = {
+            "logStreams": [
+                {"logStreamName": name, "firstEventTimestamp": 0, **times}
+                for name, times in [
+                    ("web-c", {"lastEventTimestamp": now}),
+                    ("web-d", {"lastEventTimestamp": now - 5}),
+                    ("web-a", {"lastEventTimestamp": now - 10}),
+                ]
+            ]
+        }
+        stats = Stats()
+        discovery = self._discovery(
+            client, ["web-a", "web-b"], max_streams=2, stats=stats
+        )
+        previous = discovery.refreshed_at
+        self.assertEqual(discovery.refresh(), ["web-c", "web-d"])
+        self.assertEqual(discovery.streams, ["web-c", "web-d"])
+        # They existed before watching started, only the last refresh is
+        # read again
+        self.assertEqual(discovery.replay_from, previous)
+
+        # web-a and web-b are trimmed but still active, nothing changes
+        for _ in range(3):
+            self.assertEqual(discovery.refresh(), [])
+        self.assertEqual(discovery.version, 1)
+        self.assertEqual(stats["streams discovered"], 2)
+
+        # A stream created since watching started is read from its first event
+        discovery.refreshed_at = now + 1000
+        client.describe_log_streams.return_value = {
+            "logStreams": [
+                {
+                    "logStreamName": "web-e",
+                    "firstEventTimestamp": discovery.started,
+                    "lastEventTimestamp": now + 10,
+                }
+            ]
+        }
+        self.assertEqual(discovery.refresh(), ["web-e"])
+        self.assertEqual(discovery.streams, ["web-e", "web-c"])
+        self.assertEqual(discovery.replay_from, discovery.started)
+        self.assertEqual(discovery.version, 2)
+
+    def test_formatter_grows_streams(self):
+        formatter = LineFormatter(lambda text, color: text, 3, 5, grow_streams=True)
+        event = LogEvent("1", 0, 0, "AAA", "web-1", "x")
+        self.assertEqual(formatter.format(event, "x"), "AAA web-1 x")
+        event = event._replace(stream="web-123")
+        self.assertEqual(formatter.format(event, "x"), "AAA web-123 x")
+        event = event._replace(stream="web-1")
+        self.assertEqual(formatter.format(event, "x"), "AAA web-1   x")
+
+    def test_stats_report(self):
+        clock = iter([0.0, 2.0]).__next__
+        stats = Stats(clock)
+        stats.incr("filter_log_events", 3)
+        stats.incr("describe_log_streams")
+        out = StringIO()
+        stats.report(out)
+        self.assertEqual(
+            out.getvalue(),
+            "describe_log_streams        1       0.50/s\n"
+            "filter_log_events           3       1.50/s\n",
+        )
+
+
+class TestWatchOverlap(unittest.TestCase):
+    @patch("awslogs.core.boto3_client")
+    def test_cursor(self, botoclient):
+        events = []
+
+        def add(event_id, timestamp, ingestion_time=None):
+            events.append(
+                log_event(event_id, timestamp, "Hello", ingestion_time=ingestion_time)
+            )
+            events.sort(key=lambda e: e["timestamp"])
+
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(events)
+        awslogs = AWSLogs(
+            log_group_name="AAA",
+            watch=True,
+            watch_interval=0,
+            watch_overlap="10s",
+            start="1/1/1970",
+        )
+        pages = awslogs.iter_events(batched=True)
+
+        def read():
+            return [e.event_id for e in next(pages)]
+
+        add("a", 100000)
+        add("b", 101000)
+        self.assertEqual(read(), ["a", "b"])
+        add("c", 95000, ingestion_time=103000)
+        add("d", 102000)
+        self.assertEqual(read(), ["c"])
+        self.assertEqual(read(), ["d"])
+        add("e", 200000)
+        self.assertEqual(read(), ["e"])
+        # Ingested 35s late, so the next rounds go 35s back
+        add("f", 195000, ingestion_time=230000)
+        self.assertEqual(read(), ["f"])
+        add("g", 165000)
+        self.assertEqual(read(), ["g"])
+        pages.close()
+
+        start_times = [
+            kwargs["startTime"]
+            for _, kwargs in client.filter_log_events.call_args_list
+            if "nextToken" not in kwargs
+        ]
+        self.assertEqual(start_times, [0, 91000, 92000, 190000, 165000])
+        self.assertEqual(
+            awslogs.stats["filter_log_events"], client.filter_log_events.call_count
+        )
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render(self):
+        stats = Stats(track_events=True)
+        events = [
+            LogEvent("1", 1000, 1500, "AAA", "DDD", "x"),
+            LogEvent("2", 3000, 3250, "AAA", "DDD", "x"),
+            LogEvent("3", 2000, 2000, "AAA", 'E"E', "x"),
+        ]
+        stats.observe_events(events, now=5000)
+        stats.observe("filter_log_events", 0.25)
+        stats.observe("filter_log_events", 0.5)
+        stats.incr("filter_log_events", 2)
+        stats.incr("duplicates dropped", 4)
+        self.assertEqual(
+            render(stats),
+            "# TYPE awslogs_events counter\n"
+            "# HELP awslogs_events Events read, per group and stream.\n"
+            'awslogs_events_total{group="AAA",stream="DDD"} 2\n'
+            'awslogs_events_total{group="AAA",stream="E\\"E"} 1\n'
+            "# TYPE awslogs_lag_seconds gauge\n"
+            "# HELP awslogs_lag_seconds Time between the newest event read and "
+            "when it was read.\n"
+            'awslogs_lag_seconds{group="AAA"} 2.0\n'
+            "# TYPE awslogs_ingestion_lag_seconds gauge\n"
+            "# HELP awslogs_ingestion_lag_seconds Time CloudWatch took to ingest "
+            "the newest event read.\n"
+            'awslogs_ingestion_lag_seconds{group="AAA"} 0.25\n'
+            "# TYPE awslogs_filter_log_events_seconds summary\n"
+            "# HELP awslogs_filter_log_events_seconds Duration of "
+            "filter_log_events requests.\n"
+            "awslogs_filter_log_events_seconds_count 2\n"
+            "awslogs_filter_log_events_seconds_sum 0.75\n"
+            "# TYPE awslogs_duplicates_dropped counter\n"
+            "# HELP awslogs_duplicates_dropped Number of duplicates dropped.\n"
+            "awslogs_duplicates_dropped_total 4\n"
+            "# TYPE awslogs_filter_log_events counter\n"
+            "# HELP awslogs_filter_log_events Number of filter_log_events.\n"
+            "awslogs_filter_log_events_total 2\n"
+            "# TYPE awslogs_throttles counter\n"
+            "# HELP awslogs_throttles Number of throttles.\n"
+            "awslogs_throttles_total 0\n"
+            "# EOF\n",
+        )
+
+    def test_events_not_tracked_by_default(self):
+        stats = Stats()
+        stats.observe_events([LogEvent("1", 1000, 1500, "AAA", "DDD", "x")])
+        self.assertEqual(stats.events, {})
+
+    def test_count_throttles(self):
+        client = Mock()
+        client.meta.events = HierarchicalEmitter()
+        stats = Stats()
+        count_throttles(client, stats)
+        for code in ("ThrottlingException", "ResourceNotFoundException"):
+            client.meta.events.emit(
+                "needs-retry.cloudwatch-logs.FilterLogEvents",
+                response=(Mock(), {"Error": {"Code": code}}),
+                attempts=1,
+            )
+        client.meta.events.emit(
+            "needs-retry.cloudwatch-logs.FilterLogEvents", response=None, attempts=1
+        )
+        self.assertEqual(stats["throttles"], 1)
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_serve(self, mock_stdout, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [log_event(i, i, "Hello") for i in range(5)]
+        )
+        awslogs = AWSLogs(
+            log_group_name="AAA", metrics_port=0, start="1/1/1970", color="never"
+        )
+        awslogs.list_logs()
+        self.addCleanup(awslogs.metrics.close)
+
+        url = "http://127.0.0.1:{0}/metrics".format(awslogs.metrics.port)
+        with urlopen(url) as response:
+            self.assertEqual(response.headers["Content-Type"], CONTENT_TYPE)
+            body = response.read().decode("utf-8")
+        self.assertIn('awslogs_events_total{group="AAA",stream="DDD"} 5\n', body)
+        self.assertIn("awslogs_filter_log_events_total 2\n", body)
+        self.assertIn("awslogs_filter_log_events_seconds_count 2\n", body)
+        self.assertTrue(body.endswith("# EOF\n"))
+
+
+class UpperStage(Stage):
+    name = "upper"
+
+    def __init__(self, logs):
+        self.pages = 0
+        self.closed = False
+
+    def process(self, page):
+        self.pages += 1
+        return [e._replace(message=e.message.upper()) for e in page]
+
+    def close(self):
+        self.closed = True
+
+
+class TestPipeline(unittest.TestCase):
+    def test_query_stage(self):
+        import jmespath
+
+        stage = QueryStage(jmespath.compile("foo"))
+        page = [
+            LogEvent("1", 0, 0, "AAA", "DDD", '{"foo": "bar"}'),
+            LogEvent("2", 0, 0, "AAA", "DDD", '{"foo": {"bar": 1}}'),
+            LogEvent("3", 0, 0, "AAA", "DDD", "plain"),
+        ]
+        self.assertEqual(
+            [e.message for e in stage.process(page)], ["bar", '{"bar": 1}', "plain"]
+        )
+
+    def test_run(self):
+        profiler = Profiler(None)
+        upper = UpperStage(None)
+        seen = []
+
+        class Collect(Stage):
+            name = "collect"
+
+            def process(self, page):
+                seen.extend(e.message for e in page)
+                return page
+
+        pages = [
+            [LogEvent("1", 0, 0, "AAA", "DDD", "a")],
+            [],
+            (LogEvent("2", 0, 0, "AAA", "DDD", "c"),),
+            [LogEvent("3", 0, 0, "AAA", "DDD", "b")],
+        ]
+        Pipeline([GrepStage(exclude=["c"]), upper, Collect()], profiler).run(pages)
+        self.assertEqual(seen, ["A", "B"])
+        # Empty pages stop before reaching a stage
+        self.assertEqual(upper.pages, 2)
+        self.assertTrue(upper.closed)
+        self.assertEqual(
+            sorted(profiler.samples),
+            ["awslogs;collect", "awslogs;grep", "awslogs;upper"],
+        )
+
+    @patch("awslogs.pipeline._entry_points")
+    def test_load_stage(self, entry_points):
+        entry_point = Mock()
+        entry_point.name = "upper"
+        entry_point.load.return_value = UpperStage
+        entry_points.return_value = [entry_point]
+
+        self.assertIsInstance(load_stage("upper", None), UpperStage)
+        with self.assertRaises(UnknownStageError) as cm:
+            load_stage("geoip", None)
+        self.assertEqual(cm.exception.code, 13)
+
+    @patch("awslogs.pipeline._entry_points")
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main_stage(self, mock_stdout, botoclient, entry_points):
+        entry_point = Mock()
+        entry_point.name = "upper"
+        entry_point.load.return_value = UpperStage
+        entry_points.return_value = [entry_point]
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [log_event(i, i, "Hello {0}".format(i)) for i in range(4)]
+        )
+        code = main(
+            "awslogs get AAA --no-color -G -S -s 1/1/1970 " "--stage upper".split()
+        )
+        self.assertEqual(code, 0)
+        self.assertEqual(
+            mock_stdout.getvalue(),
+            "HELLO 0\nHELLO 1\nHELLO 2\nHELLO 3\n",
+        )
+
+    @patch("sys.stderr", new_callable=StringIO)
+    @patch("awslogs.core.boto3_client")
+    def test_main_unknown_stage(self, botoclient, mock_stderr):
+        code = main("awslogs get AAA -s 1/1/1970 --stage geoip".split())
+        self.assertEqual(code, 13)
+        self.assertIn("There is no 'geoip' stage.", mock_stderr.getvalue())
+
+
+class TestGrep(unittest.TestCase):
+    def page(self, *messages):
+        return [LogEvent(str(i), i, i, "AAA", "DDD", m) for i, m in enumerate(messages)]
+
+    def test_matching(self):
+        regex = re.compile(r"\w+ timed out", re.MULTILINE)
+        messages = ["ok", "task timed out", "timed out", "x", "job timed out"]
+        self.assertEqual(list(matching(regex, "timed out", messages)), [1, 4])
+        self.assertEqual(list(matching(regex, "timed out", ["ok"])), [])
+
+    def test_matching_multiline_messages(self):
+        regex = re.compile(r"^b timed out$", re.MULTILINE)
+        messages = ["a\nb timed out\n", "b\ntimed out", "c", "a\nb timed out"]
+        self.assertEqual(list(matching(regex, "timed out", messages)), [0, 3])
+
+    def test_grep_stage(self):
+        page = self.page("GET /a 200", "GET /b 500", "POST /a 500", "GET /c 404")
+        stage = GrepStage([r"\w+ /\w 5\d\d", "404$"], exclude=["POST"])
+        self.assertEqual(
+            [e.message for e in stage.process(page)], ["GET /b 500", "GET /c 404"]
+        )
+        stage = GrepStage(exclude=[r"\w+ /a"])
+        self.assertEqual(
+            [e.message for e in stage.process(page)], ["GET /b 500", "GET /c 404"]
+        )
+
+    def test_grep_stage_dense_pages(self):
+        stage = GrepStage([r"\d+ ms"])
+        self.assertEqual(stage.matching.literal, " ms")
+        page = self.page(*["took {0} ms".format(i) for i in range(10)] + ["x"])
+        self.assertEqual(len(stage.process(page)), 10)
+        self.assertTrue(stage.matching.dense)
+        page = self.page("x", "y", "took 1 ms")
+        self.assertEqual([e.message for e in stage.process(page)], ["took 1 ms"])
+        self.assertTrue(stage.matching.dense)
+        self.assertEqual(stage.process(self.page(*["x"] * 20)), [])
+        self.assertFalse(stage.matching.dense)
+
+    def test_invalid_pattern(self):
+        with self.assertRaises(InvalidPatternError) as cm:
+            GrepStage(["ok", "(unclosed"])
+        self.assertEqual(cm.exception.code, 14)
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main(self, mock_stdout, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [
+                log_event(i, i, message)
+                for i, message in enumerate(
+                    ["GET /a 200", "GET /b 500", "POST /a 500", "GET /c 404", "ok"]
+                )
+            ]
+        )
+        code = main(
+            "awslogs get AAA -G -S -s 1/1/1970 --grep [45]0[04] "
+            "--exclude ^POST".split()
+        )
+        self.assertEqual(code, 0)
+        self.assertEqual(mock_stdout.getvalue(), "GET /b 500\nGET /c 404\n")
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_limit_counts_matches(self, mock_stdout, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [
+                log_event(
+                    i, i, "INFO {0}".format(i) if i < 3 else "ERROR {0}".format(i)
+                )
+                for i in range(12)
+            ]
+        )
+        code = main("awslogs get AAA -G -S -s 1/1/1970 --grep ERROR --limit 3".split())
+        self.assertEqual(code, 0)
+        self.assertEqual(mock_stdout.getvalue(), "ERROR 3\nERROR 4\nERROR 5\n")
+        # Reading stopped once enough events matched
+        self.assertLess(client.filter_log_events.call_count, 4)
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_counts_must_be_positive(self, mock_stderr, botoclient):
+        for option in ("--limit", "--tail"):
+            for value in ("0", "-1", "x"):
+                argv = ["awslogs", "get", "AAA", option, value]
+                self.assertRaises(SystemExit, main, argv)
+        self.assertIn("--tail: invalid int value: 'x'", mock_stderr.getvalue())
+        self.assertIn("--limit: must be at least 1, not -1", mock_stderr.getvalue())
+        botoclient.assert_not_called()
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_tail_rejected(self, mock_stderr, botoclient):
+        code = main("awslogs get AAA --grep ERROR --tail 3".split())
+        self.assertEqual(code, 9)
+        self.assertIn(
+            "--tail can't be used together with --grep", mock_stderr.getvalue()
+        )
+        code = main("awslogs get AAA --stage upper --tail 3".split())
+        self.assertEqual(code, 9)
+
+
+class TestOverflowBuffer(unittest.TestCase):
+    def pages(self, count=3, size=10):
+        return [
+            [
+                LogEvent(str(i), i * 1000, i, "AAA", "DDD", "x")
+                for i in range(n, n + size)
+            ]
+            for n in range(0, count * size, size)
+        ]
+
+    def read(self, buffer):
+        return [e.timestamp // 1000 for page in buffer for e in page]
+
+    def filled(self, policy, capacity=15):
+        buffer = OverflowBuffer(self.pages(), policy, capacity)
+        self.addCleanup(buffer.close)
+        buffer.thread.join()
+        return buffer
+
+    def test_drop_oldest(self):
+        buffer = self.filled("drop-oldest")
+        self.assertEqual(self.read(buffer), list(range(15, 30)))
+        self.assertEqual(buffer.dropped, 15)
+
+    def test_sample(self):
+        stats = Stats()
+        buffer = OverflowBuffer(self.pages(), "sample", 15, stats=stats)
+        buffer.thread.join()
+        self.assertEqual(buffer.stride, 4)
+        self.assertEqual(
+            self.read(buffer), [0, 4, 8, 11, 13, 15, 17, 19, 20, 22, 24, 26, 28]
+        )
+        self.assertEqual(buffer.dropped, 17)
+        self.assertEqual(stats["events dropped"], 17)
+        self.assertEqual(buffer.stride, 1)
+
+    def test_spill(self):
+        buffer = self.filled("spill")
+        self.assertEqual(buffer.spilled, 20)
+        self.assertEqual(len(next(buffer)), 10)
+        self.assertEqual(self.read(buffer), list(range(10, 30)))
+        self.assertEqual(buffer.dropped, 0)
+        self.assertEqual(buffer.spill.tell(), 0)
+
+    def test_block(self):
+        buffer = OverflowBuffer(self.pages(), "block", 15)
+        self.addCleanup(buffer.close)
+        buffer.thread.join(0.3)
+        # The reader waits for the third page
+        self.assertTrue(buffer.thread.is_alive())
+        self.assertEqual(len(buffer.buffer), 10)
+        self.assertEqual(self.read(buffer), list(range(30)))
+        self.assertEqual(buffer.dropped, 0)
+
+    def test_error(self):
+        def pages():
+            yield self.pages(1)[0]
+            raise ValueError("boom")
+
+        buffer = OverflowBuffer(pages(), "drop-oldest", 15)
+        buffer.thread.join()
+        self.assertEqual(len(next(buffer)), 10)
+        with self.assertRaises(ValueError):
+            next(buffer)
+
+    def test_status(self):
+        buffer = OverflowBuffer(self.pages(), "spill", 15, clock=lambda: 12.5)
+        buffer.thread.join()
+        self.assertEqual(
+            buffer.status(), "0.0s behind, 10 buffered, 20 spilled, 0 dropped"
+        )
+        next(buffer)
+        self.assertEqual(
+            buffer.status(), "3.5s behind, 0 buffered, 20 spilled, 0 dropped"
+        )
+        buffer.close()
+
+    @unittest.skipUnless(hasattr(os, "openpty"), "needs a terminal")
+    def test_status_stream(self):
+        terminals = []
+        for _ in range(2):
+            master, slave = os.openpty()
+            self.addCleanup(os.close, master)
+            terminals.append(open(slave, "w"))
+            self.addCleanup(terminals[-1].close)
+        tty, other = terminals
+        self.assertIsNone(status_stream(StringIO()))
+        self.assertIs(status_stream(tty), tty)
+        self.assertIs(status_stream(tty, StringIO()), tty)
+        self.assertIs(status_stream(tty, other), tty)
+        # Events printed on the same terminal
+        with open(os.dup(tty.fileno()), "w") as same:
+            self.assertIsNone(status_stream(tty, same))
+        self.assertIsNone(status_stream(tty, tty))
+
+    @patch("sys.stderr", new_callable=StringIO)
+    @patch("awslogs.core.boto3_client")
+    def test_requires_watch(self, botoclient, mock_stderr):
+        code = main("awslogs get AAA --overflow spill".split())
+        self.assertEqual(code, 12)
+        self.assertIn(
+            "--overflow can only be used together with --watch.",
+            mock_stderr.getvalue(),
+        )
+
+
+class TestStreamsListing(unittest.TestCase):
+    def stream(self, name, first, last, size=0):
+        return {
+            "logStreamName": name,
+            "creationTime": first,
+            "firstEventTimestamp": first,
+            "lastEventTimestamp": last,
+            "lastIngestionTime": last + 1,
+            "storedBytes": size,
+        }
+
+    def client(self, botoclient, streams, groups=()):
+        client = botoclient.return_value
+        self.requests = []
+
+        def paginate(**kwargs):
+            self.requests.append(kwargs)
+            group = kwargs["logGroupName"]
+            if isinstance(streams[group], Exception):
+                raise streams[group]
+            listed = streams[group]
+            if kwargs.get("orderBy") == "LastEventTime":
+                listed = sorted(listed, key=lambda s: -s["lastEventTimestamp"])
+            for n in range(0, len(listed), 2):
+                self.pages.append(group)
+                yield {"logStreams": listed[n : n + 2]}
+
+        def get_paginator(name):
+            paginator = Mock()
+            if name == "describe_log_groups":
+                paginator.paginate.return_value = [
+                    {"logGroups": [{"logGroupName": g} for g in groups]}
+                ]
+            else:
+                paginator.paginate.side_effect = paginate
+            return paginator
+
+        self.pages = []
+        client.get_paginator.side_effect = get_paginator
+        return client
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_several_groups(self, mock_stdout, botoclient):
+        self.client(
+            botoclient,
+            {
+                "AAA": [self.stream("a1", 0, 1000, 10), self.stream("a2", 0, 2000)],
+                "BBB": [self.stream("b1", 1000, 86400000, 20)],
+            },
+        )
+        code = main("awslogs streams AAA BBB -s 1/1/1970 --metadata".split())
+        self.assertEqual(code, 0)
+        self.assertEqual(
+            sorted(mock_stdout.getvalue().splitlines()),
+            [
+                "AAA a1 1970-01-01T00:00:00.000Z 1970-01-01T00:00:01.000Z 10",
+                "AAA a2 1970-01-01T00:00:00.000Z 1970-01-01T00:00:02.000Z 0",
+                "BBB b1 1970-01-01T00:00:01.000Z 1970-01-02T00:00:00.000Z 20",
+            ],
+        )
+
+    @patch("sys.stderr", new_callable=StringIO)
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_prefix(self, mock_stdout, botoclient, mock_stderr):
+        self.client(
+            botoclient,
+            {
+                "/app/a": [self.stream("a1", 0, 1000)],
+                "/app/b": ValueError("gone"),
+                "/app/c": [self.stream("c1", 0, 1000)],
+            },
+            groups=["/app/b", "/app/c"],
+        )
+        code = main("awslogs streams /app/a -p /app/ -s 1/1/1970 --workers 1".split())
+        self.assertEqual(code, 0)
+        self.assertEqual(mock_stdout.getvalue(), "/app/a a1\n/app/c c1\n")
+        self.assertEqual(mock_stderr.getvalue(), colored("/app/b: gone\n", "yellow"))
+
+    @patch("awslogs.core.boto3_client")
+    def test_latest_first_stops_early(self, botoclient):
+        day = 24 * 60 * 60 * 1000
+        self.client(
+            botoclient,
+            {"AAA": [self.stream(str(n), 0, n * day) for n in range(1, 9)]},
+        )
+        awslogs = AWSLogs(log_group_name="AAA", latest_first=True)
+        awslogs.start = 5 * day + StreamDiscovery.LAST_EVENT_LAG
+        # 5 is outside the window, but recent enough to keep looking
+        self.assertEqual(list(awslogs.get_streams()), ["8", "7", "6"])
+        self.assertEqual(self.requests[0]["orderBy"], "LastEventTime")
+        self.assertTrue(self.requests[0]["descending"])
+        # The page holding 4 and 3 tells listing to stop
+        self.assertEqual(len(self.pages), 3)
+
+    def test_interleaver_workers(self):
+        running, seen = [0], []
+        lock = threading.Lock()
+
+        def work(n):
+            with lock:
+                running[0] += 1
+                seen.append(running[0])
+            time.sleep(0.01)
+            yield n
+            with lock:
+                running[0] -= 1
+
+        items = Interleaver([work(n) for n in range(10)], workers=3)
+        self.assertEqual(sorted(items), list(range(10)))
+        self.assertEqual(len(items.threads), 3)
+        self.assertLessEqual(max(seen), 3)
+
+
+class TestCompletion(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        environ = patch.dict(
+            os.environ,
+            {
+                "AWSLOGS_CACHE_DIR": self.dir,
+                "AWS_PROFILE": "",
+                "AWS_REGION": "",
+                "AWS_DEFAULT_REGION": "",
+            },
+        )
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.catalog = completion.Catalog(completion.catalog_path())
+        groups = ["/aws/lambda/f{0:03d}".format(n) for n in range(300)]
+        self.catalog.replace("g", None, groups + ["/app/api", "/app/web"])
+        self.catalog.replace("s", "/app/api", ["2024/01/02/b", "2024/01/01/a", "x"])
+        self.catalog.replace("s", "/app/apiv2", ["2024/01/01/z"])
+
+    def complete(self, line, background=False):
+        words = line.split(" ")
+        return completion.complete(words, len(words) - 1, background=background)
+
+    def test_catalog(self):
+        self.assertEqual(self.catalog.groups("/app/"), ["/app/api", "/app/web"])
+        self.assertEqual(len(self.catalog.groups("/aws/lambda/f1")), 100)
+        self.assertEqual(self.catalog.groups("/nope"), [])
+        self.assertEqual(len(self.catalog.groups()), completion.MAX_CANDIDATES)
+        self.assertEqual(
+            self.catalog.streams("/app/api", "2024"),
+            ["2024/01/01/a", "2024/01/02/b"],
+        )
+        self.assertIsNotNone(self.catalog.listed_at("/app/api"))
+        self.assertIsNone(self.catalog.listed_at("/app/web"))
+        self.catalog.replace("s", "/app/api", ["y"])
+        self.assertEqual(self.catalog.streams("/app/api"), ["y"])
+        self.assertEqual(self.catalog.streams("/app/apiv2"), ["2024/01/01/z"])
+        self.assertEqual(completion.Catalog(self.dir + "/missing").groups(), [])
+
+    def test_complete(self):
+        self.assertEqual(self.complete("awslogs g"), ["get", "groups"])
+        self.assertEqual(self.complete("awslogs get /app/"), ["/app/api", "/app/web"])
+        self.assertEqual(
+            self.complete("awslogs get -s 1h --watch /app/api 2024/01/0"),
+            ["2024/01/01/a", "2024/01/02/b"],
+        )
+        self.assertEqual(
+            self.complete("awslogs get /app/api "),
+            ["ALL", "2024/01/01/a", "2024/01/02/b", "x"],
+        )
+        self.assertEqual(self.complete("awslogs get /app/api ALL "), [])
+        self.assertEqual(self.complete("awslogs archive /app/api ./out x"), ["x"])
+        self.assertEqual(
+            self.complete("awslogs streams /app/web -p=/x /app/a"), ["/app/api"]
+        )
+        self.assertEqual(self.complete("awslogs trace /app/a"), [])
+        self.assertEqual(
+            self.complete("awslogs trace req-1 /app/web /app/a"), ["/app/api"]
+        )
+        self.assertEqual(self.complete("awslogs get --"), [])
+        self.assertEqual(self.complete("awslogs groups /app"), [])
+
+    def test_complete_profiles(self):
+        config = os.path.join(self.dir, "config")
+        with open(config, "w") as f:
+            f.write("[default]\nregion=x\n[profile prod]\n[profile dev]\n")
+        with patch.dict(
+            os.environ,
+            {"AWS_CONFIG_FILE": config, "AWS_SHARED_CREDENTIALS_FILE": config + "x"},
+        ):
+            self.assertEqual(
+                self.complete("awslogs get --profile "), ["default", "dev", "prod"]
+            )
+        other = completion.Catalog(completion.catalog_path("prod", "eu-west-1"))
+        other.replace("g", None, ["/prod/api"])
+        self.assertEqual(
+            self.complete("awslogs get --profile prod,dev --aws-region=eu-west-1 /"),
+            ["/prod/api"],
+        )
+
+    @patch("awslogs.completion._refresh_in_background")
+    def test_stale_names_are_refreshed(self, refresh):
+        self.complete("awslogs get /app/", background=True)
+        refresh.assert_not_called()
+        self.complete("awslogs get /app/web ", background=True)
+        refresh.assert_called_once_with(ANY, None, None, "/app/web")
+        with patch("time.time", return_value=time.time() + completion.CATALOG_TTL + 1):
+            self.complete("awslogs get --profile p /app/", background=True)
+        refresh.assert_called_with(ANY, "p", None, None)
+
+    @patch("subprocess.Popen")
+    def test_refresh_in_background(self, popen):
+        completion._refresh_in_background(self.catalog, "p", None, "/app/web")
+        self.assertEqual(
+            popen.call_args[0][0][1:],
+            [
+                "-m",
+                "awslogs.completion",
+                "refresh",
+                "--profile",
+                "p",
+                "--group",
+                "/app/web",
+            ],
+        )
+        self.assertTrue(popen.call_args[1]["start_new_session"])
+        # Already running
+        completion._refresh_in_background(self.catalog, "p", None)
+        self.assertEqual(popen.call_count, 1)
+
+    @patch("awslogs.core.boto3_client")
+    def test_refresh(self, botoclient):
+        client = botoclient.return_value
+        paginators = {
+            "describe_log_groups": [{"logGroups": [{"logGroupName": "/new"}]}],
+            "describe_log_streams": [
+                {"logStreams": [{"logStreamName": "b"}, {"logStreamName": "a"}]}
+            ],
+        }
+        client.get_paginator.side_effect = lambda name: Mock(
+            paginate=Mock(return_value=paginators[name])
+        )
+        open(self.catalog.path + ".lock", "w").close()
+        completion.main(["awslogs-complete", "refresh"])
+        self.assertEqual(self.catalog.groups(), ["/new"])
+        self.assertEqual(
+            self.catalog.streams("/app/api"), ["2024/01/01/a", "2024/01/02/b", "x"]
+        )
+        self.assertFalse(os.path.exists(self.catalog.path + ".lock"))
+        completion.main(["awslogs-complete", "refresh", "--group", "/new"])
+        self.assertEqual(self.catalog.streams("/new"), ["a", "b"])
+        client.get_paginator.return_value.paginate.assert_not_called()
+
+    def test_flags_match_parser(self):
+        parser = build_parser()
+        commands = parser._subparsers._group_actions[0].choices
+        flags = set()
+        for command in commands.values():
+            for action in command._actions:
+                if action.option_strings and action.nargs == 0:
+                    flags.update(action.option_strings)
+        self.assertEqual(flags, completion.FLAGS)
+        self.assertEqual(sorted(commands), sorted(completion.COMMANDS))
+
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main(self, mock_stdout):
+        self.assertEqual(completion.main(["awslogs-complete", "bash"]), 0)
+        self.assertIn(
+            "complete -o default -F _awslogs_complete awslogs", mock_stdout.getvalue()
+        )
+        mock_stdout.truncate(0)
+        mock_stdout.seek(0)
+        code = completion.main(
+            ["awslogs-complete", "complete", "2", "awslogs", "get", "/app/w"]
+        )
+        self.assertEqual(code, 0)
+        self.assertEqual(mock_stdout.getvalue(), "/app/web\n")
+
+    def test_boto3_not_imported(self):
+        import subprocess
+
+        output = subprocess.check_output(
+            [
+                sys.executable,
+                "-c",
+                "import sys, awslogs.completion; print('boto3' in sys.modules)",
+            ]
+        )
+        self.assertEqual(output.strip(), b"False")
+
+
+def refreshable_credentials(access_key, expires_in, refreshed):
+    """Credentials expiring in ``expires_in`` seconds, refreshed to keys
+    taken from ``refreshed``."""
+
+    def metadata(access_key, expires_in):
+        expiry = datetime.fromtimestamp(time.time() + expires_in, tz=timezone.utc)
+        return {
+            "access_key": access_key,
+            "secret_key": "secret",
+            "token": "token",
+            "expiry_time": expiry.isoformat(),
+        }
+
+    return RefreshableCredentials.create_from_metadata(
+        metadata(access_key, expires_in),
+        lambda: metadata(next(refreshed), 3600),
+        "test",
+    )
+
+
+class TestCredentials(unittest.TestCase):
+    def test_refreshed_ahead_of_expiry(self):
+        closed = threading.Event()
+        stats = Stats()
+        credentials = refreshable_credentials("OLD", 14 * 60, iter(["NEW"]))
+        refresher = CredentialRefresher(credentials, closed, stats, interval=0.01)
+        try:
+            deadline = time.monotonic() + 5
+            while not stats.snapshot()[0].get("credential refreshes"):
+                self.assertLess(time.monotonic(), deadline)
+                time.sleep(0.01)
+        finally:
+            closed.set()
+        refresher.thread.join(1)
+        self.assertFalse(refresher.thread.is_alive())
+        self.assertEqual(credentials.get_frozen_credentials().access_key, "NEW")
+        # Requests themselves leave refreshing to the thread
+        self.assertFalse(
+            credentials.refresh_needed(credentials._advisory_refresh_timeout)
+        )
+
+    def test_static_credentials_left_alone(self):
+        closed = threading.Event()
+        refresher = CredentialRefresher(Mock(), closed)
+        self.assertIsNone(refresher.thread)
+
+    def test_expired_token_retried_with_new_credentials(self):
+        import boto3
+        from botocore.awsrequest import AWSResponse
+
+        class Raw(object):
+            def __init__(self, body):
+                self.body = body
+
+            def stream(self, **kwargs):
+                yield self.body
+
+        client = boto3.client(
+            "logs",
+            region_name="us-east-1",
+            aws_access_key_id="STATIC",
+            aws_secret_access_key="secret",
+        )
+        credentials = refreshable_credentials("OLD", 3600, iter(["NEW", "NEWER"]))
+        client._request_signer._credentials = credentials
+        signed_with = []
+
+        def send(request, **kwargs):
+            authorization = request.headers["Authorization"].decode("utf-8")
+            signed_with.append(re.search(r"Credential=(\w+)/", authorization).group(1))
+            if signed_with[-1] == "OLD":
+                body = b'{"__type": "ExpiredTokenException", "message": "expired"}'
+                return AWSResponse(request.url, 400, {}, Raw(body))
+            return AWSResponse(request.url, 200, {}, Raw(b'{"events": []}'))
+
+        client.meta.events.register("before-send", send)
+        stats = Stats()
+        retry_expired(client, stats)
+        self.assertEqual(client.filter_log_events(logGroupName="AAA")["events"], [])
+        self.assertEqual(signed_with, ["OLD", "NEW"])
+        self.assertEqual(stats.snapshot()[0]["credential refreshes"], 1)
+
+        # Static credentials can't be refreshed, the error goes through
+        client = boto3.client(
+            "logs",
+            region_name="us-east-1",
+            aws_access_key_id="OLD",
+            aws_secret_access_key="secret",
+        )
+        client.meta.events.register("before-send", send)
+        retry_expired(client)
+        with self.assertRaises(ClientError) as cm:
+            client.filter_log_events(logGroupName="AAA")
+        self.assertEqual(
+            cm.exception.response["Error"]["Code"], "ExpiredTokenException"
+        )
+
+
+class TestSQLiteSink(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "logs.db")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def rows(self, query="SELECT * FROM events ORDER BY timestamp, event_id"):
+        db = sqlite3.connect(self.path)
+        try:
+            return db.execute(query).fetchall()
+        finally:
+            db.close()
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main(self, mock_stdout, mock_stderr, botoclient):
+        events = [
+            log_event(
+                i,
+                i * 1000,
+                '{"level": "info", "n": %d}' % i,
+                ingestion_time=i * 1000 + 5,
+            )
+            for i in range(1, 8)
+        ]
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(events[:5])
+        argv = "awslogs get AAA -s 1/1/1970 -q n --sink sqlite:" + self.path
+        self.assertEqual(main(argv.split()), 0)
+        self.assertEqual(mock_stdout.getvalue(), "")
+        self.assertIn("Wrote 5 new events to " + self.path, mock_stderr.getvalue())
+        self.assertEqual(
+            self.rows()[0],
+            ("1", 1000, 1005, "AAA", "DDD", '{"level": "info", "n": 1}', "1"),
+        )
+        indexes = self.rows("SELECT name FROM sqlite_master WHERE type = 'index'")
+        self.assertIn(("events_group_timestamp",), indexes)
+        self.assertEqual(self.rows("PRAGMA journal_mode"), [("wal",)])
+
+        # Without --start only what's newer than the newest event stored is
+        # read again
+        client.filter_log_events.side_effect = fake_filter_log_events(events)
+        client.filter_log_events.reset_mock()
+        argv = "awslogs get AAA -q n --sink sqlite:" + self.path
+        self.assertEqual(main(argv.split()), 0)
+        self.assertEqual(
+            client.filter_log_events.call_args_list[0][1]["startTime"], 5000
+        )
+        self.assertIn("Wrote 2 new events", mock_stderr.getvalue())
+        self.assertEqual([row[0] for row in self.rows()], [str(i) for i in range(1, 8)])
+
+        # An explicit --start is read whole, rows already stored are skipped
+        client.filter_log_events.side_effect = fake_filter_log_events(events)
+        client.filter_log_events.reset_mock()
+        argv = "awslogs get AAA -s 1/1/1970 --sink sqlite:" + self.path
+        self.assertEqual(main(argv.split()), 0)
+        self.assertNotIn("startTime", client.filter_log_events.call_args_list[0][1])
+        self.assertIn("Wrote 0 new events", mock_stderr.getvalue())
+
+    def test_events_without_ids(self):
+        page = [
+            LogEvent(None, 1, 1, "AAA", "DDD", "same"),
+            LogEvent(None, 1, 1, "AAA", "DDD", "other"),
+            LogEvent(None, 1, 1, "AAA", "EEE", "same"),
+        ]
+        sink = SQLiteSink(self.path, transaction_rows=2)
+        sink.process(list(page))
+        sink.process(list(page))
+        sink.close()
+        self.assertEqual(sink.inserted, 3)
+        self.assertEqual(len(self.rows()), 3)
+
+    @patch("awslogs.core.open_sink")
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_watch_commits_when_idle(self, mock_stderr, botoclient, open_sink):
+        open_sink.side_effect = lambda spec, query: SQLiteSink(
+            self.path, query, commit_interval=0.2
+        )
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [log_event(1, 1000, "Hello")]
+        )
+        awslogs = AWSLogs(
+            log_group_name="AAA",
+            start="1/1/1970",
+            watch=True,
+            watch_interval=60,
+            sink="sqlite:" + self.path,
+            color="never",
+        )
+        thread = threading.Thread(target=awslogs.list_logs)
+        thread.start()
+        try:
+            deadline = time.time() + 5
+            # Read through another connection while the group is watched
+            while True:
+                try:
+                    if self.rows():
+                        break
+                except sqlite3.OperationalError:
+                    pass  # The table isn't created yet
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.05)
+            self.assertEqual(self.rows()[0][0], "1")
+            self.assertTrue(thread.is_alive())
+        finally:
+            awslogs.close()
+            thread.join()
+
+    def test_query_invalid_json(self):
+        import jmespath
+
+        sink = SQLiteSink(self.path, jmespath.compile("n"))
+        sink.process(
+            [
+                LogEvent("1", 1, 1, "AAA", "DDD", "{not json"),
+                LogEvent("2", 2, 2, "AAA", "DDD", '{"n": 2}'),
+            ]
+        )
+        sink.close()
+        self.assertEqual(
+            self.rows("SELECT message, query FROM events ORDER BY timestamp"),
+            [("{not json", None), ('{"n": 2}', "2")],
+        )
+
+    @patch("awslogs.core.boto3_client")
+    @patch("sys.stderr", new_callable=StringIO)
+    def test_unknown_sink(self, mock_stderr, botoclient):
+        self.assertEqual(main("awslogs get AAA --sink postgres:x".split()), 15)
+        code = main("awslogs get AAA --sink sqlite:x --split-by-stream y".split())
+        self.assertEqual(code, 9)
+
+
+class TestBatches(unittest.TestCase):
+    def events(self, *streams):
+        return [
+            LogEvent(str(i), i, i + 1, "AAA", stream, "message %d" % i)
+            for i, stream in enumerate(streams)
+        ]
+
+    def test_batches(self):
+        pages = [self.events("DDD", "EEE", "DDD"), self.events("FFF", "DDD")]
+        found = list(batches(pages, batch_size=2))
+        self.assertEqual([len(b) for b in found], [2, 2, 1])
+        first, second, third = found
+        self.assertEqual(first.timestamps, array("q", [0, 1]))
+        self.assertEqual(first.ingestion_times, array("q", [1, 2]))
+        self.assertEqual(first.group_codes, array("i", [0, 0]))
+        self.assertEqual(first.groups, ["AAA"])
+        self.assertEqual(first.stream_codes, array("i", [0, 1]))
+        self.assertEqual(first.streams, ["DDD", "EEE"])
+        # Codes keep their meaning from one batch to the next
+        self.assertEqual(second.stream_codes, array("i", [0, 2]))
+        self.assertEqual(third.stream_codes, array("i", [0]))
+        self.assertEqual(third.streams, ["DDD", "EEE", "FFF"])
+        self.assertEqual(third.messages, ["message 1"])
+
+        found = list(batches(pages, batch_size=10, flush_pages=True))
+        self.assertEqual([len(b) for b in found], [3, 2])
+        self.assertEqual(len(list(batches(pages, batch_size=10))), 1)
+
+    @patch("awslogs.core.boto3_client")
+    def test_iter_batches(self, botoclient):
+        client = botoclient.return_value
+        client.filter_log_events.side_effect = fake_filter_log_events(
+            [log_event(i, i, "m%d" % i) for i in range(7)]
+        )
+        logs = AWSLogs(log_group_name="AAA", start="1/1/1970")
+        found = list(logs.iter_batches(batch_size=4))
+        self.assertEqual([len(b) for b in found], [4, 3])
+        self.assertEqual(found[1].messages, ["m4", "m5", "m6"])
+
+    def test_conversions(self):
+        batch = next(batches([self.events("DDD", "EEE")]))
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if numpy is not None:
+            columns = batch.to_numpy()
+            self.assertEqual(columns["timestamp"].tolist(), [0, 1])
+            self.assertEqual(columns["stream"].tolist(), [0, 1])
+            batch.timestamps[0] = 5
+            self.assertEqual(columns["timestamp"][0], 5)
+        with patch.dict(sys.modules, {"numpy": None, "pyarrow": None}):
+            with self.assertRaises(ImportError) as cm:
+                batch.to_numpy()
+            self.assertIn("awslogs[numpy]", str(cm.exception))
+            with self.assertRaises(ImportError) as cm:
+                batch.to_arrow()
+            self.assertIn("awslogs[arrow]", str(cm.exception))
+
+    @unittest.skipUnless(
+        __import__("importlib").util.find_spec("pyarrow"), "pyarrow isn't installed"
+    )
+    def test_to_arrow(self):
+        batch = next(batches([self.events("DDD", "EEE", "DDD")]))
+        table = batch.to_arrow()
+        self.assertEqual(table.num_rows, 3)
+        self.assertEqual(table.column("stream").to_pylist(), ["DDD", "EEE", "DDD"])
+        self.assertEqual(table.column("message").to_pylist()[2], "message 2")
+
+
+class FakeCloudWatchLogs(ThreadingHTTPServer):
+    """A local stand-in for the CloudWatch Logs JSON API serving
+    ``events``, a dict of group names to (timestamp, stream, message)
+    tuples. Like CloudWatch, ``FilterLogEvents`` scans ``SCAN`` ms of the
+    window per request and returns a nextToken until it's done."""
+
+    SCAN = 3600 * 1000
+
+    def __init__(self, events):
+        self.events = events
+        self.requests = []
+        super().__init__(("127.0.0.1", 0), FakeCloudWatchLogsHandler)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{0}".format(self.server_address[1])
+
+    def describe_log_groups(self, request):
+        prefix = request.get("logGroupNamePrefix", "")
+        names = sorted(g for g in self.events if g.startswith(prefix))
+        return {"logGroups": [{"logGroupName": name} for name in names]}
+
+    def filter_log_events(self, request):
+        term = json.loads(request["filterPattern"])
+        start = int(request.get("nextToken") or request["startTime"])
+        end = min(start + self.SCAN, request["endTime"] + 1)
+        response = {
+            "events": [
+                log_event(
+                    "{0}-{1}".format(stream, timestamp), timestamp, message, stream
+                )
+                for timestamp, stream, message in self.events[request["logGroupName"]]
+                if start <= timestamp < end and term in message
+            ]
+        }
+        if end <= request["endTime"]:
+            response["nextToken"] = str(end)
+        return response
+
+
+class FakeCloudWatchLogsHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        action = self.headers["X-Amz-Target"].split(".")[-1]
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((action, request))
+        method = re.sub(r"(?<!^)([A-Z])", r"_\1", action).lower()
+        body = json.dumps(getattr(self.server, method)(request)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-amz-json-1.1")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTrace(unittest.TestCase):
+    DAY = 24 * 3600 * 1000
+    # 2024-01-01T05:00:00Z
+    FIRST = 1704085200000
+
+    def setUp(self):
+        first = self.FIRST
+        self.server = FakeCloudWatchLogs(
+            {
+                "/app/gateway": [
+                    (first - 3600 * 1000, "gw", "req-41 GET /orders"),
+                    (first, "gw", "req-42 GET /orders"),
+                ],
+                "/app/lambda": [
+                    (first + 100, "fn", "START RequestId: req-42"),
+                    (first + 300, "fn", "END RequestId: req-42"),
+                    # Far from the others, the id being reused by a client
+                    (first + 15 * 3600 * 1000, "fn", "START RequestId: req-42"),
+                ],
+                "/app/ecs": [(first + 200, "task", "req-42 order stored")],
+                "/app/quiet": [],
+                "/other/x": [(first, "x", "req-42")],
+            }
+        )
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def trace(self, *args):
+        argv = [
+            "awslogs",
+            "trace",
+            "--aws-endpoint-url",
+            self.server.url,
+            "--aws-access-key-id",
+            "id",
+            "--aws-secret-access-key",
+            "secret",
+            "--aws-region",
+            "us-east-1",
+            "--color",
+            "never",
+            "-s",
+            "2024-01-01T00:00:00Z",
+            "-e",
+            "2024-01-02T00:00:00Z",
+        ]
+        with patch("sys.stdout", new_callable=StringIO) as stdout, patch(
+            "sys.stderr", new_callable=StringIO
+        ) as stderr:
+            code = main(argv + list(args))
+        return code, stdout.getvalue(), stderr.getvalue()
+
+    def test_trace(self):
+        code, output, errors = self.trace("req-42", "-p", "/app/")
+        self.assertEqual(code, 0)
+        self.assertEqual(
+            output,
+            "/app/gateway gw   2024-01-01T05:00:00.000Z req-42 GET /orders\n"
+            "/app/lambda  fn   2024-01-01T05:00:00.100Z START RequestId: req-42\n"
+            "/app/ecs     task 2024-01-01T05:00:00.200Z req-42 order stored\n"
+            "/app/lambda  fn   2024-01-01T05:00:00.300Z END RequestId: req-42\n",
+        )
+        self.assertIn("Found 4 events in 3 of 4 groups", errors)
+
+        searches = [r for a, r in self.server.requests if a == "FilterLogEvents"]
+        self.assertTrue(all(r["filterPattern"] == '"req-42"' for r in searches))
+        # Scanning the whole day takes 24 requests per group, every group
+        # stopped soon after the first hit narrowed the window
+        for group in ("/app/gateway", "/app/lambda", "/app/ecs", "/app/quiet"):
+            requests = [r for r in searches if r["logGroupName"] == group]
+            self.assertLess(len(requests), 10, group)
+            # Around whichever event was found first
+            narrowed = requests[-1]["startTime"] + 10 * 60 * 1000
+            self.assertIn(narrowed, (self.FIRST, self.FIRST + 100, self.FIRST + 200))
+
+    def test_trace_named_groups(self):
+        code, output, errors = self.trace("req-41", "/app/gateway", "/app/ecs")
+        self.assertEqual(code, 0)
+        self.assertEqual(
+            output, "/app/gateway gw 2024-01-01T04:00:00.000Z req-41 GET /orders\n"
+        )
+        self.assertIn("Found 1 events in 1 of 2 groups", errors)
+
+    def test_window(self):
+        window = TraceWindow(0, 100000, 1000)
+        self.assertTrue(window.hit(5000))
+        self.assertFalse(window.hit(50000))
+        self.assertEqual(window.bounds(), (4000, 6000))
+        self.assertIn(6000, window)
+        self.assertNotIn(50000, window)
+        self.assertEqual(trace_pattern('a"b'), '"a\\"b"')